@@ -0,0 +1,117 @@
+import logging
+import random
+import re
+import sys
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from . import instrumentation, metrics
+from .instrumentation import recording
+
+logger = logging.getLogger(__name__)
+
+STACK_LIMIT = 5  # Кадров кода приложения в записи журнала
+_IN_LIST = re.compile(r"\((?:\s*%s\s*,)+\s*%s\s*\)")
+_LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_INSTRUMENTATION_FILES = {__file__, instrumentation.__file__, metrics.__file__}  # Не попадают в стек вызова
+
+
+def fingerprint(sql):
+    """Структура запроса: списки IN любой длины и литералы заменяются заполнителями"""
+    return _LITERAL.sub("?", _IN_LIST.sub("(...)", sql))
+
+
+def application_stack(limit=STACK_LIMIT):
+    """Кадры кода проекта от места вызова запроса наружу, без Django, библиотек и модулей инструментирования"""
+    base = str(settings.BASE_DIR)
+    stack = []
+    frame = sys._getframe(1)
+    while frame is not None and len(stack) < limit:
+        filename = frame.f_code.co_filename
+        if filename.startswith(base) and "site-packages" not in filename and filename not in _INSTRUMENTATION_FILES:
+            stack.append(f"{filename[len(base) + 1:]}:{frame.f_lineno} in {frame.f_code.co_name}")
+        frame = frame.f_back
+    return stack
+
+
+class QueryInspector:
+    """Сбор SQL-запросов через execute_wrapper. Стек снимается только при первом появлении текста запроса
+    и для медленных запросов, структура запросов вычисляется один раз при разборе"""
+
+    def __init__(self, slow_ms):
+        self.slow_ms = slow_ms
+        self.statements = {}  # {текст запроса: [количество, стек первого вызова]}
+        self.slow = []  # [(текст запроса, мс, стек)]
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = (time.perf_counter() - started) * 1000
+            statement = self.statements.get(sql)
+            if statement is None:
+                self.statements[sql] = [1, application_stack()]
+            else:
+                statement[0] += 1
+            if elapsed >= self.slow_ms:
+                self.slow.append((sql, elapsed, application_stack()))
+
+    def repeated(self, threshold):
+        """Запросы одной структуры, выполненные не меньше threshold раз: [(структура, количество, стек)]"""
+        groups = {}
+        for sql, (count, stack) in self.statements.items():
+            group = groups.setdefault(fingerprint(sql), [0, stack])
+            group[0] += count
+        return [(sql, count, stack) for sql, (count, stack) in groups.items() if count >= threshold]
+
+
+def _format_stack(stack):
+    return "\n".join(f"    {frame}" for frame in stack) or "    (вызов вне кода приложения)"
+
+
+class QueryDiagnosticsMiddleware:
+    """Поиск N+1 и медленных SQL-запросов в доле QUERY_DIAGNOSTICS_SAMPLE_RATE запросов.
+    Найденные запросы с местом вызова в коде пишутся в журнал config.diagnostics"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.QUERY_DIAGNOSTICS_SAMPLE_RATE:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if random.random() >= settings.QUERY_DIAGNOSTICS_SAMPLE_RATE:
+            return self.get_response(request)
+        with recording(QueryInspector(settings.QUERY_DIAGNOSTICS_SLOW_MS)) as inspector:
+            response = self.get_response(request)
+        self.report(request, inspector)
+        return response
+
+    async def __acall__(self, request):
+        if random.random() >= settings.QUERY_DIAGNOSTICS_SAMPLE_RATE:
+            return await self.get_response(request)
+        with recording(QueryInspector(settings.QUERY_DIAGNOSTICS_SLOW_MS)) as inspector:
+            response = await self.get_response(request)
+        self.report(request, inspector)
+        return response
+
+    @staticmethod
+    def report(request, inspector):
+        match = request.resolver_match
+        view = match.view_name if match else request.path
+        for sql, count, stack in inspector.repeated(settings.QUERY_DIAGNOSTICS_REPEAT_THRESHOLD):
+            logger.warning("N+1 в %s %s: %s раз\n  %s\n%s", request.method, view, count, sql, _format_stack(stack))
+        for sql, elapsed, stack in inspector.slow:
+            logger.warning(
+                "Медленный запрос в %s %s: %.1f мс\n  %s\n%s", request.method, view, elapsed, sql, _format_stack(stack)
+            )
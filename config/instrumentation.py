@@ -0,0 +1,41 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import partial
+
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+# Обработчики SQL текущего запроса. Контекст переходит в потоки sync_to_async, поэтому запросы асинхронных
+# представлений, выполняемые в потоке ORM, попадают к обработчикам без установки обертки в этом потоке
+_recorders = ContextVar("query_recorders", default=())
+
+
+def _execute(execute, sql, params, many, context):
+    for recorder in _recorders.get():
+        execute = partial(recorder, execute)
+    return execute(sql, params, many, context)
+
+
+def _install(connection):
+    # Подключение может открыться внутри чужого блока connection.execute_wrapper, который при выходе снимает
+    # последнюю обертку списка. Поэтому обертка ставится в начало и никогда не оказывается последней
+    if _execute not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, _execute)
+
+
+@receiver(connection_created)
+def connection_opened(sender, connection, **kwargs):
+    _install(connection)
+
+
+@contextmanager
+def recording(recorder):
+    """Передача SQL-запросов текущего запроса (во всех подключениях) в обработчик вида execute_wrapper"""
+    for connection in connections.all(initialized_only=True):
+        _install(connection)  # Подключения, открытые до загрузки модуля
+    token = _recorders.set((*_recorders.get(), recorder))
+    try:
+        yield recorder
+    finally:
+        _recorders.reset(token)
@@ -0,0 +1,218 @@
+import atexit
+import hmac
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+from contextlib import suppress
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import Http404, HttpResponse
+
+from .instrumentation import recording
+
+logger = logging.getLogger(__name__)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)  # Границы гистограммы, секунды
+METRICS_VIEW_NAME = "metrics"  # Запросы к самим метрикам не учитываются
+
+
+class MetricsStore:
+    """Агрегаты запросов процесса по (view, method, status): количество, сумма и гистограмма задержки,
+    число SQL-запросов и их время. Если задан каталог, процесс периодически сохраняет свои агрегаты
+    в отдельный файл, а collect складывает файлы всех процессов"""
+
+    def __init__(self, directory=None, flush_interval=1.0):
+        self.directory = Path(directory) if directory else None
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.pid = os.getpid()
+        self.series = {}
+        self.flushed_at = time.monotonic()
+
+    @staticmethod
+    def empty_row():
+        return [0, 0.0, [0] * (len(LATENCY_BUCKETS) + 1), 0, 0.0]
+
+    def record(self, key, duration, queries, sql_duration):
+        bucket = bisect_left(LATENCY_BUCKETS, duration)
+        with self.lock:
+            if os.getpid() != self.pid:
+                self.reset()  # Процесс-потомок после fork не наследует агрегаты родителя
+            row = self.series.get(key)
+            if row is None:
+                row = self.series[key] = self.empty_row()
+            row[0] += 1
+            row[1] += duration
+            row[2][bucket] += 1
+            row[3] += queries
+            row[4] += sql_duration
+            flush = self.directory is not None and time.monotonic() - self.flushed_at >= self.flush_interval
+            if flush:
+                self.flushed_at = time.monotonic()  # Запись выполняет только поток, заметивший срок первым
+        if flush:
+            self.flush()
+
+    def rows(self):
+        with self.lock:
+            return [
+                [*key, count, total, list(buckets), queries, sql]
+                for key, (count, total, buckets, queries, sql) in self.series.items()
+            ]
+
+    def flush(self):
+        """Атомарная запись агрегатов процесса в его файл через отдельный временный файл.
+        Ошибка записи только пишется в журнал: метрики не должны ломать запрос"""
+        with self.lock:
+            self.flushed_at = time.monotonic()
+        rows = self.rows()
+        temporary = None
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            with tempfile.NamedTemporaryFile(
+                "w", dir=self.directory, prefix=f"metrics-{os.getpid()}-", suffix=".tmp", delete=False
+            ) as file:
+                temporary = file.name
+                json.dump(rows, file)
+            os.replace(temporary, self.directory / f"metrics-{os.getpid()}.json")
+        except OSError:
+            logger.warning("Не удалось сохранить метрики в %s", self.directory, exc_info=True)
+            if temporary is not None:
+                with suppress(OSError):
+                    os.remove(temporary)
+
+    def collect(self):
+        """Агрегаты всех процессов. Файлы завершившихся процессов остаются, чтобы счетчики не уменьшались"""
+        if self.directory is None:
+            rows = self.rows()
+        else:
+            self.flush()
+            rows = []
+            for path in self.directory.glob("metrics-*.json"):
+                try:
+                    rows += json.loads(path.read_text())
+                except (OSError, ValueError):
+                    continue
+        totals = {}
+        for view, method, status, count, total, buckets, queries, sql in rows:
+            row = totals.setdefault((view, method, status), self.empty_row())
+            row[0] += count
+            row[1] += total
+            row[2] = [left + right for left, right in zip(row[2], buckets)]
+            row[3] += queries
+            row[4] += sql
+        return totals
+
+
+def _labels(view, method, status, **extra):
+    values = {"view": view, "method": method, "status": status, **extra}
+    escape = str.maketrans({"\\": "\\\\", '"': '\\"', "\n": "\\n"})
+    return ",".join(f'{name}="{str(value).translate(escape)}"' for name, value in values.items())
+
+
+def render_metrics(totals):
+    """Агрегаты в текстовом формате Prometheus"""
+    series = sorted(totals.items())
+    lines = [
+        "# HELP django_http_requests_total Количество запросов",
+        "# TYPE django_http_requests_total counter",
+    ]
+    lines += [f"django_http_requests_total{{{_labels(*key)}}} {row[0]}" for key, row in series]
+    lines += [
+        "# HELP django_http_request_duration_seconds Время обработки запроса",
+        "# TYPE django_http_request_duration_seconds histogram",
+    ]
+    for key, (count, total, buckets, _, _) in series:
+        cumulative = 0
+        for bound, observed in zip((*LATENCY_BUCKETS, "+Inf"), buckets):
+            cumulative += observed
+            lines.append(f"django_http_request_duration_seconds_bucket{{{_labels(*key, le=bound)}}} {cumulative}")
+        lines.append(f"django_http_request_duration_seconds_sum{{{_labels(*key)}}} {total}")
+        lines.append(f"django_http_request_duration_seconds_count{{{_labels(*key)}}} {count}")
+    lines += [
+        "# HELP django_db_queries_total Количество SQL-запросов",
+        "# TYPE django_db_queries_total counter",
+    ]
+    lines += [f"django_db_queries_total{{{_labels(*key)}}} {row[3]}" for key, row in series]
+    lines += [
+        "# HELP django_db_query_duration_seconds_total Время выполнения SQL-запросов",
+        "# TYPE django_db_query_duration_seconds_total counter",
+    ]
+    lines += [f"django_db_query_duration_seconds_total{{{_labels(*key)}}} {row[4]}" for key, row in series]
+    return "\n".join(lines) + "\n"
+
+
+store = MetricsStore(settings.METRICS_DIR, settings.METRICS_FLUSH_INTERVAL)
+if store.directory is not None:
+    atexit.register(store.flush)
+
+
+class QueryRecorder:
+    """Счетчик и время SQL-запросов, работает и при DEBUG=False"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - started
+
+
+class MetricsMiddleware:
+    """Учет количества, задержки и SQL-запросов по представлениям. Включается настройкой METRICS_ENABLED"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        started = time.perf_counter()
+        with recording(QueryRecorder()) as recorder:
+            response = self.get_response(request)
+        self.record(request, response, time.perf_counter() - started, recorder)
+        return response
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        with recording(QueryRecorder()) as recorder:
+            response = await self.get_response(request)
+        self.record(request, response, time.perf_counter() - started, recorder)
+        return response
+
+    @staticmethod
+    def record(request, response, duration, recorder):
+        match = request.resolver_match
+        view = match.view_name if match else "unmatched"
+        if view != METRICS_VIEW_NAME:
+            store.record((view, request.method, response.status_code), duration, recorder.count, recorder.duration)
+
+
+def metrics_view(request):
+    """Метрики в формате Prometheus. Доступны только при METRICS_ENABLED и с заголовком
+    Authorization: Bearer <METRICS_TOKEN>. Адрес клиента не проверяется: за обратным прокси он всегда локальный"""
+    token = settings.METRICS_TOKEN
+    authorization = request.META.get("HTTP_AUTHORIZATION", "")
+    if not settings.METRICS_ENABLED or not token or not hmac.compare_digest(authorization, f"Bearer {token}"):
+        raise Http404
+    return HttpResponse(render_metrics(store.collect()), content_type="text/plain; version=0.0.4; charset=utf-8")
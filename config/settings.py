@@ -34,6 +34,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "config.metrics.MetricsMiddleware",
+    "config.diagnostics.QueryDiagnosticsMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
@@ -77,6 +79,71 @@ DATABASES = {
 }
 
 
+# Кэш: по умолчанию в памяти процесса, для нескольких процессов нужен общий бэкенд (Redis, Memcached, файловый)
+CACHES = {
+    "default": {
+        "BACKEND": os.getenv("CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": os.getenv("CACHE_LOCATION", ""),
+    }
+}
+
+# Версии данных хранятся в кэше, и в кэше процесса смена версии не видна другим процессам. Поэтому с LocMemCache
+# ETag, кэш ответов, ключей ответов и рейтингов отключены, если не указано, что приложение работает в одном процессе
+CACHE_SINGLE_PROCESS = True if os.getenv("CACHE_SINGLE_PROCESS") == "True" else False
+
+# Время хранения ролей пользователя в общем кэше (0 - роли загружаются заново в каждом запросе)
+ROLES_CACHE_TIMEOUT = int(os.getenv("ROLES_CACHE_TIMEOUT", 0))
+
+# Время хранения ответов на чтение курсов, уроков и тестов (0 - только ETag/Last-Modified без кэша ответов)
+RESPONSE_CACHE_TIMEOUT = int(os.getenv("RESPONSE_CACHE_TIMEOUT", 300))
+
+# Асинхронная проверка тестов: результат сохраняется как ожидающий и оценивается командой grade_results.
+# Команда работает в отдельном процессе, поэтому требует общего кэша (CACHE_BACKEND не LocMemCache)
+GRADING_ASYNC = True if os.getenv("GRADING_ASYNC") == "True" else False
+
+# Пересчет баллов сохраненных результатов сразу после изменения правильных ответов теста. Пересчет выполняется
+# синхронно в процессе запроса преподавателя и для тестов с большим числом результатов занимает долго, поэтому
+# по умолчанию выключен: после изменения правильных ответов запускайте команду regrade_results
+REGRADE_ON_CHANGE = True if os.getenv("REGRADE_ON_CHANGE") == "True" else False
+
+# Тест считается сданным, если лучший балл не меньше этой доли от числа вопросов
+PASS_SCORE_RATIO = float(os.getenv("PASS_SCORE_RATIO", 0.5))
+
+# Метрики запросов по представлениям (количество, задержка, SQL) на внутреннем маршруте /internal/metrics/,
+# который отвечает только на запросы с заголовком Authorization: Bearer <METRICS_TOKEN>.
+# Каталог METRICS_DIR нужен при нескольких процессах: каждый процесс сохраняет туда свои агрегаты
+METRICS_ENABLED = True if os.getenv("METRICS_ENABLED") == "True" else False
+METRICS_DIR = os.getenv("METRICS_DIR", "")
+METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", 1.0))
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+# Диагностика SQL для доли запросов (0 - выключена): запросы одной структуры, повторенные в запросе
+# не меньше QUERY_DIAGNOSTICS_REPEAT_THRESHOLD раз (N+1), и запросы дольше QUERY_DIAGNOSTICS_SLOW_MS
+# пишутся с местом вызова в коде в журнал QUERY_DIAGNOSTICS_LOG
+QUERY_DIAGNOSTICS_SAMPLE_RATE = float(os.getenv("QUERY_DIAGNOSTICS_SAMPLE_RATE", 0))
+QUERY_DIAGNOSTICS_REPEAT_THRESHOLD = int(os.getenv("QUERY_DIAGNOSTICS_REPEAT_THRESHOLD", 5))
+QUERY_DIAGNOSTICS_SLOW_MS = float(os.getenv("QUERY_DIAGNOSTICS_SLOW_MS", 100))
+QUERY_DIAGNOSTICS_LOG = os.getenv("QUERY_DIAGNOSTICS_LOG", str(BASE_DIR / "query_diagnostics.log"))
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {
+        "query_diagnostics": {
+            "class": "logging.handlers.RotatingFileHandler",
+            "filename": QUERY_DIAGNOSTICS_LOG,
+            "maxBytes": 10 * 1024 * 1024,
+            "backupCount": 5,
+            "encoding": "utf-8",
+            "delay": True,  # Файл создается при первой записи
+        },
+    },
+    "loggers": {
+        "config.diagnostics": {"handlers": ["query_diagnostics"], "level": "WARNING", "propagate": False},
+    },
+}
+
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         "NAME": "django.contrib.auth.password_validation.UserAttributeSimilarityValidator",
@@ -119,7 +186,7 @@ AUTH_USER_MODEL = "users.User"
 # Настройки DRF
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": [
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "users.authentication.RoleJWTAuthentication",
     ],
     "DEFAULT_PERMISSION_CLASSES": [
         "rest_framework.permissions.IsAuthenticated",
@@ -131,8 +198,15 @@ SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(hours=1),  # Токен доступа живет 1 час
     "REFRESH_TOKEN_LIFETIME": timedelta(days=5),  # Токен обновления живет 5 дней
     "AUTH_HEADER_TYPES": ("Bearer",),
+    # Роли пользователя передаются в access-токене и обновляются при обновлении токена
+    "TOKEN_OBTAIN_SERIALIZER": "users.serializers.RoleTokenObtainPairSerializer",
+    "TOKEN_REFRESH_SERIALIZER": "users.serializers.RoleTokenRefreshSerializer",
 }
 
+# Пользователь строится по claims токена и загружается из базы только при обращении к другим полям.
+# Блокировка пользователя в этом режиме вступает в силу после истечения access-токена
+JWT_STATELESS_USER = True if os.getenv("JWT_STATELESS_USER") == "True" else False
+
 
 CORS_ALLOWED_ORIGINS = [
     "http://127.0.0.1:8000",
@@ -0,0 +1,36 @@
+from django.contrib.postgres.operations import AddIndexConcurrently, TrigramExtension
+
+# Расширение pg_trgm входит в contrib PostgreSQL и есть не на каждом сервере. Без него миграции проходят,
+# триграммные индексы не создаются, а поиск по подстроке в админке выполняется полным просмотром таблицы
+
+
+def trigram_available(connection):
+    """Расширение pg_trgm можно установить на сервере базы"""
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+        return cursor.fetchone() is not None
+
+
+def trigram_installed(connection):
+    """Расширение pg_trgm установлено в базе"""
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+        return cursor.fetchone() is not None
+
+
+class OptionalTrigramExtension(TrigramExtension):
+    """Установка pg_trgm, если расширение доступно на сервере"""
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor != "postgresql" or not trigram_available(schema_editor.connection):
+            return
+        super().database_forwards(app_label, schema_editor, from_state, to_state)
+
+
+class AddTrigramIndexConcurrently(AddIndexConcurrently):
+    """Создание триграммного индекса без блокировки записи, если расширение pg_trgm установлено"""
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor != "postgresql" or not trigram_installed(schema_editor.connection):
+            return
+        super().database_forwards(app_label, schema_editor, from_state, to_state)
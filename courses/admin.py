@@ -1,4 +1,8 @@
 from django.contrib import admin
+from django.db.models import Q
+from django.utils.text import smart_split, unescape_string_literal
+
+from users.models import User
 
 from .models import Answer, Course, Lesson, Question, Test, TestResult
 
@@ -60,6 +64,18 @@ class AnswerAdmin(admin.ModelAdmin):
 
 @admin.register(TestResult)
 class TestResultAdmin(admin.ModelAdmin):
-    list_display = ("test", "student", "score", "completed_at")
-    list_filter = ("test", "student")
+    list_display = ("test", "student", "score", "status", "completed_at")
+    list_filter = ("test", "student", "status")
     search_fields = ("student__email", "test__title")
+    list_select_related = ("test", "student")  # Тест и студент в списке загружаются одним запросом
+
+    def get_search_results(self, request, queryset, search_term):
+        """Поиск по email студента и названию теста через подзапросы к их таблицам. Стандартный поиск проверяет
+        OR по двум присоединенным таблицам после соединения и не может использовать триграммные индексы"""
+        for term in smart_split(search_term):
+            if term.startswith(('"', "'")) and term[0] == term[-1]:
+                term = unescape_string_literal(term)
+            students = User.objects.filter(email__icontains=term).values("pk")
+            tests = Test.objects.filter(title__icontains=term).values("pk")
+            queryset = queryset.filter(Q(student__in=students) | Q(test__in=tests))
+        return queryset, False
@@ -0,0 +1,143 @@
+import numpy as np
+from django.core.cache import cache
+
+from .grading import get_answer_key
+from .models import TestResult
+from .versions import get_versions, versions_shared
+
+ANALYSIS_TIMEOUT = 60 * 60 * 24  # Анализ хранится в кэше сутки, версии теста и результатов меняют ключ
+ANALYSIS_CHUNK_SIZE = 5000  # Количество результатов, читаемых из базы за раз
+DISCRIMINATION_GROUP = 0.27  # Доля лучших и худших результатов для индекса дискриминативности
+
+
+def answer_columns(answer_key):
+    """Столбцы матрицы выбора: варианты ответов по порядку вопросов. Возвращает id вопросов,
+    id ответов, признак правильности и индекс вопроса для каждого столбца"""
+    question_ids = sorted(answer_key.options)
+    answers = [
+        (index, answer_id, answer_id in answer_key.correct[question_id])
+        for index, question_id in enumerate(question_ids)
+        for answer_id in sorted(answer_key.options[question_id])
+    ]
+    question_index, answer_ids, is_correct = zip(*answers) if answers else ((), (), ())
+    return (
+        question_ids,
+        np.array(answer_ids, dtype=np.int64),
+        np.array(is_correct, dtype=bool),
+        np.array(question_index, dtype=np.int64),
+    )
+
+
+def unpack_rows(packed):
+    """Векторная распаковка списка значений pack_ids: id ответов и номер строки для каждого id.
+    Байты всех строк склеиваются в один массив, varint и разности декодируются в NumPy без цикла по строкам"""
+    lengths = np.fromiter(map(len, packed), dtype=np.int64, count=len(packed))
+    data = np.frombuffer(b"".join(packed), dtype=np.uint8)
+    if not len(data):
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+    ends = (data & 0x80) == 0  # Последний байт каждого числа
+    starts = np.flatnonzero(np.concatenate(([True], ends[:-1])))
+    value_index = np.concatenate(([0], np.cumsum(ends[:-1])))
+    shifts = 7 * (np.arange(len(data)) - starts[value_index])
+    deltas = np.add.reduceat((data & 0x7F).astype(np.int64) << shifts, starts)
+
+    # Разности накапливаются по всем строкам сразу, затем из каждой строки вычитается сумма предыдущих строк
+    rows = np.repeat(np.arange(len(packed)), lengths)[ends]
+    totals = np.cumsum(deltas)
+    row_starts = np.concatenate(([0], np.cumsum(np.bincount(rows, minlength=len(packed)))[:-1]))
+    ids = totals - np.concatenate(([0], totals))[row_starts][rows]
+    return ids, rows
+
+
+def load_selections(test_id, answer_ids, chunk_size=ANALYSIS_CHUNK_SIZE):
+    """Матрица выбора ответов (результаты × варианты) по проверенным результатам теста.
+    Из базы читаются только упакованные ответы, распаковка и раскладка по столбцам выполняются в NumPy"""
+    packed = list(
+        TestResult.objects.filter(test_id=test_id, status=TestResult.STATUS_GRADED, answers_packed__isnull=False)
+        .order_by()
+        .values_list("answers_packed", flat=True)
+        .iterator(chunk_size=chunk_size)
+    )
+    chosen, rows = unpack_rows(packed)
+
+    selection = np.zeros((len(packed), len(answer_ids)), dtype=bool)
+    if not len(chosen) or not len(answer_ids):
+        return selection
+
+    order = np.argsort(answer_ids)
+    positions = np.searchsorted(answer_ids, chosen, sorter=order).clip(max=len(answer_ids) - 1)
+    columns = order[positions]
+    known = answer_ids[columns] == chosen  # Ответы, удаленные из теста, не учитываются
+    selection[rows[known], columns[known]] = True
+    return selection
+
+
+def item_statistics(selection, is_correct, question_index, question_count):
+    """Векторный расчет показателей вопросов по матрице выбора.
+    Вопрос решен, если выбор совпал с правильными ответами во всех его вариантах"""
+    students = selection.shape[0]
+    membership = np.zeros((len(question_index), question_count), dtype=np.int32)  # Вариант × вопрос
+    membership[np.arange(len(question_index)), question_index] = 1
+    mismatches = (selection != is_correct).astype(np.int32) @ membership
+    solved = mismatches == 0  # Матрица правильности: результаты × вопросы
+
+    difficulty = solved.mean(axis=0) if students else np.full(question_count, np.nan)
+
+    # Индекс дискриминативности: доля решивших среди лучших 27% минус доля среди худших 27%
+    group = max(1, int(round(students * DISCRIMINATION_GROUP))) if students else 0
+    if group:
+        ranking = np.argsort(solved.sum(axis=1), kind="stable")
+        discrimination = solved[ranking[-group:]].mean(axis=0) - solved[ranking[:group]].mean(axis=0)
+    else:
+        discrimination = np.full(question_count, np.nan)
+
+    selection_rate = selection.mean(axis=0) if students else np.full(selection.shape[1], np.nan)
+    return difficulty, discrimination, selection_rate
+
+
+def _number(value):
+    """Число для JSON: NaN (нет результатов) превращается в None"""
+    return None if np.isnan(value) else round(float(value), 4)
+
+
+def analyze_test(test_id):
+    """Анализ вопросов теста: трудность (доля решивших), дискриминативность и частота выбора вариантов"""
+    answer_key = get_answer_key(test_id)
+    question_ids, answer_ids, is_correct, question_index = answer_columns(answer_key)
+    selection = load_selections(test_id, answer_ids)
+    difficulty, discrimination, selection_rate = item_statistics(
+        selection, is_correct, question_index, len(question_ids)
+    )
+
+    questions = [
+        {
+            "id": question_id,
+            "difficulty": _number(difficulty[index]),
+            "discrimination": _number(discrimination[index]),
+            "answers": [],
+        }
+        for index, question_id in enumerate(question_ids)
+    ]
+    for column, answer_id in enumerate(answer_ids.tolist()):
+        questions[question_index[column]]["answers"].append(
+            {
+                "id": answer_id,
+                "is_correct": bool(is_correct[column]),
+                "selection_rate": _number(selection_rate[column]),
+            }
+        )
+    return {"test": test_id, "results": selection.shape[0], "questions": questions}
+
+
+def get_test_analysis(test_id):
+    """Анализ вопросов теста из кэша текущих версий содержимого теста и его результатов"""
+    if not versions_shared():
+        return analyze_test(test_id)
+    versions = get_versions(("test_content", test_id), ("test_results", test_id))
+    cache_key = f"item_analysis:{test_id}:" + ":".join(str(version) for version in versions)
+    analysis = cache.get(cache_key)
+    if analysis is None:
+        analysis = analyze_test(test_id)
+        cache.set(cache_key, analysis, ANALYSIS_TIMEOUT)
+    return analysis
@@ -0,0 +1,83 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+from rest_framework.response import Response
+
+from users.roles import aget_user_roles, get_user_roles
+
+from .versions import aget_versions, get_versions, versions_shared
+
+
+class ConditionalCacheMixin:
+    """Условные GET-запросы (ETag/Last-Modified) и серверный кэш ответов.
+    Ответ зависит от версии объекта (или коллекции для списков), версий зависимых коллекций и ролей пользователя.
+    Без общего для процессов кэша версий (см. versions_shared) ответ отдается без ETag и кэша"""
+
+    cache_scope = None  # Namespace версий основной модели
+    cache_dependencies = ()  # Коллекции, данные которых попадают в ответ
+
+    def get_cache_scopes(self):
+        scopes = [(self.cache_scope, self.kwargs.get(self.lookup_url_kwarg or self.lookup_field))]
+        return scopes + [(namespace, None) for namespace in self.cache_dependencies]
+
+    def get_cache_versions(self):
+        return get_versions(*self.get_cache_scopes())
+
+    def get_cache_signature(self, request, versions, roles):
+        """ETag, Last-Modified и ключ кэша ответа"""
+        signature = f"{self.__class__.__name__}|{request.build_absolute_uri()}|{','.join(sorted(roles))}|{versions}"
+        digest = hashlib.md5(signature.encode()).hexdigest()
+        return quote_etag(digest), max(versions) // 10**9, f"response:{digest}"
+
+    def finalize_cached_response(self, response, etag, last_modified):
+        response["ETag"] = etag
+        response["Last-Modified"] = http_date(last_modified)
+        patch_cache_control(response, private=True, no_cache=True)  # Клиент обязан перепроверять ответ
+        patch_vary_headers(response, ("Authorization",))
+        return response
+
+    def get(self, request, *args, **kwargs):
+        if not versions_shared():
+            return super().get(request, *args, **kwargs)
+        versions = self.get_cache_versions()
+        etag, last_modified, cache_key = self.get_cache_signature(request, versions, get_user_roles(request.user))
+
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            data = cache.get(cache_key) if settings.RESPONSE_CACHE_TIMEOUT else None
+            if data is None:
+                response = super().get(request, *args, **kwargs)
+                if response.status_code == 200 and settings.RESPONSE_CACHE_TIMEOUT:
+                    cache.set(cache_key, response.data, settings.RESPONSE_CACHE_TIMEOUT)
+            else:
+                response = Response(data)
+        return self.finalize_cached_response(response, etag, last_modified)
+
+
+class AsyncConditionalCacheMixin(ConditionalCacheMixin):
+    """ConditionalCacheMixin для асинхронных представлений: версии и готовые ответы читаются
+    асинхронными методами кэша"""
+
+    async def aget_cache_versions(self):
+        return await aget_versions(*self.get_cache_scopes())
+
+    async def get(self, request, *args, **kwargs):
+        if not versions_shared():
+            return await super(ConditionalCacheMixin, self).get(request, *args, **kwargs)
+        versions = await self.aget_cache_versions()
+        roles = await aget_user_roles(request.user)
+        etag, last_modified, cache_key = self.get_cache_signature(request, versions, roles)
+
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            data = await cache.aget(cache_key) if settings.RESPONSE_CACHE_TIMEOUT else None
+            if data is None:
+                response = await super(ConditionalCacheMixin, self).get(request, *args, **kwargs)
+                if response.status_code == 200 and settings.RESPONSE_CACHE_TIMEOUT:
+                    await cache.aset(cache_key, response.data, settings.RESPONSE_CACHE_TIMEOUT)
+            else:
+                response = Response(data)
+        return self.finalize_cached_response(response, etag, last_modified)
@@ -0,0 +1,34 @@
+from django.conf import settings
+from django.core.checks import Error, Warning, register
+
+from .versions import cache_is_process_local, versions_shared
+
+
+@register()
+def check_cache_shared(app_configs, **kwargs):
+    """Версии данных в кэше процесса не видны другим процессам, кэши по версиям в этом случае отключены"""
+    if versions_shared():
+        return []
+    return [
+        Warning(
+            "Кэш LocMemCache не общий для процессов: ETag, кэш ответов, ключей ответов и рейтингов отключены",
+            hint="Укажите общий CACHE_BACKEND (Redis, Memcached, файловый) или CACHE_SINGLE_PROCESS=True, "
+            "если приложение работает в одном процессе",
+            id="courses.W001",
+        )
+    ]
+
+
+@register()
+def check_grading_cache(app_configs, **kwargs):
+    """Обработчик очереди проверки работает в отдельном процессе и должен видеть версии ключей ответов"""
+    if not settings.GRADING_ASYNC or not cache_is_process_local():
+        return []
+    return [
+        Error(
+            "Асинхронная проверка (GRADING_ASYNC) требует общего кэша: обработчик grade_results не видит "
+            "изменений ключей ответов в кэше LocMemCache веб-процессов",
+            hint="Укажите общий CACHE_BACKEND (Redis, Memcached, файловый)",
+            id="courses.E001",
+        )
+    ]
@@ -0,0 +1,31 @@
+def pack_ids(ids):
+    """Компактная упаковка множества положительных id: отсортированные разности в формате varint (LEB128).
+    Соседние id ответов одного теста обычно отличаются на единицы, поэтому на ответ уходит 1-2 байта"""
+    packed = bytearray()
+    previous = 0
+    for value in sorted(set(ids)):
+        delta = value - previous
+        previous = value
+        while delta >= 0x80:
+            packed.append(delta & 0x7F | 0x80)
+            delta >>= 7
+        packed.append(delta)
+    return bytes(packed)
+
+
+def unpack_ids(data):
+    """Распаковка id, упакованных pack_ids. Принимает bytes или memoryview (BinaryField в PostgreSQL)"""
+    ids = []
+    previous = 0
+    value = 0
+    shift = 0
+    for byte in bytes(data):
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+            continue
+        previous += value
+        ids.append(previous)
+        value = 0
+        shift = 0
+    return ids
@@ -0,0 +1,116 @@
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+from rest_framework.exceptions import PermissionDenied, ValidationError
+from rest_framework.utils.encoders import JSONEncoder
+
+from users.roles import ADMIN, ahas_role, has_role
+
+EXPORT_FORMATS = {"json": "application/json", "ndjson": "application/x-ndjson"}
+EXPORT_CHUNK_SIZE = 1000  # Строк за одно чтение из базы и в одном куске ответа
+
+_encoder = JSONEncoder(ensure_ascii=False)
+
+
+def _batches(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+async def _abatches(rows, size):
+    batch = []
+    async for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _encode(serializer, batch, export_format, first):
+    """Кусок ответа: строки NDJSON или элементы JSON-массива через запятую"""
+    rows = [_encoder.encode(serializer.to_representation(instance)) for instance in batch]
+    if export_format == "ndjson":
+        return "".join(f"{row}\n" for row in rows).encode()
+    return (("" if first else ",") + ",".join(rows)).encode()
+
+
+def stream_export(rows, serializer, export_format):
+    """Выгрузка строк кусками по EXPORT_CHUNK_SIZE, в памяти одновременно только один кусок"""
+    if export_format == "json":
+        yield b"["
+    for number, batch in enumerate(_batches(rows, EXPORT_CHUNK_SIZE)):
+        yield _encode(serializer, batch, export_format, number == 0)
+    if export_format == "json":
+        yield b"]"
+
+
+async def astream_export(rows, serializer, export_format):
+    """stream_export для строк из aiterator"""
+    if export_format == "json":
+        yield b"["
+    number = 0
+    async for batch in _abatches(rows, EXPORT_CHUNK_SIZE):
+        yield _encode(serializer, batch, export_format, number == 0)
+        number += 1
+    if export_format == "json":
+        yield b"]"
+
+
+class ExportMixin:
+    """Полная выгрузка списка администратором: ?export=json (JSON-массив) или ?export=ndjson (JSON Lines).
+    Строки читаются из базы через iterator(chunk_size) и отдаются потоком без пагинации и кэша ответов,
+    поэтому память не зависит от размера таблицы"""
+
+    def get_export_format(self, request):
+        export_format = request.query_params.get("export")
+        if export_format is not None and export_format not in EXPORT_FORMATS:
+            raise ValidationError({"export": f"Ожидается один из форматов: {', '.join(EXPORT_FORMATS)}"})
+        return export_format
+
+    def get_export_queryset(self):
+        return self.filter_queryset(self.get_queryset()).order_by("id")
+
+    def export_response(self, queryset, stream, export_format):
+        response = StreamingHttpResponse(stream, content_type=EXPORT_FORMATS[export_format])
+        filename = f"{queryset.model._meta.model_name}.{export_format}"
+        response["Content-Disposition"] = f'attachment; filename="{filename}"'
+        return response
+
+    def get(self, request, *args, **kwargs):
+        export_format = self.get_export_format(request)
+        if export_format is None:
+            return super().get(request, *args, **kwargs)
+        if not has_role(request.user, ADMIN):
+            raise PermissionDenied("Выгрузка доступна только администраторам")
+        queryset = self.get_export_queryset()
+        stream = stream_export(queryset.iterator(chunk_size=EXPORT_CHUNK_SIZE), self.get_serializer(), export_format)
+        return self.export_response(queryset, stream, export_format)
+
+
+class AsyncExportMixin(ExportMixin):
+    """ExportMixin для асинхронных представлений. Под ASGI строки читаются через aiterator, под WSGI -
+    обычным итератором: асинхронный поток WSGI-сервер сначала собрал бы в память целиком"""
+
+    async def get(self, request, *args, **kwargs):
+        export_format = self.get_export_format(request)
+        if export_format is None:
+            return await super(ExportMixin, self).get(request, *args, **kwargs)
+        if not await ahas_role(request.user, ADMIN):
+            raise PermissionDenied("Выгрузка доступна только администраторам")
+        queryset = self.get_export_queryset()
+        if isinstance(request._request, ASGIRequest):
+            stream = astream_export(
+                queryset.aiterator(chunk_size=EXPORT_CHUNK_SIZE), self.get_serializer(), export_format
+            )
+        else:
+            stream = stream_export(
+                queryset.iterator(chunk_size=EXPORT_CHUNK_SIZE), self.get_serializer(), export_format
+            )
+        return self.export_response(queryset, stream, export_format)
@@ -0,0 +1,309 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count
+from django.dispatch import Signal
+from rest_framework import serializers
+
+from .encoding import unpack_ids
+from .models import Answer, Question, TestResult
+from .versions import bump_version, get_version, versions_shared
+
+ANSWER_KEY_TIMEOUT = 60 * 60 * 24  # Ключ ответов хранится в кэше сутки
+GRADING_BATCH_SIZE = 100  # Количество задач, захватываемых обработчиком очереди за раз
+REGRADE_CHUNK_SIZE = 2000  # Количество результатов, пересчитываемых за одну транзакцию
+
+# Отправляется после записи баллов: results - проверенные результаты,
+# previous_scores - {id результата: прежний балл} для пересчитанных результатов
+results_graded = Signal()
+
+
+class AnswerKey:
+    """Ключ ответов теста: для каждого вопроса множества правильных и всех допустимых ответов"""
+
+    def __init__(self, test_id, correct, options, version=None):
+        self.test_id = test_id
+        self.version = version  # Версия содержимого теста, по которой собран ключ
+        self.correct = correct  # {id вопроса: frozenset id правильных ответов}
+        self.options = options  # {id вопроса: frozenset id всех ответов вопроса}
+
+    @staticmethod
+    def queryset(test_id):
+        """Вопросы теста с вариантами ответа и их правильностью одним запросом (LEFT JOIN вопросов и ответов)"""
+        return Question.objects.filter(test_id=test_id).values_list("id", "answers__id", "answers__is_correct")
+
+    @classmethod
+    def build(cls, test_id, version=None):
+        """Загрузка ключа ответов одним запросом"""
+        correct = {}
+        options = {}
+        for question_id, answer_id, is_correct in cls.queryset(test_id):
+            correct.setdefault(question_id, set())
+            options.setdefault(question_id, set())
+            if answer_id is None:  # Вопрос без вариантов ответа
+                continue
+            options[question_id].add(answer_id)
+            if is_correct:
+                correct[question_id].add(answer_id)
+        return cls(
+            test_id,
+            {question_id: frozenset(ids) for question_id, ids in correct.items()},
+            {question_id: frozenset(ids) for question_id, ids in options.items()},
+            version,
+        )
+
+    def validate(self, answers):
+        """Проверка всех ответов пользователя за один проход, возвращает словарь {id вопроса: frozenset}"""
+        if not isinstance(answers, dict):
+            raise serializers.ValidationError({"answers": "Ожидается JSON-объект с ответами"})
+
+        errors = {}
+        normalized = {}
+        for key, value in answers.items():
+            try:
+                question_id = int(key)
+            except (TypeError, ValueError):
+                errors[key] = "Некорректный идентификатор вопроса"
+                continue
+            if question_id not in self.options:
+                errors[key] = "Вопрос не относится к тесту"
+                continue
+            if not isinstance(value, list) or not all(
+                isinstance(answer_id, int) and not isinstance(answer_id, bool) for answer_id in value
+            ):
+                errors[key] = "Ожидается список идентификаторов ответов"
+                continue
+            answer_ids = frozenset(value)
+            unknown = answer_ids - self.options[question_id]
+            if unknown:
+                errors[key] = f"Ответы не относятся к вопросу: {sorted(unknown)}"
+                continue
+            normalized[question_id] = answer_ids
+
+        if errors:
+            raise serializers.ValidationError({"answers": errors})
+        return normalized
+
+    def group(self, answer_ids):
+        """Раскладка сохраненных id ответов по вопросам. Ответы, которых больше нет в тесте, пропускаются"""
+        if not hasattr(self, "_question_of"):
+            self._question_of = {
+                answer_id: question_id for question_id, options in self.options.items() for answer_id in options
+            }
+        answers = {}
+        for answer_id in answer_ids:
+            question_id = self._question_of.get(answer_id)
+            if question_id is not None:
+                answers.setdefault(question_id, set()).add(answer_id)
+        return {question_id: frozenset(ids) for question_id, ids in answers.items()}
+
+    def score(self, answers):
+        """Подсчет баллов: вопрос засчитывается, если множество ответов совпадает с правильным"""
+        empty = frozenset()
+        return sum(1 for question_id, correct in self.correct.items() if answers.get(question_id, empty) == correct)
+
+
+def get_answer_key(test_id):
+    """Получение ключа ответов теста из кэша, при промахе ключ собирается из базы.
+    Если версии не общие для процессов, ключ собирается при каждом вызове: изменение ответов в другом процессе
+    не сбросило бы закэшированный ключ, и результаты проверялись бы по устаревшему ключу до истечения срока"""
+    if not versions_shared():
+        return AnswerKey.build(test_id)
+    version = get_version("test_content", test_id)
+    cache_key = f"answer_key:{test_id}:{version}"
+    answer_key = cache.get(cache_key)
+    if answer_key is None:
+        answer_key = AnswerKey.build(test_id, version)
+        cache.set(cache_key, answer_key, ANSWER_KEY_TIMEOUT)
+    return answer_key
+
+
+def invalidate_answer_key(test_id):
+    """Сброс ключа ответов теста после изменения вопросов или ответов"""
+    if test_id is not None:
+        bump_version("test_content", test_id)
+
+
+def answer_ids(answers):
+    """Все id ответов из проверенного словаря {id вопроса: frozenset}"""
+    return [answer_id for ids in answers.values() for answer_id in ids]
+
+
+def notify_graded(results, previous_scores=None, answer_keys=()):
+    """Оповещение подписчиков о записанных баллах. answer_keys - ключи ответов, по которым проверены результаты:
+    подписчикам не нужно загружать их повторно"""
+    if results:
+        results_graded.send(
+            sender=TestResult,
+            results=results,
+            previous_scores=previous_scores or {},
+            answer_keys={answer_key.test_id: answer_key for answer_key in answer_keys},
+        )
+
+
+def grade_pending(batch_size=GRADING_BATCH_SIZE):
+    """Проверка очередной пачки ожидающих результатов. Результаты, захваченные другими обработчиками, пропускаются.
+    Возвращает количество проверенных результатов"""
+    with transaction.atomic():
+        results = list(
+            TestResult.objects.select_for_update(skip_locked=True)
+            .filter(status=TestResult.STATUS_PENDING)
+            .only("id", "test_id", "student_id", "answers_packed")
+            .order_by("id")[:batch_size]
+        )
+        if not results:
+            return 0
+
+        answer_keys = {}
+        for result in results:
+            answer_key = answer_keys.get(result.test_id)
+            if answer_key is None:
+                answer_key = answer_keys[result.test_id] = get_answer_key(result.test_id)
+            result.score = answer_key.score(answer_key.group(unpack_ids(result.answers_packed or b"")))
+            result.status = TestResult.STATUS_GRADED
+        TestResult.objects.bulk_update(results, ["score", "status"])
+        notify_graded(results, answer_keys=answer_keys.values())
+    return len(results)
+
+
+def run_grading_worker(batch_size=GRADING_BATCH_SIZE, poll_interval=1.0, once=False):
+    """Цикл обработчика очереди. При once=True завершается, когда очередь пуста"""
+    graded = 0
+    while True:
+        count = grade_pending(batch_size)
+        graded += count
+        if count == 0:
+            if once:
+                return graded
+            time.sleep(poll_interval)
+
+
+def regrade_chunk(test_id, last_id, chunk_size=REGRADE_CHUNK_SIZE):
+    """Очередная пачка проверенных результатов теста с сохраненными ответами по возрастанию id"""
+    return (
+        TestResult.objects.filter(
+            test_id=test_id, status=TestResult.STATUS_GRADED, answers_packed__isnull=False, id__gt=last_id
+        )
+        .only("id", "test_id", "student_id", "score", "answers_packed")
+        .order_by("id")[:chunk_size]
+    )
+
+
+def regrade_results(
+    test_id,
+    question_ids=None,
+    removed_answer_ids=(),
+    previous_correct=None,
+    chunk_size=REGRADE_CHUNK_SIZE,
+    progress=None,
+):
+    """Пересчет баллов проверенных результатов теста по текущему ключу ответов.
+    Результаты читаются пачками по id, в базу записываются только изменившиеся баллы, каждая пачка в своей
+    транзакции. При question_ids и previous_correct ({id вопроса: число правильных ответов до изменения})
+    пересчитываются только результаты с ответами на эти вопросы (и на удаленные ответы removed_answer_ids).
+    Возвращает словарь со счетчиками просмотренных и измененных результатов"""
+    answer_key = get_answer_key(test_id)
+    touched = None
+    if question_ids is not None and previous_correct is not None:
+        # Пустой ответ засчитывается, только если у вопроса нет правильных ответов. Если их не было до изменения
+        # или нет после, балл меняется и у тех, кто на вопрос не отвечал, тогда просматриваются все результаты
+        if all(
+            previous_correct.get(question_id) and answer_key.correct.get(question_id) for question_id in question_ids
+        ):
+            touched = frozenset(removed_answer_ids).union(
+                *(answer_key.options[question_id] for question_id in question_ids)
+            )
+
+    stats = {"scanned": 0, "updated": 0}
+    last_id = 0
+    while True:
+        results = list(regrade_chunk(test_id, last_id, chunk_size))
+        if not results:
+            return stats
+        last_id = results[-1].id
+
+        changed = []
+        previous_scores = {}
+        for result in results:
+            ids = unpack_ids(result.answers_packed)
+            if touched is not None and touched.isdisjoint(ids):
+                continue
+            score = answer_key.score(answer_key.group(ids))
+            if score != result.score:
+                previous_scores[result.id] = result.score
+                result.score = score
+                changed.append(result)
+        if changed:
+            with transaction.atomic():
+                TestResult.objects.bulk_update(changed, ["score"])
+                notify_graded(changed, previous_scores, [answer_key])
+
+        stats["scanned"] += len(results)
+        stats["updated"] += len(changed)
+        if progress is not None:
+            progress(stats)
+
+
+def _correct_counts(question_ids):
+    """Число правильных ответов вопросов одним запросом"""
+    counts = dict.fromkeys(question_ids, 0)
+    counts.update(
+        Answer.objects.filter(question_id__in=question_ids, is_correct=True)
+        .values_list("question_id")
+        .annotate(Count("id"))
+        .order_by()
+    )
+    return counts
+
+
+class _ScheduledRegrades:
+    """Пересчеты, запрошенные в одной транзакции: {id теста: (id вопросов, id удаленных ответов,
+    {id вопроса: число правильных ответов до транзакции или None, если оно неизвестно})}.
+    Выполняется одним обработчиком on_commit, каждый тест пересчитывается один раз"""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.tests = {}
+
+    def add(self, test_id, question_ids, removed_answer_ids, correct_added):
+        scheduled_questions, scheduled_removed, previous_correct = self.tests.setdefault(test_id, (set(), set(), {}))
+        scheduled_questions.update(question_ids)
+        scheduled_removed.update(removed_answer_ids)
+        # Число до транзакции восстанавливается по первому изменению вопроса: текущее число минус добавленные
+        # этим изменением правильные ответы. Более поздние изменения видят уже измененный набор
+        new_questions = [question_id for question_id in question_ids if question_id not in previous_correct]
+        known = [question_id for question_id in new_questions if question_id in correct_added]
+        counts = _correct_counts(known) if known else {}
+        for question_id in new_questions:
+            previous_correct[question_id] = (
+                counts[question_id] - correct_added[question_id] if question_id in counts else None
+            )
+
+    def __call__(self):
+        if getattr(self.connection, "_scheduled_regrades", None) is self:
+            del self.connection._scheduled_regrades
+        for test_id, (question_ids, removed_answer_ids, previous_correct) in self.tests.items():
+            regrade_results(test_id, frozenset(question_ids), frozenset(removed_answer_ids), previous_correct)
+
+
+def schedule_regrade(test_id, question_ids, removed_answer_ids=(), correct_added=None):
+    """Пересчет результатов теста после фиксации транзакции, изменившей ключ ответов. correct_added -
+    {id вопроса: сколько правильных ответов добавило изменение (отрицательное, если сняло)}, без него
+    просматриваются все результаты теста. Изменения нескольких ответов в одной транзакции дают один пересчет
+    на тест. Выполняется синхронно в том же процессе, только при REGRADE_ON_CHANGE"""
+    if test_id is None or not settings.REGRADE_ON_CHANGE:
+        return
+    connection = transaction.get_connection()
+    if not connection.in_atomic_block:
+        scheduled = _ScheduledRegrades(connection)
+        scheduled.add(test_id, question_ids, removed_answer_ids, correct_added or {})
+        scheduled()
+        return
+    scheduled = getattr(connection, "_scheduled_regrades", None)
+    # При откате транзакции или точки сохранения обработчик снимается, тогда регистрируется новый
+    if scheduled is None or all(func is not scheduled for _, func, _ in connection.run_on_commit):
+        scheduled = connection._scheduled_regrades = _ScheduledRegrades(connection)
+        transaction.on_commit(scheduled)
+    scheduled.add(test_id, question_ids, removed_answer_ids, correct_added or {})
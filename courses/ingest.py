@@ -0,0 +1,188 @@
+import codecs
+import json
+
+from django.db import transaction
+from rest_framework import serializers
+from rest_framework.exceptions import ParseError
+
+from users.models import User
+from users.roles import STUDENT
+
+from .encoding import pack_ids
+from .grading import answer_ids, get_answer_key, notify_graded
+from .models import Test, TestResult
+
+BULK_BATCH_SIZE = 500  # Количество результатов в одной транзакции
+READ_CHUNK_SIZE = 64 * 1024
+MAX_ITEM_SIZE = 1024 * 1024  # Наибольший размер одного элемента JSON-массива в символах
+# Ошибка разбора дальше этого числа символов от конца буфера не исправляется дочитыванием: обрезанными
+# на границе частей могут оказаться только число, литерал true/false/null или escape-последовательность
+PARSE_LOOKAHEAD = 8
+
+NDJSON_CONTENT_TYPES = ("application/x-ndjson", "application/jsonl", "application/jsonlines")
+
+
+def _incomplete(error, buffer):
+    """Ошибка разбора может быть вызвана тем, что элемент еще не дочитан"""
+    return error.msg.startswith("Unterminated string") or error.pos + PARSE_LOOKAHEAD >= len(buffer)
+
+
+def iter_json_array(stream, chunk_size=READ_CHUNK_SIZE, max_item_size=MAX_ITEM_SIZE):
+    """Элементы JSON-массива по одному: тело запроса читается частями, а не целиком.
+    Некорректный элемент прерывает разбор сразу, не дожидаясь конца тела, элемент больше max_item_size
+    символов тоже считается ошибкой"""
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    position = 0
+    state = "start"  # start -> first/item -> separator -> ...
+    eof = False
+
+    while True:
+        while position < len(buffer) and buffer[position].isspace():
+            position += 1
+
+        if position < len(buffer):
+            char = buffer[position]
+            if state == "start":
+                if char != "[":
+                    raise ParseError("Ожидается JSON-массив")
+                position += 1
+                state = "first"
+                continue
+            if state == "separator":
+                if char == "]":
+                    return
+                if char != ",":
+                    raise ParseError("Ожидается ',' или ']'")
+                position += 1
+                state = "item"
+                continue
+            if state == "first" and char == "]":
+                return
+            try:
+                item, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError as error:
+                if eof or not _incomplete(error, buffer):
+                    raise ParseError("Некорректный JSON")
+            else:
+                # Число в конце буфера может продолжаться в следующей части
+                if end < len(buffer) or eof:
+                    yield item
+                    position = end
+                    state = "separator"
+                    continue
+        elif eof:
+            raise ParseError("Неожиданный конец данных")
+
+        # Данных в буфере недостаточно, дочитываем следующую часть
+        buffer = buffer[position:]
+        position = 0
+        if len(buffer) > max_item_size:
+            raise ParseError(f"Элемент массива больше {max_item_size} символов")
+        chunk = stream.read(chunk_size)
+        if chunk:
+            buffer += text_decoder.decode(chunk)
+        else:
+            buffer += text_decoder.decode(b"", final=True)
+            eof = True
+
+
+def iter_ndjson(stream):
+    """Строки JSON Lines по одной. Некорректная строка возвращается как исключение, а не прерывает разбор"""
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            yield ParseError("Некорректный JSON")
+
+
+def _batches(items, size):
+    """Разбивка потока элементов на пачки. Ошибка разбора JSON-массива становится последним элементом"""
+    batch = []
+    try:
+        for item in items:
+            batch.append(item)
+            if len(batch) == size:
+                yield batch
+                batch = []
+    except ParseError as error:
+        batch.append(error)
+    if batch:
+        yield batch
+
+
+def _item_ids(item):
+    """ID студента и теста из элемента, None при некорректном формате"""
+    if not isinstance(item, dict):
+        return None, None
+    student_id, test_id = item.get("student"), item.get("test")
+    # bool - подкласс int, но true/false не являются id
+    if any(not isinstance(value, int) or isinstance(value, bool) for value in (student_id, test_id)):
+        return None, None
+    return student_id, test_id
+
+
+def ingest_submissions(items, batch_size=BULK_BATCH_SIZE):
+    """Проверка, оценка и сохранение результатов пачками.
+    На пачку выполняется запрос студентов, запрос тестов и один bulk_create, ключи ответов берутся из кэша.
+    Возвращает статусы элементов в порядке поступления"""
+    statuses = []
+    answer_keys = {}
+    index = 0
+
+    for batch in _batches(items, batch_size):
+        pairs = [_item_ids(item) for item in batch]
+        student_ids = {student_id for student_id, _ in pairs if student_id is not None}
+        test_ids = {test_id for _, test_id in pairs if test_id is not None}
+        students = set(User.objects.filter(pk__in=student_ids, groups__name=STUDENT).values_list("pk", flat=True))
+        tests = set(Test.objects.filter(pk__in=test_ids).values_list("pk", flat=True))
+
+        results = []
+        batch_statuses = []
+        for item, (student_id, test_id) in zip(batch, pairs):
+            item_status = {"index": index}
+            index += 1
+            batch_statuses.append(item_status)
+
+            if isinstance(item, ParseError):
+                item_status.update(status="error", errors=item.detail)
+                continue
+            if student_id is None:
+                item_status.update(status="error", errors="Ожидается объект с полями student, test и answers")
+                continue
+            if student_id not in students:
+                item_status.update(status="error", errors={"student": "Студент не найден"})
+                continue
+            if test_id not in tests:
+                item_status.update(status="error", errors={"test": "Тест не найден"})
+                continue
+
+            if test_id not in answer_keys:
+                answer_keys[test_id] = get_answer_key(test_id)
+            answer_key = answer_keys[test_id]
+            try:
+                answers = answer_key.validate(item.get("answers", {}))
+            except serializers.ValidationError as error:
+                item_status.update(status="error", errors=error.detail)
+                continue
+
+            result = TestResult(
+                test_id=test_id,
+                student_id=student_id,
+                score=answer_key.score(answers),
+                answers_packed=pack_ids(answer_ids(answers)),
+            )
+            results.append((item_status, result))
+
+        with transaction.atomic():
+            TestResult.objects.bulk_create([result for _, result in results])
+            notify_graded([result for _, result in results], answer_keys=answer_keys.values())
+        for item_status, result in results:
+            item_status.update(status="created", id=result.id, score=result.score)
+        statuses += batch_statuses
+
+    return statuses
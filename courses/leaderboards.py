@@ -0,0 +1,59 @@
+from django.core.cache import cache
+
+from .models import CourseProgress, TestBestScore
+from .versions import get_version, versions_shared
+
+LEADERBOARD_SIZE = 10  # Размер рейтинга по умолчанию
+LEADERBOARD_MAX_SIZE = 100  # Сколько первых мест хранится в кэше
+LEADERBOARD_TIMEOUT = 60 * 10  # Рейтинг хранится в кэше 10 минут, новые результаты меняют версию раньше
+
+
+class Leaderboard:
+    """Рейтинг студентов теста или курса по предрассчитанным лучшим баллам.
+    Первые места и место студента читаются по составному индексу (область, балл по убыванию, студент)"""
+
+    def __init__(self, model, scope_field, score_field, namespace):
+        self.model = model
+        self.scope_field = scope_field  # Поле теста или курса
+        self.score_field = score_field  # Поле балла, по которому строится рейтинг
+        self.namespace = namespace  # Версия результатов, при смене которой рейтинг устаревает
+
+    def build_top(self, scope_id, limit=LEADERBOARD_MAX_SIZE):
+        """Первые места одним запросом. При равных баллах места совпадают.
+        Рейтинг видят все студенты, поэтому в нем только id и имя студента, без email"""
+        rows = (
+            self.model.objects.filter(**{self.scope_field: scope_id})
+            .order_by(f"-{self.score_field}", "student_id")
+            .values_list("student_id", "student__first_name", "student__last_name", self.score_field)[:limit]
+        )
+        top = []
+        for position, (student_id, first_name, last_name, score) in enumerate(rows, start=1):
+            rank = top[-1]["rank"] if top and top[-1]["score"] == score else position
+            name = " ".join(part for part in (first_name, last_name) if part) or None
+            top.append({"rank": rank, "student": student_id, "name": name, "score": score})
+        return top
+
+    def top(self, scope_id, limit=LEADERBOARD_SIZE):
+        """Первые места из кэша текущей версии результатов"""
+        if not versions_shared():
+            return self.build_top(scope_id, limit)
+        cache_key = f"leaderboard:{self.namespace}:{scope_id}:{get_version(self.namespace, scope_id)}"
+        top = cache.get(cache_key)
+        if top is None:
+            top = self.build_top(scope_id)
+            cache.set(cache_key, top, LEADERBOARD_TIMEOUT)
+        return top[:limit]
+
+    def rank(self, scope_id, student_id):
+        """Место и балл студента: число студентов с большим баллом считается по индексу.
+        Возвращает None, если у студента нет результатов"""
+        scope = self.model.objects.filter(**{self.scope_field: scope_id})
+        score = scope.filter(student_id=student_id).values_list(self.score_field, flat=True).first()
+        if score is None:
+            return None
+        higher = scope.filter(**{f"{self.score_field}__gt": score}).count()
+        return {"rank": higher + 1, "score": score}
+
+
+test_leaderboard = Leaderboard(TestBestScore, "test_id", "score", "test_results")
+course_leaderboard = Leaderboard(CourseProgress, "course_id", "total_score", "course_results")
@@ -0,0 +1,33 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from courses.analytics import get_test_analysis
+from courses.models import Test
+
+
+class Command(BaseCommand):
+    "Анализ вопросов теста по сохраненным результатам"
+
+    def add_arguments(self, parser):
+        parser.add_argument("test", type=int, help="ID теста")
+        parser.add_argument("--json", action="store_true", help="Вывести результат в JSON")
+
+    def handle(self, *args, **options):
+        if not Test.objects.filter(pk=options["test"]).exists():
+            raise CommandError("Тест не найден")
+        analysis = get_test_analysis(options["test"])
+
+        if options["json"]:
+            self.stdout.write(json.dumps(analysis, ensure_ascii=False, indent=2))
+            return
+
+        self.stdout.write(f"Тест {analysis['test']}, результатов: {analysis['results']}")
+        for question in analysis["questions"]:
+            self.stdout.write(
+                f"Вопрос {question['id']}: трудность {question['difficulty']}, "
+                f"дискриминативность {question['discrimination']}"
+            )
+            for answer in question["answers"]:
+                mark = "+" if answer["is_correct"] else " "
+                self.stdout.write(f"  {mark} ответ {answer['id']}: выбран в {answer['selection_rate']} результатов")
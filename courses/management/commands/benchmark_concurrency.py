@@ -0,0 +1,147 @@
+import asyncio
+import io
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+
+from users.models import User
+from users.roles import STUDENT
+from users.tokens import RoleRefreshToken
+
+DEFAULT_PATHS = ("/courses/", "/courses/lessons/", "/courses/tests/", "/courses/questions/")
+
+
+def _summary(title, timings, elapsed, errors):
+    timings.sort()
+    p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+    return (
+        f"{title}: {len(timings) / elapsed:.0f} запросов/с, p50 {statistics.median(timings) * 1000:.1f} мс, "
+        f"p95 {p95 * 1000:.1f} мс, ошибок {errors}"
+    )
+
+
+class Command(BaseCommand):
+    "Сравнение пропускной способности чтения под WSGI (пул потоков) и ASGI (один цикл событий) с медленными клиентами"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--path", action="append", dest="paths", help="Адрес запроса, по умолчанию списки курсов")
+        parser.add_argument("--requests", type=int, default=2000, help="Всего запросов")
+        parser.add_argument("--concurrency", type=int, default=100, help="Одновременных клиентов")
+        parser.add_argument("--threads", type=int, default=8, help="Потоков WSGI-сервера")
+        parser.add_argument(
+            "--client-delay", type=float, default=100.0, help="Задержка медленного клиента при чтении ответа, мс"
+        )
+
+    def handle(self, *args, **options):
+        student = User.objects.filter(groups__name=STUDENT).order_by("id").first()
+        if student is None:
+            raise CommandError("Нет студентов, заполните базу командой seed_platform")
+        self.authorization = f"Bearer {RoleRefreshToken.for_user(student).access_token}"
+        self.paths = options["paths"] or DEFAULT_PATHS
+        self.delay = options["client_delay"] / 1000
+        total = options["requests"]
+
+        self.stdout.write(
+            f"Запросов: {total}, клиентов: {options['concurrency']}, потоков WSGI: {options['threads']}, "
+            f"задержка клиента: {options['client_delay']} мс"
+        )
+        self.stdout.write(self.run_wsgi(total, options["concurrency"], options["threads"]))
+        self.stdout.write(asyncio.run(self.run_asgi(total, options["concurrency"])))
+
+    def run_wsgi(self, total, concurrency, threads):
+        """Пул из threads потоков, как у потокового WSGI-сервера. Медленный клиент занимает поток,
+        пока читает ответ"""
+        handler = WSGIHandler()
+        in_flight = threading.BoundedSemaphore(concurrency)
+        timings = []
+        errors = []
+
+        def request(path, submitted):
+            try:
+                statuses = []
+                environ = {
+                    "REQUEST_METHOD": "GET",
+                    "PATH_INFO": path,
+                    "QUERY_STRING": "",
+                    "SERVER_NAME": "testserver",
+                    "SERVER_PORT": "80",
+                    "SERVER_PROTOCOL": "HTTP/1.1",
+                    "REMOTE_ADDR": "127.0.0.1",
+                    "HTTP_AUTHORIZATION": self.authorization,
+                    "wsgi.version": (1, 0),
+                    "wsgi.url_scheme": "http",
+                    "wsgi.input": io.BytesIO(),
+                    "wsgi.errors": sys.stderr,
+                    "wsgi.multithread": True,
+                    "wsgi.multiprocess": False,
+                    "wsgi.run_once": False,
+                }
+                body = handler(environ, lambda status, headers, exc_info=None: statuses.append(status))
+                for _ in body:
+                    time.sleep(self.delay)
+                body.close()
+                if not statuses[0].startswith("200"):
+                    errors.append(statuses[0])
+                timings.append(time.perf_counter() - submitted)
+            finally:
+                in_flight.release()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            for number in range(total):
+                in_flight.acquire()
+                executor.submit(request, self.paths[number % len(self.paths)], time.perf_counter())
+        return _summary("WSGI", timings, time.perf_counter() - started, len(errors))
+
+    async def run_asgi(self, total, concurrency):
+        """Все клиенты обслуживаются одним циклом событий, медленный клиент не занимает поток"""
+        handler = ASGIHandler()
+        in_flight = asyncio.Semaphore(concurrency)
+        timings = []
+        errors = []
+
+        async def request(path):
+            async with in_flight:
+                submitted = time.perf_counter()
+                scope = {
+                    "type": "http",
+                    "asgi": {"version": "3.0"},
+                    "http_version": "1.1",
+                    "method": "GET",
+                    "scheme": "http",
+                    "path": path,
+                    "raw_path": path.encode(),
+                    "query_string": b"",
+                    "root_path": "",
+                    "headers": [(b"host", b"testserver"), (b"authorization", self.authorization.encode())],
+                    "client": ("127.0.0.1", 0),
+                    "server": ("testserver", 80),
+                }
+                messages = [{"type": "http.request", "body": b"", "more_body": False}]
+                disconnected = asyncio.Event()
+
+                async def receive():
+                    if messages:
+                        return messages.pop()
+                    await disconnected.wait()  # Клиент не отключается, пока не прочитает ответ
+                    return {"type": "http.disconnect"}
+
+                async def send(message):
+                    if message["type"] == "http.response.start" and message["status"] != 200:
+                        errors.append(message["status"])
+                    elif message["type"] == "http.response.body":
+                        await asyncio.sleep(self.delay)
+
+                await handler(scope, receive, send)
+                disconnected.set()
+                timings.append(time.perf_counter() - submitted)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(request(self.paths[number % len(self.paths)]) for number in range(total)))
+        return _summary("ASGI", timings, time.perf_counter() - started, len(errors))
@@ -0,0 +1,110 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+
+from courses.leaderboards import course_leaderboard, test_leaderboard
+from courses.models import Course, CourseProgress, Lesson, Test, TestBestScore, TestResult
+from users.models import User
+
+BENCHMARK_CHUNK_SIZE = 10000  # Строк в одном bulk_create
+
+
+class Command(BaseCommand):
+    "Замер скорости рейтингов на синтетических результатах. Данные создаются в транзакции и откатываются"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--results", type=int, default=1_000_000, help="Количество результатов теста")
+        parser.add_argument("--students", type=int, default=100_000, help="Количество студентов")
+        parser.add_argument("--max-score", type=int, default=20, help="Максимальный балл")
+        parser.add_argument("--repeat", type=int, default=20, help="Повторов каждого замера")
+        parser.add_argument("--seed", type=int, default=0, help="Seed генератора данных")
+        parser.add_argument("--keep", action="store_true", help="Не откатывать созданные данные")
+
+    def measure(self, title, func, repeat):
+        """Медиана и 95-й перцентиль времени выполнения в миллисекундах"""
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+        self.stdout.write(f"{title}: p50 {statistics.median(timings):.2f} мс, p95 {p95:.2f} мс")
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        with transaction.atomic():
+            test, course, student_ids = self.create_data(rng, options)
+            self.run_benchmarks(rng, test, course, student_ids, options["repeat"])
+            if not options["keep"]:
+                transaction.set_rollback(True)
+
+    def create_data(self, rng, options):
+        started = time.perf_counter()
+        owner = User.objects.create(email=f"benchmark-owner-{time.time_ns()}@example.invalid")
+        course = Course.objects.create(name="Benchmark", description="Benchmark", owner=owner)
+        lesson = Lesson.objects.create(title="Benchmark", content="Benchmark", course=course, owner=owner)
+        test = Test.objects.create(title="Benchmark", description="Benchmark", owner=owner, lesson=lesson)
+
+        prefix = f"benchmark-{time.time_ns()}"
+        students = [User(email=f"{prefix}-{number}@example.invalid") for number in range(options["students"])]
+        for start in range(0, len(students), BENCHMARK_CHUNK_SIZE):
+            User.objects.bulk_create(students[start : start + BENCHMARK_CHUNK_SIZE])
+        student_ids = list(User.objects.filter(email__startswith=prefix).values_list("id", flat=True))
+
+        best = {}
+        remaining = options["results"]
+        while remaining > 0:
+            chunk = []
+            for _ in range(min(remaining, BENCHMARK_CHUNK_SIZE)):
+                student_id = rng.choice(student_ids)
+                score = rng.randint(0, options["max_score"])
+                best[student_id] = max(best.get(student_id, score), score)
+                chunk.append(TestResult(test=test, student_id=student_id, score=score))
+            TestResult.objects.bulk_create(chunk)
+            remaining -= len(chunk)
+
+        # Предрассчитанные таблицы заполняются напрямую, как после rebuild_progress
+        best_rows = [
+            TestBestScore(test=test, student_id=student_id, score=score, attempts=1)
+            for student_id, score in best.items()
+        ]
+        progress_rows = [
+            CourseProgress(course=course, student_id=student_id, tests_completed=1, total_score=score)
+            for student_id, score in best.items()
+        ]
+        for start in range(0, len(best_rows), BENCHMARK_CHUNK_SIZE):
+            TestBestScore.objects.bulk_create(best_rows[start : start + BENCHMARK_CHUNK_SIZE])
+            CourseProgress.objects.bulk_create(progress_rows[start : start + BENCHMARK_CHUNK_SIZE])
+
+        self.stdout.write(
+            f"Создано результатов: {options['results']}, студентов с результатами: {len(best)} "
+            f"за {time.perf_counter() - started:.1f} с"
+        )
+        return test, course, list(best)
+
+    def run_benchmarks(self, rng, test, course, student_ids, repeat):
+        per_student = TestResult.objects.filter(test=test).values("student_id").annotate(best=Max("score"))
+
+        def naive_top():
+            list(per_student.order_by("-best", "student_id")[:10])
+
+        def naive_rank():
+            student_id = rng.choice(student_ids)
+            score = TestResult.objects.filter(test=test, student_id=student_id).aggregate(best=Max("score"))["best"]
+            per_student.filter(best__gt=score).count()
+
+        def random_rank(leaderboard, scope_id):
+            return lambda: leaderboard.rank(scope_id, rng.choice(student_ids))
+
+        self.measure("Топ-10 по результатам (GROUP BY)", naive_top, max(1, repeat // 10))
+        self.measure("Место студента по результатам (GROUP BY)", naive_rank, max(1, repeat // 10))
+        self.measure("Топ-100 теста по индексу", lambda: test_leaderboard.build_top(test.id), repeat)
+        self.measure("Топ-10 теста из кэша", lambda: test_leaderboard.top(test.id), repeat)
+        self.measure("Место студента в тесте по индексу", random_rank(test_leaderboard, test.id), repeat)
+        self.measure("Топ-100 курса по индексу", lambda: course_leaderboard.build_top(course.id), repeat)
+        self.measure("Место студента в курсе по индексу", random_rank(course_leaderboard, course.id), repeat)
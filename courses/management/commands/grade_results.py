@@ -0,0 +1,54 @@
+import multiprocessing
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from courses.grading import GRADING_BATCH_SIZE, run_grading_worker
+from courses.versions import cache_is_process_local
+
+
+class Command(BaseCommand):
+    """Обработка очереди асинхронной проверки тестов пулом локальных процессов.
+    Нужен общий с веб-процессами кэш: через него обработчик узнает об изменении ключей ответов"""
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Количество процессов")
+        parser.add_argument("--batch-size", type=int, default=GRADING_BATCH_SIZE, help="Задач за одну транзакцию")
+        parser.add_argument("--poll-interval", type=float, default=1.0, help="Пауза при пустой очереди, секунды")
+        parser.add_argument("--once", action="store_true", help="Завершиться, когда очередь опустеет")
+
+    def handle(self, *args, **options):
+        if cache_is_process_local():
+            raise CommandError(
+                "Обработчик очереди - отдельный процесс и не видит изменений ключей ответов в кэше LocMemCache "
+                "веб-процессов. Укажите общий CACHE_BACKEND (Redis, Memcached, файловый)"
+            )
+        worker_options = {
+            "batch_size": options["batch_size"],
+            "poll_interval": options["poll_interval"],
+            "once": options["once"],
+        }
+        workers = options["workers"]
+
+        if workers == 1:
+            graded = run_grading_worker(**worker_options)
+            self.stdout.write(self.style.SUCCESS(f"Проверено результатов: {graded or 0}"))
+            return
+
+        # Каждый процесс должен открыть собственное соединение с базой
+        connections.close_all()
+        context = multiprocessing.get_context("fork")
+        processes = [
+            context.Process(target=run_grading_worker, kwargs=worker_options, daemon=True) for _ in range(workers)
+        ]
+        for process in processes:
+            process.start()
+        self.stdout.write(f"Запущено обработчиков: {workers}")
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            for process in processes:
+                process.terminate()
+        self.stdout.write(self.style.SUCCESS("Обработка очереди завершена"))
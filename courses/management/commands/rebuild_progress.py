@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from courses.progress import REBUILD_CHUNK_SIZE, rebuild_progress
+
+
+class Command(BaseCommand):
+    "Пересборка лучших результатов студентов и прогресса по курсам из сохраненных результатов"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=REBUILD_CHUNK_SIZE, help="Строк в одной вставке")
+
+    def handle(self, *args, **options):
+        count = rebuild_progress(options["chunk_size"])
+        self.stdout.write(self.style.SUCCESS(f"Пересчитано пар тест-студент: {count}"))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from courses.models import Test
+from courses.stats import rebuild_test_stats
+
+
+class Command(BaseCommand):
+    "Пересборка статистики баллов тестов по сохраненным результатам"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--test", type=int, action="append", dest="tests", help="ID теста, по умолчанию все тесты")
+
+    def handle(self, *args, **options):
+        test_ids = Test.objects.order_by("id").values_list("id", flat=True)
+        if options["tests"]:
+            test_ids = test_ids.filter(pk__in=options["tests"])
+        rebuilt = 0
+        for test_id in test_ids:
+            stats = rebuild_test_stats(test_id)
+            self.stdout.write(f"Тест {test_id}: результатов {stats.count}")
+            rebuilt += 1
+        self.stdout.write(self.style.SUCCESS(f"Статистика пересобрана для тестов: {rebuilt}"))
@@ -0,0 +1,63 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from courses.grading import REGRADE_CHUNK_SIZE, invalidate_answer_key, regrade_results
+from courses.models import Question, Test
+
+
+class Command(BaseCommand):
+    "Пересчет баллов сохраненных результатов по текущим правильным ответам"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--test", type=int, action="append", dest="tests", help="ID теста, по умолчанию все тесты")
+        parser.add_argument(
+            "--question",
+            type=int,
+            action="append",
+            dest="questions",
+            help="Пересчитать результаты теста, к которому относится вопрос",
+        )
+        parser.add_argument(
+            "--chunk-size", type=int, default=REGRADE_CHUNK_SIZE, help="Результатов за одну транзакцию"
+        )
+
+    def handle(self, *args, **options):
+        questions = options["questions"]
+        if questions:
+            # Вопросы группируются по тестам. Правильные ответы до изменения неизвестны (их могли менять несколько
+            # раз, в том числе с пустого набора), поэтому просматриваются все результаты этих тестов
+            question_tests = dict(Question.objects.filter(pk__in=questions).values_list("id", "test_id"))
+            missing = sorted(set(questions) - set(question_tests))
+            if missing:
+                raise CommandError(f"Вопросы не найдены: {missing}")
+            targets = {}
+            for question_id, test_id in question_tests.items():
+                targets.setdefault(test_id, set()).add(question_id)
+            if options["tests"]:
+                targets = {test_id: ids for test_id, ids in targets.items() if test_id in options["tests"]}
+        elif options["tests"]:
+            targets = dict.fromkeys(options["tests"])
+        else:
+            targets = dict.fromkeys(Test.objects.order_by("id").values_list("id", flat=True))
+
+        total = {"scanned": 0, "updated": 0}
+        for test_id, question_ids in sorted(targets.items()):
+            # Правильные ответы могли быть изменены в обход сигналов, ключ собирается заново
+            invalidate_answer_key(test_id)
+            started = time.monotonic()
+
+            def report(stats):
+                elapsed = max(time.monotonic() - started, 1e-6)
+                self.stdout.write(
+                    f"Тест {test_id}: просмотрено {stats['scanned']}, изменено {stats['updated']} "
+                    f"({stats['scanned'] / elapsed:.0f} результатов/с)"
+                )
+
+            stats = regrade_results(test_id, question_ids, chunk_size=options["chunk_size"], progress=report)
+            total["scanned"] += stats["scanned"]
+            total["updated"] += stats["updated"]
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Просмотрено результатов: {total['scanned']}, изменено: {total['updated']}")
+        )
@@ -0,0 +1,35 @@
+# Generated by Django 5.1.6 on 2026-10-18 17:46
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("courses", "0002_question_answer_test_question_test_testresult"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="answer",
+            index=models.Index(fields=["question", "id"], name="answer_question_id_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="course",
+            index=models.Index(fields=["owner", "id"], name="course_owner_id_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="lesson",
+            index=models.Index(fields=["course", "id"], name="lesson_course_id_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="question",
+            index=models.Index(fields=["test", "id"], name="question_test_id_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="test",
+            index=models.Index(fields=["lesson", "id"], name="test_lesson_id_idx"),
+        ),
+    ]
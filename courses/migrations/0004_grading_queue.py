@@ -0,0 +1,28 @@
+# Generated by Django 5.1.6 on 2026-10-18 17:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("courses", "0003_list_pagination_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="testresult",
+            name="status",
+            field=models.CharField(
+                choices=[("pending", "Ожидает проверки"), ("graded", "Проверен")],
+                default="graded",
+                max_length=10,
+                verbose_name="Статус",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="testresult",
+            name="score",
+            field=models.IntegerField(blank=True, null=True, verbose_name="Баллы"),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.1.6 on 2026-10-18 17:54
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("courses", "0004_grading_queue"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="testresult",
+            name="answers_packed",
+            field=models.BinaryField(blank=True, null=True, verbose_name="Ответы пользователя"),
+        ),
+        migrations.AddIndex(
+            model_name="testresult",
+            index=models.Index(
+                condition=models.Q(("status", "pending")), fields=["id"], name="testresult_pending_idx"
+            ),
+        ),
+    ]
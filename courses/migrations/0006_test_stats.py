@@ -0,0 +1,87 @@
+# Generated by Django 5.1.6 on 2026-10-18 18:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, F, Max, Min, Sum
+
+
+def build_stats(apps, schema_editor):
+    """Начальная статистика по уже сохраненным результатам: два запроса с группировкой по тестам"""
+    TestResult = apps.get_model("courses", "TestResult")
+    TestStats = apps.get_model("courses", "TestStats")
+    TestScoreBucket = apps.get_model("courses", "TestScoreBucket")
+    graded = TestResult.objects.filter(status="graded", score__isnull=False)
+    TestStats.objects.bulk_create(
+        TestStats(test_id=row.pop("test_id"), **row)
+        for row in graded.values("test_id").annotate(
+            count=Count("id"),
+            total=Sum("score"),
+            total_squares=Sum(F("score") * F("score")),
+            min_score=Min("score"),
+            max_score=Max("score"),
+        ).order_by("test_id")
+    )
+    TestScoreBucket.objects.bulk_create(
+        TestScoreBucket(stats_id=test_id, score=score, count=count)
+        for test_id, score, count in graded.values_list("test_id", "score").annotate(Count("id")).order_by()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("courses", "0005_testresult_answers_packed"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TestStats",
+            fields=[
+                (
+                    "test",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="stats",
+                        serialize=False,
+                        to="courses.test",
+                        verbose_name="Тест",
+                    ),
+                ),
+                ("count", models.IntegerField(default=0, verbose_name="Количество результатов")),
+                ("total", models.BigIntegerField(default=0, verbose_name="Сумма баллов")),
+                ("total_squares", models.BigIntegerField(default=0, verbose_name="Сумма квадратов баллов")),
+                ("min_score", models.IntegerField(blank=True, null=True, verbose_name="Минимальный балл")),
+                ("max_score", models.IntegerField(blank=True, null=True, verbose_name="Максимальный балл")),
+            ],
+            options={
+                "verbose_name": "Статистика теста",
+                "verbose_name_plural": "Статистика тестов",
+            },
+        ),
+        migrations.CreateModel(
+            name="TestScoreBucket",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("score", models.IntegerField(verbose_name="Баллы")),
+                ("count", models.IntegerField(default=0, verbose_name="Количество результатов")),
+                (
+                    "stats",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="buckets",
+                        to="courses.teststats",
+                        verbose_name="Статистика",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Частота балла",
+                "verbose_name_plural": "Гистограмма баллов",
+                "constraints": [
+                    models.UniqueConstraint(fields=("stats", "score"), name="testscorebucket_stats_score_uniq")
+                ],
+            },
+        ),
+        migrations.RunPython(build_stats, migrations.RunPython.noop),
+    ]
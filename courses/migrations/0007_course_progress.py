@@ -0,0 +1,152 @@
+# Generated by Django 5.1.6 on 2026-10-18 18:04
+
+import math
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max, Q, Sum
+
+BATCH_SIZE = 2000
+PASS_SCORE_RATIO = 0.5  # Доля вопросов для зачета на момент миграции; код приложения может ее изменить
+
+
+def build_progress(apps, schema_editor):
+    """Лучшие результаты и прогресс по курсам для уже сохраненных результатов: запрос с группировкой
+    по парам (тест, студент), затем по парам (курс, студент). Используются только исторические модели"""
+    Question = apps.get_model("courses", "Question")
+    TestResult = apps.get_model("courses", "TestResult")
+    TestBestScore = apps.get_model("courses", "TestBestScore")
+    CourseProgress = apps.get_model("courses", "CourseProgress")
+
+    # Максимальный балл - число вопросов теста, проходной - доля PASS_SCORE_RATIO от него
+    max_scores = dict(Question.objects.values_list("test_id").annotate(Count("id")).order_by())
+    best = (
+        TestResult.objects.filter(status="graded", score__isnull=False)
+        .values("test_id", "student_id")
+        .annotate(best=Max("score"), attempts=Count("id"), last=Max("completed_at"))
+        .order_by()
+    )
+    TestBestScore.objects.bulk_create(
+        (
+            TestBestScore(
+                test_id=row["test_id"],
+                student_id=row["student_id"],
+                score=row["best"],
+                max_score=max_scores.get(row["test_id"], 0),
+                passed=row["best"] >= math.ceil(max_scores.get(row["test_id"], 0) * PASS_SCORE_RATIO),
+                attempts=row["attempts"],
+                last_attempt_at=row["last"],
+            )
+            for row in best.iterator(chunk_size=BATCH_SIZE)
+        ),
+        batch_size=BATCH_SIZE,
+    )
+
+    totals = (
+        TestBestScore.objects.values("test__lesson__course_id", "student_id")
+        .annotate(
+            completed=Count("id"),
+            passed=Count("id", filter=Q(passed=True)),
+            score=Sum("score"),
+            last=Max("last_attempt_at"),
+        )
+        .order_by()
+    )
+    CourseProgress.objects.bulk_create(
+        (
+            CourseProgress(
+                course_id=row["test__lesson__course_id"],
+                student_id=row["student_id"],
+                tests_completed=row["completed"],
+                tests_passed=row["passed"],
+                total_score=row["score"],
+                last_activity=row["last"],
+            )
+            for row in totals.iterator(chunk_size=BATCH_SIZE)
+        ),
+        batch_size=BATCH_SIZE,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("courses", "0006_test_stats"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CourseProgress",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("tests_completed", models.IntegerField(default=0, verbose_name="Пройдено тестов")),
+                ("tests_passed", models.IntegerField(default=0, verbose_name="Сдано тестов")),
+                ("total_score", models.IntegerField(default=0, verbose_name="Сумма лучших баллов")),
+                ("last_activity", models.DateTimeField(blank=True, null=True, verbose_name="Последняя активность")),
+                (
+                    "course",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="progress",
+                        to="courses.course",
+                        verbose_name="Курс",
+                    ),
+                ),
+                (
+                    "student",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="course_progress",
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="Студент",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Прогресс по курсу",
+                "verbose_name_plural": "Прогресс по курсам",
+                "constraints": [
+                    models.UniqueConstraint(fields=("student", "course"), name="courseprogress_student_course_uniq")
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name="TestBestScore",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("score", models.IntegerField(default=0, verbose_name="Лучший балл")),
+                ("max_score", models.IntegerField(default=0, verbose_name="Максимальный балл")),
+                ("passed", models.BooleanField(default=False, verbose_name="Тест сдан")),
+                ("attempts", models.IntegerField(default=0, verbose_name="Количество попыток")),
+                ("last_attempt_at", models.DateTimeField(blank=True, null=True, verbose_name="Последняя попытка")),
+                (
+                    "student",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="best_scores",
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="Студент",
+                    ),
+                ),
+                (
+                    "test",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="best_scores",
+                        to="courses.test",
+                        verbose_name="Тест",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Лучший результат",
+                "verbose_name_plural": "Лучшие результаты",
+                "constraints": [
+                    models.UniqueConstraint(fields=("test", "student"), name="testbestscore_test_student_uniq")
+                ],
+            },
+        ),
+        migrations.RunPython(build_progress, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.6 on 2026-10-18 18:06
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("courses", "0007_course_progress"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="courseprogress",
+            index=models.Index(fields=["course", "-total_score", "student"], name="courseprogress_rank_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="testbestscore",
+            index=models.Index(fields=["test", "-score", "student"], name="testbestscore_rank_idx"),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.1.6 on 2026-10-18 18:08
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("courses", "0008_leaderboard_indexes"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="testresult",
+            index=models.Index(fields=["test", "student", "completed_at"], name="testresult_test_student_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="testresult",
+            index=models.Index(
+                condition=models.Q(("status", "graded")), fields=["test", "id"], name="testresult_graded_test_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Поиск в админке (icontains) выполняется как UPPER(поле) LIKE '%...%' и не использует B-tree индексы.
+# Триграммный GIN-индекс по UPPER(title) поддерживает такой поиск, если на сервере есть расширение pg_trgm
+
+import django.contrib.postgres.indexes
+import django.db.models.functions.text
+from django.db import migrations
+
+from config.trigram import AddTrigramIndexConcurrently, OptionalTrigramExtension
+
+
+class Migration(migrations.Migration):
+
+    atomic = False  # CREATE INDEX CONCURRENTLY не выполняется внутри транзакции
+
+    dependencies = [
+        ("courses", "0009_query_pattern_indexes"),
+    ]
+
+    operations = [
+        OptionalTrigramExtension(),
+        AddTrigramIndexConcurrently(
+            model_name="test",
+            index=django.contrib.postgres.indexes.GinIndex(
+                django.contrib.postgres.indexes.OpClass(
+                    django.db.models.functions.text.Upper("title"), name="gin_trgm_ops"
+                ),
+                name="courses_test_title_trgm_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.1.6 on 2026-10-18 20:14
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("courses", "0010_test_title_trigram_index"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="answer",
+            name="question",
+            field=models.ForeignKey(
+                db_index=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="answers",
+                to="courses.question",
+                verbose_name="Вопрос",
+            ),
+        ),
+    ]
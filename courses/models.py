@@ -1,7 +1,13 @@
+import math
+
+from django.contrib.postgres.indexes import GinIndex, OpClass
 from django.db import models
+from django.db.models.functions import Upper
 
 from users.models import User
 
+from .encoding import unpack_ids
+
 
 class Course(models.Model):
     """Модель курса"""
@@ -13,6 +19,7 @@ class Course(models.Model):
     class Meta:
         verbose_name = "Курс"
         verbose_name_plural = "Курсы"
+        indexes = [models.Index(fields=["owner", "id"], name="course_owner_id_idx")]
 
     def __str__(self):
         return self.name
@@ -30,6 +37,7 @@ class Lesson(models.Model):
     class Meta:
         verbose_name = "Урок"
         verbose_name_plural = "Уроки"
+        indexes = [models.Index(fields=["course", "id"], name="lesson_course_id_idx")]
 
     def __str__(self):
         return self.title
@@ -46,6 +54,11 @@ class Test(models.Model):
     class Meta:
         verbose_name = "Тест"
         verbose_name_plural = "Тесты"
+        indexes = [
+            models.Index(fields=["lesson", "id"], name="test_lesson_id_idx"),
+            # Поиск в админке по подстроке названия, создается только при наличии pg_trgm
+            GinIndex(OpClass(Upper("title"), name="gin_trgm_ops"), name="courses_test_title_trgm_idx"),
+        ]
 
     def __str__(self):
         return self.title
@@ -60,6 +73,7 @@ class Question(models.Model):
     class Meta:
         verbose_name = "Вопрос"
         verbose_name_plural = "Вопросы"
+        indexes = [models.Index(fields=["test", "id"], name="question_test_id_idx")]
 
     def __str__(self):
         return self.text
@@ -68,13 +82,19 @@ class Question(models.Model):
 class Answer(models.Model):
     """Модель ответа"""
 
-    question = models.ForeignKey(Question, on_delete=models.CASCADE, related_name="answers", verbose_name="Вопрос")
+    # Отдельный индекс внешнего ключа не нужен: выборки по вопросу обслуживает составной индекс (question, id)
+    question = models.ForeignKey(
+        Question, on_delete=models.CASCADE, related_name="answers", verbose_name="Вопрос", db_index=False
+    )
     text = models.CharField(max_length=255, verbose_name="Текст ответа")
     is_correct = models.BooleanField(default=False, verbose_name="Правильный ответ")
 
     class Meta:
         verbose_name = "Ответ"
         verbose_name_plural = "Ответы"
+        indexes = [
+            models.Index(fields=["question", "id"], name="answer_question_id_idx"),
+        ]
 
     def __str__(self):
         return self.text
@@ -83,14 +103,136 @@ class Answer(models.Model):
 class TestResult(models.Model):
     """Модель результата теста"""
 
+    STATUS_PENDING = "pending"
+    STATUS_GRADED = "graded"
+    STATUS_CHOICES = [
+        (STATUS_PENDING, "Ожидает проверки"),
+        (STATUS_GRADED, "Проверен"),
+    ]
+
     test = models.ForeignKey(Test, on_delete=models.CASCADE, related_name="results", verbose_name="Тест")
     student = models.ForeignKey(User, on_delete=models.CASCADE, related_name="test_results", verbose_name="Студент")
-    score = models.IntegerField(verbose_name="Баллы")
+    score = models.IntegerField(verbose_name="Баллы", null=True, blank=True)  # Пусто, пока результат не проверен
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_GRADED, verbose_name="Статус")
+    # Выбранные ответы, упакованные pack_ids. Пусто для результатов, сохраненных до появления поля
+    answers_packed = models.BinaryField(verbose_name="Ответы пользователя", null=True, blank=True)
     completed_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата выполнения")
 
     class Meta:
         verbose_name = "Результат теста"
         verbose_name_plural = "Результаты тестов"
+        indexes = [
+            # Очередь асинхронной проверки: индекс содержит только ожидающие результаты
+            models.Index(fields=["id"], condition=models.Q(status="pending"), name="testresult_pending_idx"),
+            # История попыток студента и пересчет лучших результатов по паре (тест, студент)
+            models.Index(fields=["test", "student", "completed_at"], name="testresult_test_student_idx"),
+            # Пересчет баллов и анализ вопросов: проверенные результаты теста по порядку id
+            models.Index(
+                fields=["test", "id"], condition=models.Q(status="graded"), name="testresult_graded_test_idx"
+            ),
+        ]
 
     def __str__(self):
         return f"{self.student.email} - {self.test.title}"
+
+    @property
+    def answer_ids(self):
+        """ID выбранных ответов или None, если ответы не сохранены"""
+        if self.answers_packed is None:
+            return None
+        return unpack_ids(self.answers_packed)
+
+
+class TestStats(models.Model):
+    """Агрегаты баллов теста, обновляются инкрементально при каждой проверке результата"""
+
+    test = models.OneToOneField(
+        Test, on_delete=models.CASCADE, primary_key=True, related_name="stats", verbose_name="Тест"
+    )
+    count = models.IntegerField(default=0, verbose_name="Количество результатов")
+    total = models.BigIntegerField(default=0, verbose_name="Сумма баллов")
+    total_squares = models.BigIntegerField(default=0, verbose_name="Сумма квадратов баллов")
+    min_score = models.IntegerField(null=True, blank=True, verbose_name="Минимальный балл")
+    max_score = models.IntegerField(null=True, blank=True, verbose_name="Максимальный балл")
+
+    class Meta:
+        verbose_name = "Статистика теста"
+        verbose_name_plural = "Статистика тестов"
+
+    def __str__(self):
+        return f"Статистика: {self.test_id}"
+
+    @property
+    def mean(self):
+        """Средний балл"""
+        if not self.count:
+            return None
+        return self.total / self.count
+
+    @property
+    def stddev(self):
+        """Стандартное отклонение баллов"""
+        if not self.count:
+            return None
+        variance = self.total_squares / self.count - (self.total / self.count) ** 2
+        return math.sqrt(max(variance, 0))
+
+
+class TestScoreBucket(models.Model):
+    """Строка гистограммы баллов теста: количество результатов с данным баллом"""
+
+    stats = models.ForeignKey(TestStats, on_delete=models.CASCADE, related_name="buckets", verbose_name="Статистика")
+    score = models.IntegerField(verbose_name="Баллы")
+    count = models.IntegerField(default=0, verbose_name="Количество результатов")
+
+    class Meta:
+        verbose_name = "Частота балла"
+        verbose_name_plural = "Гистограмма баллов"
+        constraints = [models.UniqueConstraint(fields=["stats", "score"], name="testscorebucket_stats_score_uniq")]
+
+    def __str__(self):
+        return f"{self.stats_id}: {self.score} - {self.count}"
+
+
+class TestBestScore(models.Model):
+    """Лучший результат студента по тесту, пересчитывается при каждой проверке его результатов"""
+
+    test = models.ForeignKey(Test, on_delete=models.CASCADE, related_name="best_scores", verbose_name="Тест")
+    student = models.ForeignKey(User, on_delete=models.CASCADE, related_name="best_scores", verbose_name="Студент")
+    score = models.IntegerField(default=0, verbose_name="Лучший балл")
+    max_score = models.IntegerField(default=0, verbose_name="Максимальный балл")
+    passed = models.BooleanField(default=False, verbose_name="Тест сдан")
+    attempts = models.IntegerField(default=0, verbose_name="Количество попыток")
+    last_attempt_at = models.DateTimeField(null=True, blank=True, verbose_name="Последняя попытка")
+
+    class Meta:
+        verbose_name = "Лучший результат"
+        verbose_name_plural = "Лучшие результаты"
+        constraints = [models.UniqueConstraint(fields=["test", "student"], name="testbestscore_test_student_uniq")]
+        # Рейтинг теста: первые N строк и подсчет студентов с баллом выше заданного читаются по индексу
+        indexes = [models.Index(fields=["test", "-score", "student"], name="testbestscore_rank_idx")]
+
+    def __str__(self):
+        return f"{self.student_id} - {self.test_id}: {self.score}"
+
+
+class CourseProgress(models.Model):
+    """Прогресс студента по курсу: сводка лучших результатов по тестам курса"""
+
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name="progress", verbose_name="Курс")
+    student = models.ForeignKey(User, on_delete=models.CASCADE, related_name="course_progress", verbose_name="Студент")
+    tests_completed = models.IntegerField(default=0, verbose_name="Пройдено тестов")
+    tests_passed = models.IntegerField(default=0, verbose_name="Сдано тестов")
+    total_score = models.IntegerField(default=0, verbose_name="Сумма лучших баллов")
+    last_activity = models.DateTimeField(null=True, blank=True, verbose_name="Последняя активность")
+
+    class Meta:
+        verbose_name = "Прогресс по курсу"
+        verbose_name_plural = "Прогресс по курсам"
+        constraints = [
+            models.UniqueConstraint(fields=["student", "course"], name="courseprogress_student_course_uniq")
+        ]
+        indexes = [models.Index(fields=["course", "-total_score", "student"], name="courseprogress_rank_idx")]
+
+    def __str__(self):
+        return f"{self.student_id} - {self.course_id}"
@@ -0,0 +1,66 @@
+from rest_framework.pagination import CursorPagination, _reverse_ordering
+
+
+class IdCursorPagination(CursorPagination):
+    """Keyset-пагинация по id с непрозрачным курсором: глубокие страницы стоят столько же, сколько первая.
+    Разбор курсора отделен от чтения страницы, поэтому страницу можно прочитать и асинхронно"""
+
+    ordering = "id"
+    page_size = 50
+    page_size_query_param = "page_size"
+    max_page_size = 200
+
+    def paginate_queryset(self, queryset, request, view=None):
+        page_queryset = self.get_page_queryset(queryset, request, view)
+        if page_queryset is None:
+            return None
+        return self.set_page(list(page_queryset))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        page_queryset = self.get_page_queryset(queryset, request, view)
+        if page_queryset is None:
+            return None
+        # chunk_size нужен aiterator для prefetch_related, страница читается одной пачкой
+        return self.set_page([item async for item in page_queryset.aiterator(chunk_size=self.page_size + 1)])
+
+    def get_page_queryset(self, queryset, request, view=None):
+        """Запрос страницы по курсору (как в CursorPagination.paginate_queryset) с одной лишней строкой"""
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+        self.offset, self.reverse, self.current_position = self.cursor or (0, False, None)
+
+        queryset = queryset.order_by(*(_reverse_ordering(self.ordering) if self.reverse else self.ordering))
+        if self.current_position is not None:
+            order = self.ordering[0]
+            lookup = "lt" if self.reverse != order.startswith("-") else "gt"
+            queryset = queryset.filter(**{f"{order.lstrip('-')}__{lookup}": self.current_position})
+        return queryset[self.offset : self.offset + self.page_size + 1]
+
+    def set_page(self, results):
+        """Страница и позиции соседних страниц по прочитанным строкам"""
+        self.page = results[: self.page_size]
+        if len(results) > len(self.page):
+            has_following_position = True
+            following_position = self._get_position_from_instance(results[-1], self.ordering)
+        else:
+            has_following_position = False
+            following_position = None
+
+        has_current_position = self.current_position is not None or self.offset > 0
+        if self.reverse:
+            self.page = list(reversed(self.page))
+            self.has_next, self.has_previous = has_current_position, has_following_position
+            self.next_position, self.previous_position = self.current_position, following_position
+        else:
+            self.has_next, self.has_previous = has_following_position, has_current_position
+            self.next_position, self.previous_position = following_position, self.current_position
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+        return self.page
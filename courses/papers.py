@@ -0,0 +1,52 @@
+import random
+
+from django.core.cache import cache
+
+from .models import Question, Test
+from .versions import get_version, versions_shared
+
+EXAM_PAPER_TIMEOUT = 60 * 60 * 24  # Бланк теста хранится в кэше сутки
+
+
+def build_exam_paper(test_id):
+    """Бланк теста без отметок о правильности: один запрос values_list, модели не создаются"""
+    rows = (
+        Question.objects.filter(test_id=test_id)
+        .order_by("id", "answers__id")
+        .values_list("id", "text", "answers__id", "answers__text")
+    )
+    questions = []
+    for question_id, text, answer_id, answer_text in rows:
+        if not questions or questions[-1]["id"] != question_id:
+            questions.append({"id": question_id, "text": text, "answers": []})
+        if answer_id is not None:
+            questions[-1]["answers"].append({"id": answer_id, "text": answer_text})
+    return questions
+
+
+def get_exam_paper(test_id):
+    """Бланк теста из кэша текущей версии теста. Возвращает None, если теста нет"""
+    if not versions_shared():
+        questions = build_exam_paper(test_id)
+        if not questions and not Test.objects.filter(pk=test_id).exists():
+            return None
+        return questions
+    cache_key = f"exam_paper:{test_id}:{get_version('test_content', test_id)}"
+    questions = cache.get(cache_key)
+    if questions is None:
+        questions = build_exam_paper(test_id)
+        if not questions and not Test.objects.filter(pk=test_id).exists():
+            return None
+        cache.set(cache_key, questions, EXAM_PAPER_TIMEOUT)
+    return questions
+
+
+def shuffle_exam_paper(questions, seed):
+    """Перемешивание вариантов ответов: одинаковый seed дает одинаковый порядок"""
+    rng = random.Random(seed)
+    shuffled = []
+    for question in questions:
+        answers = list(question["answers"])
+        rng.shuffle(answers)
+        shuffled.append({**question, "answers": answers})
+    return shuffled
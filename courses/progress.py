@@ -0,0 +1,257 @@
+import math
+from functools import reduce
+from itertools import islice
+from operator import or_
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, Max, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+from .models import Course, CourseProgress, Question, Test, TestBestScore, TestResult
+from .versions import bump_version
+
+PROGRESS_BATCH_SIZE = 500  # Количество пар (тест, студент), пересчитываемых за одну транзакцию
+REBUILD_CHUNK_SIZE = 5000  # Строк в одной вставке при пересборке таблиц
+
+
+def _pairs_filter(pairs, first, second):
+    """Условие на набор пар значений двух полей"""
+    return reduce(or_, (Q(**{first: a, second: b}) for a, b in pairs))
+
+
+def _chunks(iterable, size):
+    """Последовательные списки по size элементов"""
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def _pass_scores(test_ids, answer_keys=None):
+    """Максимальный и проходной баллы тестов: число вопросов и доля PASS_SCORE_RATIO от него.
+    Вопросы считаются по уже загруженным ключам ответов, для остальных тестов - одним запросом"""
+    answer_keys = answer_keys or {}
+    max_scores = {test_id: len(answer_keys[test_id].correct) for test_id in test_ids if test_id in answer_keys}
+    missing = [test_id for test_id in test_ids if test_id not in max_scores]
+    if missing:
+        max_scores.update(
+            Question.objects.filter(test_id__in=missing).values_list("test_id").annotate(Count("id")).order_by()
+        )
+    return {
+        test_id: (max_scores.get(test_id, 0), math.ceil(max_scores.get(test_id, 0) * settings.PASS_SCORE_RATIO))
+        for test_id in test_ids
+    }
+
+
+def best_score_totals(pairs):
+    """Лучший балл, число попыток и время последней попытки по парам (тест, студент)"""
+    return (
+        TestResult.objects.filter(_pairs_filter(pairs, "test_id", "student_id"), status=TestResult.STATUS_GRADED)
+        .values("test_id", "student_id")
+        .annotate(best=Max("score"), attempts=Count("id"), last=Max("completed_at"))
+        .order_by()
+    )
+
+
+def _refresh_best_scores(pairs, answer_keys=None):
+    """Пересчет лучших результатов по парам (тест, студент) из сохраненных результатов.
+    Строки блокируются до конца транзакции, поэтому параллельные проверки одной пары выполняются по очереди"""
+    TestBestScore.objects.bulk_create(
+        [TestBestScore(test_id=test_id, student_id=student_id) for test_id, student_id in pairs],
+        ignore_conflicts=True,
+    )
+    rows = list(
+        TestBestScore.objects.select_for_update()
+        .filter(_pairs_filter(pairs, "test_id", "student_id"))
+        .order_by("test_id", "student_id")
+    )
+    totals = {(row["test_id"], row["student_id"]): row for row in best_score_totals(pairs)}
+
+    pass_scores = _pass_scores({test_id for test_id, _ in pairs}, answer_keys)
+    updated = []
+    removed = []
+    for row in rows:
+        total = totals.get((row.test_id, row.student_id))
+        if total is None:  # Результатов по тесту больше нет
+            removed.append(row.pk)
+            continue
+        row.max_score, pass_score = pass_scores[row.test_id]
+        row.score = total["best"]
+        row.passed = row.score >= pass_score
+        row.attempts = total["attempts"]
+        row.last_attempt_at = total["last"]
+        updated.append(row)
+
+    TestBestScore.objects.bulk_update(updated, ["score", "max_score", "passed", "attempts", "last_attempt_at"])
+    if removed:
+        TestBestScore.objects.filter(pk__in=removed).delete()
+
+
+def _refresh_course_progress(pairs):
+    """Пересчет прогресса по парам (курс, студент) из лучших результатов по тестам курса"""
+    CourseProgress.objects.bulk_create(
+        [CourseProgress(course_id=course_id, student_id=student_id) for course_id, student_id in pairs],
+        ignore_conflicts=True,
+    )
+    rows = list(
+        CourseProgress.objects.select_for_update()
+        .filter(_pairs_filter(pairs, "course_id", "student_id"))
+        .order_by("course_id", "student_id")
+    )
+    totals = {
+        (row["test__lesson__course_id"], row["student_id"]): row
+        for row in TestBestScore.objects.filter(_pairs_filter(pairs, "test__lesson__course_id", "student_id"))
+        .values("test__lesson__course_id", "student_id")
+        .annotate(
+            completed=Count("id"),
+            passed=Count("id", filter=Q(passed=True)),
+            score=Sum("score"),
+            last=Max("last_attempt_at"),
+        )
+        .order_by()
+    }
+
+    updated = []
+    removed = []
+    for row in rows:
+        total = totals.get((row.course_id, row.student_id))
+        if total is None:
+            removed.append(row.pk)
+            continue
+        row.tests_completed = total["completed"]
+        row.tests_passed = total["passed"]
+        row.total_score = total["score"]
+        row.last_activity = total["last"]
+        updated.append(row)
+
+    CourseProgress.objects.bulk_update(updated, ["tests_completed", "tests_passed", "total_score", "last_activity"])
+    if removed:
+        CourseProgress.objects.filter(pk__in=removed).delete()
+
+
+def refresh_progress(pairs, batch_size=PROGRESS_BATCH_SIZE, answer_keys=None):
+    """Пересчет лучших результатов и прогресса по курсам для пар (тест, студент).
+    answer_keys - уже загруженные ключи ответов {id теста: AnswerKey}, по ним считается максимальный балл"""
+    pairs = sorted(set(pairs))
+    for start in range(0, len(pairs), batch_size):
+        batch = pairs[start : start + batch_size]
+        courses = dict(
+            Test.objects.filter(pk__in={test_id for test_id, _ in batch}).values_list("id", "lesson__course_id")
+        )
+        batch = [(test_id, student_id) for test_id, student_id in batch if test_id in courses]
+        if not batch:
+            continue
+        course_pairs = sorted({(courses[test_id], student_id) for test_id, student_id in batch})
+        with transaction.atomic():
+            _refresh_best_scores(batch, answer_keys)
+            _refresh_course_progress(course_pairs)
+        # Версии меняются после записи лучших результатов: иначе параллельный запрос успел бы закэшировать
+        # прежний рейтинг под новой версией
+        for test_id in {test_id for test_id, _ in batch}:
+            bump_version("test_results", test_id)  # Рейтинг теста и анализ вопросов
+        for course_id in {course_id for course_id, _ in course_pairs}:
+            bump_version("course_results", course_id)  # Рейтинг курса
+
+
+def refresh_course_progress(course_id):
+    """Пересчет прогресса всех студентов курса одним UPDATE по лучшим результатам, например после удаления теста
+    или урока вместе с лучшими результатами по ним. Строки без оставшихся результатов удаляются"""
+    best = (
+        TestBestScore.objects.filter(test__lesson__course_id=OuterRef("course_id"), student_id=OuterRef("student_id"))
+        .order_by()
+        .values("student_id")
+    )
+
+    def total(aggregate):
+        return Subquery(best.annotate(value=aggregate).values("value"))
+
+    progress = CourseProgress.objects.filter(course_id=course_id)
+    with transaction.atomic():
+        progress.update(
+            tests_completed=Coalesce(total(Count("id")), 0),
+            tests_passed=Coalesce(total(Count("id", filter=Q(passed=True))), 0),
+            total_score=Coalesce(total(Sum("score")), 0),
+            last_activity=total(Max("last_attempt_at")),
+        )
+        progress.filter(tests_completed=0).delete()
+    bump_version("course_results", course_id)
+
+
+def _build_progress(chunk_size):
+    """Заполнение пустых таблиц лучших результатов и прогресса по всем сохраненным результатам: запрос
+    с группировкой по парам (тест, студент), затем по парам (курс, студент), строки вставляются пачками.
+    Возвращает число пар"""
+    # Максимальный балл - число вопросов теста, проходной - доля PASS_SCORE_RATIO от него
+    max_scores = dict(Question.objects.values_list("test_id").annotate(Count("id")).order_by())
+    best = (
+        TestResult.objects.filter(status=TestResult.STATUS_GRADED, score__isnull=False)
+        .values("test_id", "student_id")
+        .annotate(best=Max("score"), attempts=Count("id"), last=Max("completed_at"))
+        .order_by()
+    )
+    count = 0
+    for rows in _chunks(best.iterator(chunk_size=chunk_size), chunk_size):
+        best_scores = []
+        for row in rows:
+            max_score = max_scores.get(row["test_id"], 0)
+            best_scores.append(
+                TestBestScore(
+                    test_id=row["test_id"],
+                    student_id=row["student_id"],
+                    score=row["best"],
+                    max_score=max_score,
+                    passed=row["best"] >= math.ceil(max_score * settings.PASS_SCORE_RATIO),
+                    attempts=row["attempts"],
+                    last_attempt_at=row["last"],
+                )
+            )
+        TestBestScore.objects.bulk_create(best_scores)
+        count += len(best_scores)
+
+    totals = (
+        TestBestScore.objects.values("test__lesson__course_id", "student_id")
+        .annotate(
+            completed=Count("id"),
+            passed=Count("id", filter=Q(passed=True)),
+            score=Sum("score"),
+            last=Max("last_attempt_at"),
+        )
+        .order_by()
+    )
+    for rows in _chunks(totals.iterator(chunk_size=chunk_size), chunk_size):
+        CourseProgress.objects.bulk_create(
+            [
+                CourseProgress(
+                    course_id=row["test__lesson__course_id"],
+                    student_id=row["student_id"],
+                    tests_completed=row["completed"],
+                    tests_passed=row["passed"],
+                    total_score=row["score"],
+                    last_activity=row["last"],
+                )
+                for row in rows
+            ]
+        )
+    return count
+
+
+def rebuild_progress(chunk_size=REBUILD_CHUNK_SIZE):
+    """Пересборка лучших результатов и прогресса по всем сохраненным результатам в одной транзакции:
+    таблицы очищаются и заполняются заново запросами с группировкой. Возвращает число пар (тест, студент)"""
+    with transaction.atomic():
+        if connection.vendor == "postgresql":
+            tables = (TestBestScore._meta.db_table, CourseProgress._meta.db_table)
+            with connection.cursor() as cursor:
+                # TRUNCATE не выполняется, пока в транзакции есть отложенные проверки внешних ключей
+                cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+                cursor.execute(f"TRUNCATE {', '.join(connection.ops.quote_name(table) for table in tables)}")
+                cursor.execute("SET CONSTRAINTS ALL DEFERRED")
+        else:
+            CourseProgress.objects.all().delete()
+            TestBestScore.objects.all().delete()
+        count = _build_progress(chunk_size)
+        for test_id in Test.objects.values_list("id", flat=True).iterator():
+            bump_version("test_results", test_id)
+        for course_id in Course.objects.values_list("id", flat=True).iterator():
+            bump_version("course_results", course_id)
+    return count
@@ -1,6 +1,6 @@
 from rest_framework import serializers
 
-from .models import Answer, Course, Lesson, Question, Test, TestResult
+from .models import Answer, Course, CourseProgress, Lesson, Question, Test, TestBestScore, TestResult, TestStats
 
 
 class CourseSerializer(serializers.ModelSerializer):
@@ -65,15 +65,82 @@ class QuestionSerializer(serializers.ModelSerializer):
         fields = "__all__"
 
 
+class TestPaperSerializer(serializers.ModelSerializer):
+    """Сериализатор теста со всеми вопросами и ответами"""
+
+    questions = QuestionSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = Test
+        fields = "__all__"
+
+
 class TestResultSerializer(serializers.ModelSerializer):
     """Сериализатор результата теста"""
 
-    answers = serializers.JSONField(read_only=True)  # JSON-объект с ответами пользователя только для чтения
+    # ID выбранных ответов, распакованные из компактного представления (только для чтения)
+    answers = serializers.ListField(child=serializers.IntegerField(), source="answer_ids", read_only=True)
 
     class Meta:
         model = TestResult
-        fields = ["student", "test", "answers", "score"]
+        fields = ["id", "student", "test", "answers", "score", "status"]
+        read_only_fields = ["status"]
         extra_kwargs = {
             "student": {"required": False},  # Убираем обязательность
             "score": {"required": False},
         }
+
+
+class TestStatsSerializer(serializers.ModelSerializer):
+    """Сериализатор статистики баллов теста"""
+
+    mean = serializers.FloatField(read_only=True)
+    stddev = serializers.FloatField(read_only=True)
+    histogram = serializers.SerializerMethodField()
+
+    class Meta:
+        model = TestStats
+        fields = ["test", "count", "mean", "stddev", "min_score", "max_score", "histogram"]
+
+    def get_histogram(self, stats):
+        """Количество результатов для каждого балла"""
+        return list(stats.buckets.filter(count__gt=0).order_by("score").values("score", "count"))
+
+
+class TestBestScoreSerializer(serializers.ModelSerializer):
+    """Сериализатор лучшего результата студента по тесту"""
+
+    class Meta:
+        model = TestBestScore
+        fields = ["test", "score", "max_score", "passed", "attempts", "last_attempt_at"]
+
+
+class CourseProgressSerializer(serializers.ModelSerializer):
+    """Сериализатор прогресса студента по курсу"""
+
+    tests_total = serializers.SerializerMethodField()
+    tests = serializers.SerializerMethodField()
+
+    class Meta:
+        model = CourseProgress
+        fields = [
+            "course",
+            "student",
+            "tests_total",
+            "tests_completed",
+            "tests_passed",
+            "total_score",
+            "last_activity",
+            "tests",
+        ]
+
+    def get_tests_total(self, progress):
+        """Количество тестов в курсе"""
+        return Test.objects.filter(lesson__course_id=progress.course_id).count()
+
+    def get_tests(self, progress):
+        """Лучшие результаты по тестам курса"""
+        best_scores = TestBestScore.objects.filter(
+            student_id=progress.student_id, test__lesson__course_id=progress.course_id
+        ).order_by("test_id")
+        return TestBestScoreSerializer(best_scores, many=True).data
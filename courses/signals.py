@@ -0,0 +1,181 @@
+from django.db import transaction
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from users.models import User
+
+from .grading import invalidate_answer_key, results_graded, schedule_regrade
+from .models import Answer, Course, Lesson, Question, Test, TestResult
+from .progress import refresh_course_progress, refresh_progress
+from .stats import apply_graded_results, update_test_stats
+from .versions import bump_version
+
+
+def _answer_test_id(answer):
+    """ID теста, к которому относится ответ"""
+    if Answer.question.is_cached(answer):
+        return answer.question.test_id
+    return Question.objects.filter(pk=answer.question_id).values_list("test_id", flat=True).first()
+
+
+def _deleted_directly(origin, *models):
+    """Удаление начато с объекта одной из моделей, а не каскадом от другой модели"""
+    if isinstance(origin, QuerySet):
+        return origin.model in models
+    return isinstance(origin, models)
+
+
+@receiver(pre_save, sender=Question)
+def question_moved(sender, instance, **kwargs):
+    """При переносе вопроса в другой тест сбрасываем ключ прежнего теста"""
+    instance._previous_test_id = None
+    if instance.pk is None:
+        return
+    old_test_id = Question.objects.filter(pk=instance.pk).values_list("test_id", flat=True).first()
+    if old_test_id is not None and old_test_id != instance.test_id:
+        instance._previous_test_id = old_test_id
+        invalidate_answer_key(old_test_id)
+
+
+@receiver(post_save, sender=Question)
+def question_saved(sender, instance, **kwargs):
+    """Сброс ключа ответов теста при изменении вопроса, после переноса результаты обоих тестов пересчитываются"""
+    invalidate_answer_key(instance.test_id)
+    if instance._previous_test_id is not None:
+        schedule_regrade(instance._previous_test_id, {instance.pk})
+        schedule_regrade(instance.test_id, {instance.pk})
+
+
+@receiver(post_delete, sender=Question)
+def question_deleted(sender, instance, origin=None, **kwargs):
+    """Сброс ключа ответов и пересчет результатов теста при удалении вопроса"""
+    invalidate_answer_key(instance.test_id)
+    if _deleted_directly(origin, Question):
+        schedule_regrade(instance.test_id, {instance.pk})
+
+
+@receiver(pre_save, sender=Answer)
+def answer_moved(sender, instance, **kwargs):
+    """Запоминаем прежние вопрос и правильность ответа, при переносе сбрасываем ключ прежнего теста"""
+    instance._previous_state = None
+    if instance.pk is None:
+        return
+    previous = Answer.objects.filter(pk=instance.pk).values_list("question_id", "is_correct").first()
+    if previous is None:
+        return
+    old_question_id, old_is_correct = previous
+    old_test_id = None
+    if old_question_id != instance.question_id:
+        old_test_id = Question.objects.filter(pk=old_question_id).values_list("test_id", flat=True).first()
+        invalidate_answer_key(old_test_id)
+    instance._previous_state = (old_question_id, old_is_correct, old_test_id)
+
+
+@receiver(post_save, sender=Answer)
+def answer_saved(sender, instance, created, **kwargs):
+    """Сброс ключа ответов теста и пересчет результатов, если изменился набор правильных ответов"""
+    test_id = _answer_test_id(instance)
+    invalidate_answer_key(test_id)
+    previous = instance._previous_state
+    if previous is None:
+        # Новый неправильный вариант еще никто не выбирал, баллы не меняются
+        if created and instance.is_correct:
+            schedule_regrade(test_id, {instance.question_id}, correct_added={instance.question_id: 1})
+        return
+    old_question_id, old_is_correct, old_test_id = previous
+    question_id = instance.question_id
+    if old_question_id != question_id:
+        schedule_regrade(old_test_id, {old_question_id}, {instance.pk}, {old_question_id: -int(old_is_correct)})
+        schedule_regrade(test_id, {question_id}, correct_added={question_id: int(instance.is_correct)})
+    elif old_is_correct != instance.is_correct:
+        schedule_regrade(test_id, {question_id}, correct_added={question_id: 1 if instance.is_correct else -1})
+
+
+@receiver(post_delete, sender=Answer)
+def answer_deleted(sender, instance, origin=None, **kwargs):
+    """Сброс ключа ответов теста и пересчет результатов, в которых был выбран удаленный ответ.
+    При каскадном удалении ключ сбрасывается обработчиком удаления вопроса"""
+    if not _deleted_directly(origin, Answer):
+        return
+    test_id = _answer_test_id(instance)
+    invalidate_answer_key(test_id)
+    schedule_regrade(test_id, {instance.question_id}, {instance.pk}, {instance.question_id: -int(instance.is_correct)})
+
+
+@receiver(post_save, sender=Course)
+@receiver(post_delete, sender=Course)
+@receiver(post_save, sender=Lesson)
+@receiver(post_delete, sender=Lesson)
+@receiver(post_save, sender=Test)
+@receiver(post_delete, sender=Test)
+@receiver(post_save, sender=Question)
+@receiver(post_delete, sender=Question)
+@receiver(post_save, sender=Answer)
+@receiver(post_delete, sender=Answer)
+def content_changed(sender, instance, **kwargs):
+    """Смена версий коллекции и объекта для ETag и кэша ответов"""
+    model_name = sender._meta.model_name
+    bump_version(model_name)
+    bump_version(model_name, instance.pk)
+    if sender is Answer:  # Ответы выводятся внутри вопроса
+        bump_version("question")
+        bump_version("question", instance.question_id)
+        previous = getattr(instance, "_previous_state", None)
+        if previous is not None and previous[0] != instance.question_id:
+            bump_version("question", previous[0])  # Ответ перенесен, прежний вопрос больше его не выводит
+
+
+@receiver(pre_save, sender=User)
+def owner_email_changed(sender, instance, update_fields=None, **kwargs):
+    """Email владельца выводится в курсах и уроках, при его смене их ответы устаревают"""
+    if instance.pk is None or (update_fields is not None and "email" not in update_fields):
+        return
+    old_email = User.objects.filter(pk=instance.pk).values_list("email", flat=True).first()
+    if old_email is not None and old_email != instance.email:
+        bump_version("user_email")
+
+
+@receiver(results_graded)
+def graded_results_stats(sender, results, previous_scores, **kwargs):
+    """Учет новых и пересчитанных баллов в статистике тестов"""
+    apply_graded_results(results, previous_scores)
+
+
+@receiver(results_graded)
+def graded_results_progress(sender, results, answer_keys=None, **kwargs):
+    """Пересчет лучших результатов и прогресса студентов по курсам, затем смена версий результатов
+    для рейтингов и анализа вопросов"""
+    refresh_progress(((result.test_id, result.student_id) for result in results), answer_keys=answer_keys)
+
+
+@receiver(post_delete, sender=TestResult)
+def result_deleted(sender, instance, origin=None, **kwargs):
+    """Снятие балла удаленного результата со статистики. При удалении теста статистика удаляется вместе с ним"""
+    if instance.score is None or _deleted_directly(origin, Course, Lesson, Test):
+        return
+    update_test_stats(instance.test_id, [], [instance.score])
+    if _deleted_directly(origin, TestResult):
+        refresh_progress([(instance.test_id, instance.student_id)])  # Меняет и версию результатов
+    else:
+        # При удалении студента его лучшие результаты и прогресс удаляются каскадом
+        bump_version("test_results", instance.test_id)
+
+
+@receiver(post_delete, sender=Test)
+def test_deleted(sender, instance, origin=None, **kwargs):
+    """Пересчет прогресса студентов курса после удаления теста, в том числе вместе с уроком: лучшие результаты
+    по тесту удалены каскадом. Курс пересчитывается один раз на удаление, после фиксации транзакции.
+    При удалении курса прогресс удаляется вместе с ним"""
+    if _deleted_directly(origin, Course):
+        return
+    if isinstance(origin, Lesson) and origin.pk == instance.lesson_id:
+        course_id = origin.course_id
+    else:
+        course_id = Lesson.objects.filter(pk=instance.lesson_id).values_list("course_id", flat=True).first()
+    # Тесты урока или QuerySet удаляются одним вызовом delete, пересчет курса запоминается на его origin
+    scheduled = origin.__dict__.setdefault("_progress_courses", set()) if origin is not None else set()
+    if course_id is None or course_id in scheduled:
+        return
+    scheduled.add(course_id)
+    transaction.on_commit(lambda: refresh_course_progress(course_id))
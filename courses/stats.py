@@ -0,0 +1,82 @@
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.db.models import Count, F, Max, Min, Sum
+from django.db.models.functions import Coalesce, Greatest, Least
+
+from .models import TestResult, TestScoreBucket, TestStats
+
+
+def update_test_stats(test_id, added, removed=()):
+    """Инкрементальное обновление агрегатов и гистограммы теста: added - новые баллы, removed - снятые баллы.
+    Недостающие строки вставляются с пропуском конфликтов, затем обновляются F-выражениями,
+    поэтому число запросов не зависит от того, собиралась ли статистика раньше"""
+    count = len(added) - len(removed)
+    total = sum(added) - sum(removed)
+    squares = sum(score * score for score in added) - sum(score * score for score in removed)
+    updates = {"count": F("count") + count, "total": F("total") + total, "total_squares": F("total_squares") + squares}
+    if added and not removed:
+        low, high = min(added), max(added)
+        updates["min_score"] = Least(Coalesce(F("min_score"), low), low)
+        updates["max_score"] = Greatest(Coalesce(F("max_score"), high), high)
+
+    histogram = Counter(added)
+    histogram.subtract(removed)
+    with transaction.atomic():
+        if added:
+            TestStats.objects.bulk_create([TestStats(test_id=test_id)], ignore_conflicts=True)
+        if not TestStats.objects.filter(test_id=test_id).update(**updates):
+            return  # Статистика теста не собиралась, ее построит команда rebuild_test_stats
+
+        new_scores = sorted(score for score, delta in histogram.items() if delta > 0)
+        if new_scores:
+            TestScoreBucket.objects.bulk_create(
+                [TestScoreBucket(stats_id=test_id, score=score) for score in new_scores], ignore_conflicts=True
+            )
+        for score, delta in sorted(histogram.items()):
+            if delta:
+                TestScoreBucket.objects.filter(stats_id=test_id, score=score).update(count=F("count") + delta)
+
+        if removed:
+            # После снятия баллов минимум и максимум пересчитываются по гистограмме
+            bounds = TestScoreBucket.objects.filter(stats_id=test_id, count__gt=0).aggregate(
+                low=Min("score"), high=Max("score")
+            )
+            TestStats.objects.filter(test_id=test_id).update(min_score=bounds["low"], max_score=bounds["high"])
+
+
+def apply_graded_results(results, previous_scores=None):
+    """Учет проверенных результатов в статистике тестов. previous_scores - {id результата: прежний балл}
+    для пересчитанных результатов, их прежние баллы снимаются"""
+    previous_scores = previous_scores or {}
+    added = defaultdict(list)
+    removed = defaultdict(list)
+    for result in results:
+        if result.score is None:
+            continue
+        added[result.test_id].append(result.score)
+        if result.id in previous_scores:
+            removed[result.test_id].append(previous_scores[result.id])
+    for test_id in sorted(added):
+        update_test_stats(test_id, added[test_id], removed[test_id])
+
+
+def rebuild_test_stats(test_id):
+    """Пересборка статистики теста по всем проверенным результатам"""
+    graded = TestResult.objects.filter(test_id=test_id, status=TestResult.STATUS_GRADED, score__isnull=False)
+    totals = graded.aggregate(
+        count=Count("id"),
+        total=Coalesce(Sum("score"), 0),
+        total_squares=Coalesce(Sum(F("score") * F("score")), 0),
+        min_score=Min("score"),
+        max_score=Max("score"),
+    )
+    histogram = graded.values_list("score").annotate(count=Count("id")).order_by("score")
+
+    with transaction.atomic():
+        stats, _ = TestStats.objects.update_or_create(test_id=test_id, defaults=totals)
+        stats.buckets.all().delete()
+        TestScoreBucket.objects.bulk_create(
+            [TestScoreBucket(stats=stats, score=score, count=count) for score, count in histogram]
+        )
+    return stats
@@ -1,10 +1,56 @@
+import asyncio
+import io
+import json
+import os
+import re
+import tempfile
+import threading
+from contextlib import ExitStack
+from importlib import import_module
+from unittest import skipUnless
+from unittest.mock import patch
+
+from asgiref.sync import sync_to_async
+from django.apps import apps
+from django.contrib.admin import site
 from django.contrib.auth.models import Group
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import DEFAULT_DB_ALIAS, connection, connections, transaction
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from rest_framework import status
+from rest_framework.exceptions import ParseError
 from rest_framework.response import Response
 from rest_framework.test import APIClient, APITestCase
 
-from courses.models import Answer, Course, Lesson, Question, Test, TestResult
+from config import diagnostics, instrumentation, metrics
+from config.instrumentation import recording
+from config.trigram import trigram_installed
+from courses.analytics import get_test_analysis, unpack_rows
+from courses.checks import check_cache_shared, check_grading_cache
+from courses.encoding import pack_ids, unpack_ids
+from courses.grading import AnswerKey, get_answer_key, regrade_chunk, regrade_results
+from courses.ingest import iter_json_array
+from courses.leaderboards import test_leaderboard
+from courses.models import (
+    Answer,
+    Course,
+    CourseProgress,
+    Lesson,
+    Question,
+    Test,
+    TestBestScore,
+    TestResult,
+    TestStats,
+)
+from courses.papers import get_exam_paper
+from courses.progress import best_score_totals, refresh_course_progress
+from courses.serializers import AnswerSerializer
+from courses.versions import bump_version, get_version
 from users.models import User
+from users.roles import STUDENT, aload_roles
+from users.tokens import RoleRefreshToken
 
 
 class LessonAPITestCase(APITestCase):
@@ -46,6 +92,27 @@ class LessonAPITestCase(APITestCase):
         response = self.client.get(self.lesson_list_url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
+    def test_lesson_list_cursor_pagination(self):
+        """Список уроков отдается страницами по курсору"""
+        other_course = Course.objects.create(name="Другой курс", description="Описание", owner=self.teacher)
+        for number in range(4):
+            Lesson.objects.create(title=f"Урок {number}", content="Описание", course=self.course, owner=self.teacher)
+        Lesson.objects.create(title="Чужой урок", content="Описание", course=other_course, owner=self.teacher)
+
+        self.client.force_authenticate(user=self.student)
+        response = self.client.get(self.lesson_list_url, {"course": self.course.id, "page_size": 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        ids = []
+        while True:
+            ids += [lesson["id"] for lesson in response.data["results"]]
+            if not response.data["next"]:
+                break
+            response = self.client.get(response.data["next"])
+
+        expected = Lesson.objects.filter(course=self.course).order_by("id").values_list("id", flat=True)
+        self.assertEqual(ids, list(expected))
+
     def test_lesson_create(self):
         """Тест создания урока (только для преподавателя)"""
         self.client.force_authenticate(user=self.teacher)
@@ -408,3 +475,1437 @@ class TestSubmitApiViewTest(APITestCase):
         # Проверяем, что API вернул правильный результат
         self.assertIn("score", response.data)  # Проверяем, что в ответе есть поле "score"
         self.assertEqual(response.data["score"], 0)  # Проверяем, что значение "score" равно 0
+
+    def test_submit_test_stores_answers(self):
+        """Ответы сохраняются в результате в компактном виде"""
+        self.client.force_authenticate(user=self.user)
+        answers = {
+            str(self.question1.id): [self.correct_answer1.id, self.incorrect_answer1.id],
+            str(self.question2.id): [self.correct_answer2.id],
+        }
+
+        response = self.client.post(self.test_submit_url, {"test": self.test.id, "answers": answers}, format="json")
+
+        expected = sorted([self.correct_answer1.id, self.incorrect_answer1.id, self.correct_answer2.id])
+        self.assertEqual(response.data["answers"], expected)
+        self.assertEqual(TestResult.objects.get().answer_ids, expected)
+
+    def test_pack_ids(self):
+        """Упаковка id ответов: разности в формате varint"""
+        ids = [5, 1, 300, 70000, 70001, 2**40]
+        packed = pack_ids(ids)
+        self.assertEqual(unpack_ids(packed), sorted(ids))
+        self.assertEqual(unpack_ids(memoryview(packed)), sorted(ids))
+        self.assertEqual(len(pack_ids(range(1000, 1100))), 2 + 99)
+        self.assertEqual(pack_ids([]), b"")
+
+    def test_submit_test_foreign_answer(self):
+        """Ответ, не относящийся к вопросу, отклоняется при проверке"""
+        self.client.force_authenticate(user=self.user)
+
+        answers = {str(self.question1.id): [self.correct_answer2.id]}
+        response = self.client.post(self.test_submit_url, {"test": self.test.id, "answers": answers}, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn(str(self.question1.id), response.data["answers"])
+        self.assertFalse(TestResult.objects.exists())
+
+    def test_submit_query_count_is_constant(self):
+        """Количество запросов при выполнении теста не зависит от числа вопросов"""
+
+        def submit():
+            self.client.force_authenticate(user=User.objects.get(pk=self.user.pk))
+            answers = {
+                str(question.id): [answer.id for answer in question.answers.filter(is_correct=True)]
+                for question in self.test.questions.all()
+            }
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.post(
+                    self.test_submit_url, {"test": self.test.id, "answers": answers}, format="json"
+                )
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+            self.assertEqual(response.data["score"], self.test.questions.count())
+            return len(queries)
+
+        small = submit()
+
+        # Добавляем 50 вопросов с ответами
+        for number in range(50):
+            question = Question.objects.create(test=self.test, text=f"Дополнительный вопрос {number}")
+            Answer.objects.create(question=question, text="Правильный", is_correct=True)
+            Answer.objects.create(question=question, text="Неправильный", is_correct=False)
+
+        self.assertEqual(submit(), small)
+
+    @override_settings(GRADING_ASYNC=True)
+    def test_submit_test_async(self):
+        """Асинхронная проверка: результат принимается в очередь и оценивается обработчиком"""
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        shared_cache = {
+            "default": {"BACKEND": "django.core.cache.backends.filebased.FileBasedCache", "LOCATION": cache_dir.name}
+        }
+        with self.settings(CACHES=shared_cache):  # Обработчик очереди требует общего кэша
+            self.client.force_authenticate(user=self.user)
+            answers = {str(self.question1.id): [self.correct_answer1.id]}
+
+            response = self.client.post(
+                self.test_submit_url, {"test": self.test.id, "answers": answers}, format="json"
+            )
+            self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+            self.assertEqual(response.data["status"], TestResult.STATUS_PENDING)
+            self.assertIsNone(response.data["score"])
+
+            result_url = f"/courses/tests/results/{response.data['id']}/"
+            self.assertEqual(self.client.get(result_url).data["status"], TestResult.STATUS_PENDING)
+
+            call_command("grade_results", workers=1, once=True, stdout=io.StringIO())
+
+            response = self.client.get(result_url)
+            self.assertEqual(response.data["status"], TestResult.STATUS_GRADED)
+            self.assertEqual(response.data["score"], 1)
+            self.assertFalse(TestResult.objects.filter(status=TestResult.STATUS_PENDING).exists())
+
+    @override_settings(GRADING_ASYNC=True)
+    def test_grading_worker_requires_shared_cache(self):
+        """С кэшем процесса обработчик очереди не запускается, проверка конфигурации сообщает об ошибке"""
+        with self.assertRaises(CommandError):
+            call_command("grade_results", workers=1, once=True, stdout=io.StringIO())
+        self.assertEqual([message.id for message in check_grading_cache(None)], ["courses.E001"])
+
+    def test_result_visible_only_to_owner(self):
+        """Студент не видит чужие результаты"""
+        other = User.objects.create(email="other@example.com", password="password123")
+        other.groups.add(self.student_group)
+        result = TestResult.objects.create(test=self.test, student=other, score=1)
+
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get(f"/courses/tests/results/{result.id}/")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    @override_settings(CACHE_SINGLE_PROCESS=True)
+    def test_exam_paper_hides_correct_answers(self):
+        """Бланк теста не содержит отметок о правильности и кэшируется"""
+        self.client.force_authenticate(user=self.user)
+        exam_url = f"/courses/tests/{self.test.id}/exam/"
+
+        response = self.client.get(exam_url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [question["id"] for question in response.data["questions"]], [self.question1.id, self.question2.id]
+        )
+        self.assertEqual(
+            response.data["questions"][0]["answers"],
+            [
+                {"id": self.correct_answer1.id, "text": "Правильный 1"},
+                {"id": self.incorrect_answer1.id, "text": "Неправильный 1"},
+            ],
+        )
+
+        with self.assertNumQueries(0):  # Роли запомнены на пользователе, бланк взят из кэша
+            self.client.get(exam_url)
+
+        # Изменение ответа сбрасывает закэшированный бланк
+        self.incorrect_answer1.text = "Исправленный"
+        self.incorrect_answer1.save()
+        response = self.client.get(exam_url)
+        self.assertEqual(response.data["questions"][0]["answers"][1]["text"], "Исправленный")
+
+    def test_exam_paper_shuffle_is_deterministic(self):
+        """Перемешивание с одинаковым seed дает одинаковый порядок вариантов"""
+        self.client.force_authenticate(user=self.user)
+        exam_url = f"/courses/tests/{self.test.id}/exam/"
+        for number in range(6):
+            Answer.objects.create(question=self.question1, text=f"Вариант {number}")
+
+        first = self.client.get(exam_url, {"seed": 42}).data["questions"]
+        second = self.client.get(exam_url, {"seed": 42}).data["questions"]
+        original = self.client.get(exam_url).data["questions"]
+
+        self.assertEqual(first, second)
+        self.assertNotEqual(first[0]["answers"], original[0]["answers"])
+        self.assertCountEqual(first[0]["answers"], original[0]["answers"])
+
+    def test_exam_paper_not_found(self):
+        """Бланк несуществующего теста"""
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get("/courses/tests/0/exam/")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+@override_settings(CACHE_SINGLE_PROCESS=True)
+class AnswerKeyCacheTest(APITestCase):
+    """Кэширование ключа ответов теста"""
+
+    def setUp(self):
+        self.teacher = User.objects.create(email="teacher@example.com", password="password123")
+        self.course = Course.objects.create(name="Курс", description="Описание курса", owner=self.teacher)
+        self.lesson = Lesson.objects.create(
+            title="Урок 1", content="Описание урока", course=self.course, owner=self.teacher
+        )
+        self.test = Test.objects.create(
+            title="Тест", description="Содержание теста", owner=self.teacher, lesson=self.lesson
+        )
+        self.question = Question.objects.create(test=self.test, text="Вопрос")
+        self.correct = Answer.objects.create(question=self.question, text="Правильный", is_correct=True)
+        self.incorrect = Answer.objects.create(question=self.question, text="Неправильный", is_correct=False)
+
+    def test_answer_key_is_cached(self):
+        """Повторное получение ключа не обращается к базе"""
+        answer_key = get_answer_key(self.test.id)
+        self.assertEqual(answer_key.correct, {self.question.id: frozenset({self.correct.id})})
+
+        with self.assertNumQueries(0):
+            self.assertEqual(get_answer_key(self.test.id).version, answer_key.version)
+
+    def test_answer_key_invalidated_on_answer_change(self):
+        """Изменение правильного ответа сбрасывает ключ"""
+        version = get_answer_key(self.test.id).version
+
+        self.incorrect.is_correct = True
+        self.incorrect.save()
+
+        answer_key = get_answer_key(self.test.id)
+        self.assertNotEqual(answer_key.version, version)
+        self.assertEqual(answer_key.correct[self.question.id], frozenset({self.correct.id, self.incorrect.id}))
+
+    def test_answer_key_invalidated_on_question_delete(self):
+        """Удаление вопроса сбрасывает ключ"""
+        get_answer_key(self.test.id)
+        self.question.delete()
+        self.assertEqual(get_answer_key(self.test.id).correct, {})
+
+    @override_settings(CACHE_SINGLE_PROCESS=False)
+    def test_answer_key_not_cached_in_process_cache(self):
+        """В кэше процесса ключ не хранится: каждое получение читает базу"""
+        get_answer_key(self.test.id)
+        with self.assertNumQueries(1):
+            self.assertEqual(get_answer_key(self.test.id).correct, {self.question.id: frozenset({self.correct.id})})
+
+
+class ListQueryCountTest(APITestCase):
+    """Количество запросов списков не должно зависеть от числа возвращаемых строк"""
+
+    list_urls = (
+        "/courses/",
+        "/courses/lessons/",
+        "/courses/tests/",
+        "/courses/questions/",
+        "/courses/answers/",
+    )
+
+    def setUp(self):
+        self.student = User.objects.create(email="student@example.com", password="password123")
+        self.student.groups.add(Group.objects.create(name="Студенты"))
+        self.rows = 0
+        self.add_rows(1)
+
+    def add_rows(self, count):
+        """Создает цепочки курс-урок-тест-вопрос-ответ, у каждой свой владелец"""
+        for _ in range(count):
+            self.rows += 1
+            owner = User.objects.create(email=f"owner{self.rows}@example.com", password="password123")
+            course = Course.objects.create(name=f"Курс {self.rows}", description="Описание", owner=owner)
+            lesson = Lesson.objects.create(title="Урок", content="Описание", course=course, owner=owner)
+            test = Test.objects.create(title="Тест", description="Описание", owner=owner, lesson=lesson)
+            question = Question.objects.create(test=test, text="Вопрос")
+            Answer.objects.create(question=question, text="Ответ", is_correct=True)
+
+    def count_queries(self, url):
+        self.client.force_authenticate(user=User.objects.get(pk=self.student.pk))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data["results"]), self.rows)
+        return len(queries)
+
+    def test_list_query_count_does_not_grow(self):
+        """После добавления строк списки выполняют столько же запросов"""
+        before = {url: self.count_queries(url) for url in self.list_urls}
+        self.add_rows(10)
+        for url in self.list_urls:
+            with self.subTest(url=url):
+                self.assertEqual(self.count_queries(url), before[url])
+
+    def test_retrieve_uses_single_query(self):
+        """Курс и урок загружаются вместе с владельцем одним запросом"""
+        course = Course.objects.first()
+        lesson = Lesson.objects.first()
+        for url in (f"/courses/{course.id}/", f"/courses/lessons/{lesson.id}/"):
+            with self.subTest(url=url):
+                self.client.force_authenticate(user=User.objects.get(pk=self.student.pk))
+                with self.assertNumQueries(2):  # Роли пользователя и сам объект
+                    response = self.client.get(url)
+                self.assertEqual(response.data["owner"], course.owner.email)
+
+    def test_paper_query_count(self):
+        """Тест со всеми вопросами и ответами загружается тремя запросами"""
+        test = Test.objects.first()
+        for number in range(5):
+            question = Question.objects.create(test=test, text=f"Вопрос {number}")
+            Answer.objects.create(question=question, text="Правильный", is_correct=True)
+            Answer.objects.create(question=question, text="Неправильный", is_correct=False)
+
+        teacher = User.objects.create(email="teacher@example.com", password="password123")
+        teacher.groups.add(Group.objects.create(name="Преподаватели"))
+        self.client.force_authenticate(user=User.objects.get(pk=teacher.pk))
+        with self.assertNumQueries(4):  # Роли пользователя, тест, вопросы, ответы
+            response = self.client.get(f"/courses/tests/{test.id}/paper/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data["questions"]), 6)
+        self.assertEqual(len(response.data["questions"][1]["answers"]), 2)
+
+        # Ответы с отметками о правильности студенту не отдаются
+        self.client.force_authenticate(user=User.objects.get(pk=self.student.pk))
+        response = self.client.get(f"/courses/tests/{test.id}/paper/")
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+@override_settings(CACHE_SINGLE_PROCESS=True)
+class ConditionalGetTest(APITestCase):
+    """ETag/Last-Modified и кэш ответов для чтения курсов и уроков"""
+
+    def setUp(self):
+        self.teacher = User.objects.create(email="teacher@example.com", password="password123")
+        self.student = User.objects.create(email="student@example.com", password="password123")
+        self.student.groups.add(Group.objects.create(name="Студенты"))
+        self.course = Course.objects.create(name="Курс", description="Описание курса", owner=self.teacher)
+        self.lesson = Lesson.objects.create(
+            title="Урок 1", content="Описание урока", course=self.course, owner=self.teacher
+        )
+        self.client.force_authenticate(user=self.student)
+
+    def test_not_modified(self):
+        """Повторный запрос с If-None-Match получает 304 без обращения к базе"""
+        url = f"/courses/{self.course.id}/"
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn("Last-Modified", response)
+
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_cached_response(self):
+        """Повторный запрос без заголовков отдается из кэша ответов"""
+        first = self.client.get("/courses/lessons/")
+        with self.assertNumQueries(0):
+            second = self.client.get("/courses/lessons/")
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(second["ETag"], first["ETag"])
+
+    def test_etag_changes_on_update(self):
+        """Изменение курса меняет ETag и содержимое ответа"""
+        url = f"/courses/{self.course.id}/"
+        etag = self.client.get(url)["ETag"]
+
+        self.course.name = "Новое название"
+        self.course.save()
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["name"], "Новое название")
+
+    def test_etag_changes_on_owner_email_change(self):
+        """Смена email владельца меняет ответы со списком уроков"""
+        etag = self.client.get("/courses/lessons/")["ETag"]
+
+        self.teacher.email = "new-teacher@example.com"
+        self.teacher.save()
+
+        response = self.client.get("/courses/lessons/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["results"][0]["owner"], "new-teacher@example.com")
+
+    def test_nested_answer_change_updates_question(self):
+        """Изменение ответа меняет ETag вопроса, в котором он выводится"""
+        test = Test.objects.create(title="Тест", description="Описание", owner=self.teacher, lesson=self.lesson)
+        question = Question.objects.create(test=test, text="Вопрос")
+        answer = Answer.objects.create(question=question, text="Ответ")
+        url = f"/courses/questions/{question.id}/"
+        etag = self.client.get(url)["ETag"]
+
+        answer.text = "Исправленный ответ"
+        answer.save()
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["answers"][0]["text"], "Исправленный ответ")
+
+    def test_moved_answer_updates_both_questions(self):
+        """Перенос ответа в другой вопрос меняет ETag и прежнего, и нового вопроса"""
+        test = Test.objects.create(title="Тест", description="Описание", owner=self.teacher, lesson=self.lesson)
+        question = Question.objects.create(test=test, text="Вопрос")
+        other_question = Question.objects.create(test=test, text="Другой вопрос")
+        answer = Answer.objects.create(question=question, text="Ответ")
+        url = f"/courses/questions/{question.id}/"
+        etag = self.client.get(url)["ETag"]
+
+        answer.question = other_question
+        answer.save()
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["answers"], [])
+
+    @override_settings(CACHE_SINGLE_PROCESS=False)
+    def test_process_local_cache(self):
+        """Смена версии в кэше процесса не видна другим процессам: ответы без ETag и кэша, проверка предупреждает"""
+        url = f"/courses/{self.course.id}/"
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn("ETag", response)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH='"*"').status_code, status.HTTP_200_OK)
+        self.assertIn("courses.W001", [message.id for message in check_cache_shared(None)])
+
+        with override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}}):
+            self.assertEqual(check_cache_shared(None), [])
+
+    @override_settings(CACHE_SINGLE_PROCESS=False)
+    def test_process_local_cache_is_not_filled(self):
+        """Без общих версий бланк, анализ, рейтинг и версии не записываются в кэш: ключ больше никто не прочтет"""
+        test = Test.objects.create(title="Тест", description="Описание", owner=self.teacher, lesson=self.lesson)
+        with patch.object(cache, "set") as cache_set, patch.object(cache, "add") as cache_add:
+            for _ in range(3):
+                self.assertEqual(get_exam_paper(test.id), [])
+                get_test_analysis(test.id)
+                test_leaderboard.top(test.id)
+                bump_version("test_results", test.id)
+        cache_set.assert_not_called()
+        cache_add.assert_not_called()
+        self.assertIsNone(get_exam_paper(test.id + 1))
+
+
+class TestResultBulkCreateTest(APITestCase):
+    """Массовая загрузка результатов тестов"""
+
+    def setUp(self):
+        self.teacher = User.objects.create(email="teacher@example.com", password="password123")
+        self.teacher.groups.add(Group.objects.create(name="Преподаватели"))
+        student_group = Group.objects.create(name="Студенты")
+        self.students = []
+        for number in range(3):
+            student = User.objects.create(email=f"student{number}@example.com", password="password123")
+            student.groups.add(student_group)
+            self.students.append(student)
+
+        course = Course.objects.create(name="Курс", description="Описание курса", owner=self.teacher)
+        lesson = Lesson.objects.create(title="Урок 1", content="Описание урока", course=course, owner=self.teacher)
+        self.test = Test.objects.create(title="Тест", description="Описание", owner=self.teacher, lesson=lesson)
+        self.question = Question.objects.create(test=self.test, text="Вопрос")
+        self.correct = Answer.objects.create(question=self.question, text="Правильный", is_correct=True)
+        self.incorrect = Answer.objects.create(question=self.question, text="Неправильный")
+
+        self.url = "/courses/tests/results/bulk/"
+        self.client.force_authenticate(user=self.teacher)
+
+    def item(self, student, answer):
+        return {"student": student.id, "test": self.test.id, "answers": {str(self.question.id): [answer.id]}}
+
+    def test_bulk_json_array(self):
+        """Корректные элементы сохраняются, для ошибочных возвращается статус"""
+        items = [
+            self.item(self.students[0], self.correct),
+            self.item(self.students[1], self.incorrect),
+            {"student": self.teacher.id, "test": self.test.id, "answers": {}},
+            {"student": self.students[2].id, "test": self.test.id, "answers": {"0": []}},
+        ]
+        response = self.client.post(self.url, items, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["created"], 2)
+        self.assertEqual(
+            [item["status"] for item in response.data["results"]], ["created", "created", "error", "error"]
+        )
+        self.assertEqual(
+            sorted(TestResult.objects.values_list("student_id", "score")),
+            [(self.students[0].id, 1), (self.students[1].id, 0)],
+        )
+
+    def test_bulk_ndjson(self):
+        """JSON Lines: некорректная строка не мешает остальным"""
+        lines = [json.dumps(self.item(student, self.correct)) for student in self.students]
+        lines.insert(1, "{не json")
+        response = self.client.post(self.url, "\n".join(lines), content_type="application/x-ndjson")
+
+        self.assertEqual(response.data["created"], 3)
+        self.assertEqual(response.data["results"][1]["status"], "error")
+        self.assertEqual(TestResult.objects.filter(score=1).count(), 3)
+
+    def test_bulk_query_count_is_constant(self):
+        """Число запросов на пачку не зависит от количества результатов"""
+
+        def upload(count):
+            items = [self.item(self.students[number % 3], self.correct) for number in range(count)]
+            self.client.force_authenticate(user=User.objects.get(pk=self.teacher.pk))
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.post(self.url, items, format="json")
+            self.assertEqual(response.data["created"], count)
+            return len(queries)
+
+        upload(1)  # Прогрев кэша ключа ответов
+        self.assertEqual(upload(5), upload(100))
+
+    def test_iter_json_array_chunks(self):
+        """Разбор JSON-массива не зависит от границ прочитанных частей"""
+        items = [{"student": number, "test": 12345, "answers": {"1": [2, 3]}, "text": "ответ"} for number in range(20)]
+        data = json.dumps(items, ensure_ascii=False).encode()
+        for chunk_size in (1, 3, 7, 64):
+            with self.subTest(chunk_size=chunk_size):
+                self.assertEqual(list(iter_json_array(io.BytesIO(data), chunk_size)), items)
+        with self.assertRaises(ParseError):
+            list(iter_json_array(io.BytesIO(b'[{"student": 1}, {"student"')))
+
+    def test_iter_json_array_split_tokens(self):
+        """Числа, литералы и escape-последовательности, разрезанные границей частей, не считаются ошибкой"""
+        items = [{"score": -12.5e-3, "flag": True, "none": None, "text": 'ф"ы'}, 1234567, False]
+        data = json.dumps(items).encode()
+        for chunk_size in range(1, 12):
+            with self.subTest(chunk_size=chunk_size):
+                self.assertEqual(list(iter_json_array(io.BytesIO(data), chunk_size)), items)
+
+    def test_iter_json_array_fails_fast(self):
+        """Ошибка в элементе прерывает разбор без чтения остального тела"""
+        stream = io.BytesIO(b'[{"student": 1}, {"student": x}, ' + b'{"student": 1}, ' * 100000 + b"]")
+        items = iter_json_array(stream, chunk_size=64)
+        self.assertEqual(next(items), {"student": 1})
+        with self.assertRaises(ParseError):
+            next(items)
+        self.assertLess(stream.tell(), 1024)
+
+        stream = io.BytesIO(b'[{"text": "' + b"a" * 10000)
+        with self.assertRaises(ParseError):
+            list(iter_json_array(stream, chunk_size=64, max_item_size=1000))
+        self.assertLess(stream.tell(), 2048)
+
+    def test_bulk_bool_ids(self):
+        """true и false не принимаются как id студента и теста"""
+        items = [
+            {"student": True, "test": self.test.id, "answers": {}},
+            {"student": self.students[0].id, "test": True, "answers": {}},
+        ]
+        response = self.client.post(self.url, items, format="json")
+
+        self.assertEqual(response.data["created"], 0)
+        self.assertEqual(
+            [item["errors"] for item in response.data["results"]],
+            ["Ожидается объект с полями student, test и answers"] * 2,
+        )
+
+
+@override_settings(REGRADE_ON_CHANGE=True)
+class RegradeTest(APITestCase):
+    """Пересчет баллов при изменении правильных ответов"""
+
+    def setUp(self):
+        self.teacher = User.objects.create(email="teacher@example.com", password="password123")
+        self.students = [
+            User.objects.create(email=f"student{number}@example.com", password="password123") for number in range(3)
+        ]
+        course = Course.objects.create(name="Курс", description="Описание курса", owner=self.teacher)
+        lesson = Lesson.objects.create(title="Урок 1", content="Описание урока", course=course, owner=self.teacher)
+        self.test = Test.objects.create(title="Тест", description="Описание", owner=self.teacher, lesson=lesson)
+        with self.captureOnCommitCallbacks(execute=True):  # Пересчет после создания ответов, как при фиксации
+            self.question = Question.objects.create(test=self.test, text="Вопрос")
+            self.first = Answer.objects.create(question=self.question, text="Первый", is_correct=True)
+            self.second = Answer.objects.create(question=self.question, text="Второй")
+            self.other_question = Question.objects.create(test=self.test, text="Другой вопрос")
+            self.other = Answer.objects.create(question=self.other_question, text="Ответ", is_correct=True)
+
+        self.results = [
+            self.submit(self.students[0], [self.first.id, self.other.id]),
+            self.submit(self.students[1], [self.second.id, self.other.id]),
+            self.submit(self.students[2], [self.other.id]),
+        ]
+
+    def submit(self, student, answer_ids):
+        answer_key = get_answer_key(self.test.id)
+        score = answer_key.score(answer_key.group(answer_ids))
+        return TestResult.objects.create(
+            test=self.test, student=student, score=score, answers_packed=pack_ids(answer_ids)
+        )
+
+    def scores(self):
+        return [TestResult.objects.get(pk=result.pk).score for result in self.results]
+
+    def test_answer_fix_regrades_results(self):
+        """Исправление правильного ответа пересчитывает баллы после фиксации транзакции"""
+        self.assertEqual(self.scores(), [2, 1, 1])
+
+        self.first.is_correct = False
+        with self.captureOnCommitCallbacks(execute=True):
+            self.first.save()
+        self.second.is_correct = True
+        with self.captureOnCommitCallbacks(execute=True):
+            self.second.save()
+
+        self.assertEqual(self.scores(), [1, 2, 1])
+
+    def test_answers_changed_together_regrade_once(self):
+        """Несколько измененных ответов одной транзакции пересчитываются одним проходом по тесту"""
+        self.first.is_correct = False
+        self.second.is_correct = True
+        self.other.is_correct = False
+        with patch("courses.grading.regrade_results", wraps=regrade_results) as regrade:
+            with self.captureOnCommitCallbacks(execute=True) as callbacks:
+                with transaction.atomic():
+                    for answer in (self.first, self.second, self.other):
+                        answer.save()
+
+        self.assertEqual(len(callbacks), 1)
+        regrade.assert_called_once_with(
+            self.test.id,
+            frozenset({self.question.id, self.other_question.id}),
+            frozenset(),
+            {self.question.id: 1, self.other_question.id: 1},
+        )
+        self.assertEqual(self.scores(), [0, 1, 0])
+
+    def test_correct_answers_added_to_question_without_correct(self):
+        """Два правильных ответа, добавленных в одной транзакции вопросу без правильных, снимают балл
+        и у тех, кто на вопрос не отвечал: до изменения пустой ответ на него засчитывался"""
+        with self.captureOnCommitCallbacks(execute=True):
+            question = Question.objects.create(test=self.test, text="Вопрос без правильных ответов")
+            answers = [Answer.objects.create(question=question, text=f"Вариант {number}") for number in range(2)]
+        regrade_results(self.test.id)
+        self.assertEqual(self.scores(), [3, 2, 2])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                for answer in answers:
+                    answer.is_correct = True
+                    answer.save()
+
+        self.assertEqual(self.scores(), [2, 1, 1])
+
+    def test_rolled_back_changes_are_not_regraded(self):
+        """Откат точки сохранения снимает пересчет, следующее изменение регистрирует его заново"""
+        with patch("courses.grading.regrade_results") as regrade:
+            with self.captureOnCommitCallbacks(execute=True):
+                try:
+                    with transaction.atomic():
+                        self.first.is_correct = False
+                        self.first.save()
+                        raise RuntimeError
+                except RuntimeError:
+                    pass
+                self.second.is_correct = True
+                self.second.save()
+
+        regrade.assert_called_once_with(
+            self.test.id, frozenset({self.question.id}), frozenset(), {self.question.id: 1}
+        )
+
+    def test_text_change_does_not_regrade(self):
+        """Изменение текста ответа не запускает пересчет"""
+        Answer.objects.filter(pk=self.other.pk).update(is_correct=False)
+        self.other.text = "Новый текст"
+        with self.captureOnCommitCallbacks(execute=True):
+            self.other.save()
+        self.assertEqual(self.scores(), [2, 1, 1])
+
+    @override_settings(REGRADE_ON_CHANGE=False)
+    def test_regrade_is_opt_in(self):
+        """Без REGRADE_ON_CHANGE изменение ответов не пересчитывает баллы в запросе"""
+        self.first.is_correct = False
+        with self.captureOnCommitCallbacks(execute=True):
+            self.first.save()
+        self.assertEqual(self.scores(), [2, 1, 1])
+
+    @override_settings(REGRADE_ON_CHANGE=False)
+    def test_regrade_command(self):
+        """Команда пересчитывает результаты после изменения в обход сигналов"""
+        Answer.objects.filter(pk=self.first.pk).update(is_correct=False)
+        Answer.objects.filter(pk=self.second.pk).update(is_correct=True)
+
+        out = io.StringIO()
+        call_command("regrade_results", question=[self.question.id], chunk_size=2, stdout=out)
+        self.assertEqual(self.scores(), [1, 2, 1])
+        self.assertIn("Просмотрено результатов: 3, изменено: 2", out.getvalue())
+
+        Answer.objects.filter(pk=self.other.pk).update(is_correct=False)
+        call_command("regrade_results", test=[self.test.id], stdout=io.StringIO())
+        self.assertEqual(self.scores(), [0, 1, 0])
+
+
+class TestStatsTest(APITestCase):
+    """Статистика баллов теста"""
+
+    def setUp(self):
+        self.teacher = User.objects.create(email="teacher@example.com", password="password123")
+        self.teacher.groups.add(Group.objects.create(name="Преподаватели"))
+        student_group = Group.objects.create(name="Студенты")
+        self.students = []
+        for number in range(3):
+            student = User.objects.create(email=f"student{number}@example.com", password="password123")
+            student.groups.add(student_group)
+            self.students.append(student)
+
+        course = Course.objects.create(name="Курс", description="Описание курса", owner=self.teacher)
+        lesson = Lesson.objects.create(title="Урок 1", content="Описание урока", course=course, owner=self.teacher)
+        self.test = Test.objects.create(title="Тест", description="Описание", owner=self.teacher, lesson=lesson)
+        self.questions = []
+        self.correct = []
+        for number in range(2):
+            question = Question.objects.create(test=self.test, text=f"Вопрос {number}")
+            self.questions.append(question)
+            self.correct.append(Answer.objects.create(question=question, text="Правильный", is_correct=True))
+            Answer.objects.create(question=question, text="Неправильный")
+
+        self.url = f"/courses/tests/{self.test.id}/stats/"
+
+    def submit(self, student, correct_count):
+        answers = {str(self.questions[n].id): [self.correct[n].id] for n in range(correct_count)}
+        self.client.force_authenticate(user=student)
+        response = self.client.post(
+            f"/courses/tests/{self.test.id}/submit/", {"test": self.test.id, "answers": answers}, format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return response.data["id"]
+
+    def get_stats(self):
+        self.client.force_authenticate(user=User.objects.get(pk=self.teacher.pk))
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def test_stats_are_updated_incrementally(self):
+        """Каждая проверка обновляет агрегаты, результаты при чтении не перебираются"""
+        self.assertEqual(self.get_stats()["count"], 0)
+
+        for student, correct_count in zip(self.students, (2, 0, 2)):
+            self.submit(student, correct_count)
+
+        stats = self.get_stats()
+        self.assertEqual(stats["count"], 3)
+        self.assertAlmostEqual(stats["mean"], 4 / 3)
+        self.assertAlmostEqual(stats["stddev"], (8 / 9) ** 0.5)
+        self.assertEqual((stats["min_score"], stats["max_score"]), (0, 2))
+        self.assertEqual(stats["histogram"], [{"score": 0, "count": 1}, {"score": 2, "count": 2}])
+
+    def test_regrade_and_delete_update_stats(self):
+        """Пересчет и удаление результатов снимают прежние баллы"""
+        result_ids = [self.submit(student, count) for student, count in zip(self.students, (2, 1, 1))]
+
+        Answer.objects.filter(question=self.questions[0]).update(is_correct=False)
+        call_command("regrade_results", test=[self.test.id], stdout=io.StringIO())
+        TestResult.objects.get(pk=result_ids[1]).delete()
+
+        stats = self.get_stats()
+        self.assertEqual(stats["count"], 2)
+        self.assertEqual((stats["min_score"], stats["max_score"]), (0, 1))
+        self.assertEqual(stats["histogram"], [{"score": 0, "count": 1}, {"score": 1, "count": 1}])
+
+        TestStats.objects.all().delete()
+        call_command("rebuild_test_stats", stdout=io.StringIO())
+        self.assertEqual(self.get_stats(), stats)
+
+    def test_stats_forbidden_for_students(self):
+        """Статистика доступна только преподавателям и администраторам"""
+        self.client.force_authenticate(user=self.students[0])
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_403_FORBIDDEN)
+
+
+@override_settings(CACHE_SINGLE_PROCESS=True)
+class TestAnalysisTest(APITestCase):
+    """Анализ вопросов теста"""
+
+    def setUp(self):
+        self.teacher = User.objects.create(email="teacher@example.com", password="password123")
+        self.teacher.groups.add(Group.objects.create(name="Преподаватели"))
+        course = Course.objects.create(name="Курс", description="Описание курса", owner=self.teacher)
+        lesson = Lesson.objects.create(title="Урок 1", content="Описание урока", course=course, owner=self.teacher)
+        self.test = Test.objects.create(title="Тест", description="Описание", owner=self.teacher, lesson=lesson)
+        self.easy = Question.objects.create(test=self.test, text="Простой вопрос")
+        self.easy_correct = Answer.objects.create(question=self.easy, text="Правильный", is_correct=True)
+        self.easy_wrong = Answer.objects.create(question=self.easy, text="Неправильный")
+        self.hard = Question.objects.create(test=self.test, text="Сложный вопрос")
+        self.hard_correct = Answer.objects.create(question=self.hard, text="Правильный", is_correct=True)
+        self.hard_wrong = Answer.objects.create(question=self.hard, text="Неправильный")
+
+        # Четыре студента решили простой вопрос, один из них - и сложный
+        selections = [
+            [self.easy_correct.id, self.hard_correct.id],
+            [self.easy_correct.id, self.hard_wrong.id],
+            [self.easy_correct.id, self.hard_wrong.id],
+            [self.easy_correct.id],
+        ]
+        for number, answer_ids in enumerate(selections):
+            student = User.objects.create(email=f"student{number}@example.com", password="password123")
+            TestResult.objects.create(test=self.test, student=student, score=0, answers_packed=pack_ids(answer_ids))
+
+        self.url = f"/courses/tests/{self.test.id}/analysis/"
+        self.client.force_authenticate(user=self.teacher)
+
+    def test_item_analysis(self):
+        """Трудность, дискриминативность и частота выбора вариантов"""
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["results"], 4)
+
+        easy, hard = response.data["questions"]
+        self.assertEqual((easy["difficulty"], easy["discrimination"]), (1.0, 0.0))
+        self.assertEqual((hard["difficulty"], hard["discrimination"]), (0.25, 1.0))
+        self.assertEqual(
+            hard["answers"],
+            [
+                {"id": self.hard_correct.id, "is_correct": True, "selection_rate": 0.25},
+                {"id": self.hard_wrong.id, "is_correct": False, "selection_rate": 0.5},
+            ],
+        )
+
+    def test_unpack_rows(self):
+        """Векторная распаковка совпадает с unpack_ids, включая пустые строки и многобайтовые id"""
+        rows = [pack_ids([3, 1, 200]), b"", memoryview(pack_ids([70000, 5])), pack_ids([2**40])]
+        ids, numbers = unpack_rows(rows)
+        self.assertEqual(
+            list(zip(ids.tolist(), numbers.tolist())),
+            [(answer_id, number) for number, packed in enumerate(rows) for answer_id in unpack_ids(packed)],
+        )
+        self.assertEqual(len(unpack_rows([b"", b""])[0]), 0)
+
+    def test_analysis_cache_follows_answer_key(self):
+        """Анализ кэшируется, изменение правильных ответов дает новый анализ"""
+        self.client.get(self.url)
+        self.client.force_authenticate(user=User.objects.get(pk=self.teacher.pk))
+        with self.assertNumQueries(2):  # Роли пользователя и проверка существования теста
+            self.client.get(self.url)
+
+        self.hard_wrong.is_correct = True
+        self.hard_wrong.save()
+        hard = self.client.get(self.url).data["questions"][1]
+        self.assertEqual(hard["difficulty"], 0.0)
+
+
+class CourseProgressTest(APITestCase):
+    """Прогресс студента по курсу"""
+
+    def setUp(self):
+        self.teacher = User.objects.create(email="teacher@example.com", password="password123")
+        self.teacher.groups.add(Group.objects.create(name="Преподаватели"))
+        self.student = User.objects.create(email="student@example.com", password="password123")
+        self.student.groups.add(Group.objects.create(name="Студенты"))
+
+        self.course = Course.objects.create(name="Курс", description="Описание курса", owner=self.teacher)
+        lesson = Lesson.objects.create(
+            title="Урок 1", content="Описание урока", course=self.course, owner=self.teacher
+        )
+        self.tests = []
+        for number in range(3):
+            test = Test.objects.create(
+                title=f"Тест {number}", description="Описание", owner=self.teacher, lesson=lesson
+            )
+            for question_number in range(2):
+                question = Question.objects.create(test=test, text=f"Вопрос {question_number}")
+                Answer.objects.create(question=question, text="Правильный", is_correct=True)
+                Answer.objects.create(question=question, text="Неправильный")
+            self.tests.append(test)
+
+        self.url = f"/courses/{self.course.id}/progress/"
+
+    def submit(self, test, correct_count):
+        questions = list(test.questions.order_by("id"))
+        answers = {
+            str(question.id): [question.answers.get(is_correct=number < correct_count).id]
+            for number, question in enumerate(questions)
+        }
+        self.client.force_authenticate(user=User.objects.get(pk=self.student.pk))
+        response = self.client.post(
+            f"/courses/tests/{test.id}/submit/", {"test": test.id, "answers": answers}, format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return response.data["id"]
+
+    def test_progress_rollup(self):
+        """Сводка хранит лучшие баллы, сданные тесты и последнюю активность"""
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.client.force_authenticate(user=self.student)
+        self.assertEqual(self.client.get(self.url).data["tests_completed"], 0)
+
+        self.submit(self.tests[0], 2)
+        self.submit(self.tests[0], 0)  # Худшая попытка не снижает лучший балл
+        self.submit(self.tests[1], 0)
+
+        self.client.force_authenticate(user=User.objects.get(pk=self.student.pk))
+        with self.assertNumQueries(4):  # Роли, сводка, число тестов курса и лучшие результаты
+            response = self.client.get(self.url)
+        self.assertEqual(response.data["tests_total"], 3)
+        self.assertEqual(response.data["tests_completed"], 2)
+        self.assertEqual(response.data["tests_passed"], 1)
+        self.assertEqual(response.data["total_score"], 2)
+        self.assertIsNotNone(response.data["last_activity"])
+        self.assertEqual(
+            [(test["test"], test["score"], test["attempts"]) for test in response.data["tests"]],
+            [(self.tests[0].id, 2, 2), (self.tests[1].id, 0, 1)],
+        )
+
+    def test_submit_loads_answer_key_once(self):
+        """Максимальный балл для сводки берется из ключа ответов, по которому проверен результат"""
+        with patch.object(AnswerKey, "build", wraps=AnswerKey.build) as build:
+            self.submit(self.tests[0], 1)
+        self.assertEqual(build.call_count, 1)
+        best = TestBestScore.objects.get(test=self.tests[0], student=self.student)
+        self.assertEqual((best.score, best.max_score, best.passed), (1, 2, True))
+
+    def test_progress_after_delete_and_rebuild(self):
+        """Удаление результата пересчитывает сводку, команда пересобирает ее из результатов"""
+        result_id = self.submit(self.tests[0], 2)
+        self.submit(self.tests[1], 1)
+        TestResult.objects.get(pk=result_id).delete()
+
+        self.client.force_authenticate(user=self.teacher)
+        response = self.client.get(self.url, {"student": self.student.id})
+        self.assertEqual((response.data["tests_completed"], response.data["total_score"]), (1, 1))
+
+        call_command("rebuild_progress", stdout=io.StringIO())
+        self.assertEqual(self.client.get(self.url, {"student": self.student.id}).data, response.data)
+
+    def test_migration_backfill(self):
+        """Миграция 0007 заполняет лучшие результаты и прогресс по сохраненным результатам так же, как команда"""
+        self.submit(self.tests[0], 2)
+        self.submit(self.tests[0], 1)
+        self.submit(self.tests[1], 0)
+        call_command("rebuild_progress", stdout=io.StringIO())
+        fields = ("test_id", "student_id", "score", "max_score", "passed", "attempts", "last_attempt_at")
+        best_scores = list(TestBestScore.objects.order_by("test_id").values_list(*fields))
+        progress_fields = (
+            "course_id",
+            "student_id",
+            "tests_completed",
+            "tests_passed",
+            "total_score",
+            "last_activity",
+        )
+        progress = list(CourseProgress.objects.values_list(*progress_fields))
+
+        TestBestScore.objects.all().delete()
+        CourseProgress.objects.all().delete()
+        import_module("courses.migrations.0007_course_progress").build_progress(apps, connection.schema_editor())
+        self.assertEqual(list(TestBestScore.objects.order_by("test_id").values_list(*fields)), best_scores)
+        self.assertEqual(list(CourseProgress.objects.values_list(*progress_fields)), progress)
+
+    @override_settings(CACHE_SINGLE_PROCESS=True)
+    def test_progress_after_test_and_lesson_delete(self):
+        """Удаление теста или урока пересчитывает сводку и сбрасывает рейтинг курса"""
+        self.submit(self.tests[0], 2)
+        self.submit(self.tests[1], 1)
+        version = get_version("course_results", self.course.id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tests[0].delete()
+        progress = CourseProgress.objects.get(course=self.course, student=self.student)
+        self.assertEqual((progress.tests_completed, progress.tests_passed, progress.total_score), (1, 1, 1))
+        self.assertNotEqual(get_version("course_results", self.course.id), version)
+
+        # Урок с несколькими тестами: курс пересчитывается один раз
+        Test.objects.create(title="Еще тест", description="Описание", owner=self.teacher, lesson=self.tests[1].lesson)
+        with patch("courses.signals.refresh_course_progress", wraps=refresh_course_progress) as refresh:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.tests[1].lesson.delete()
+        refresh.assert_called_once_with(self.course.id)
+        self.assertFalse(CourseProgress.objects.filter(course=self.course).exists())
+
+    def test_student_cannot_view_other_progress(self):
+        """Студент видит только свой прогресс"""
+        self.client.force_authenticate(user=self.student)
+        response = self.client.get(self.url, {"student": self.teacher.id})
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+@override_settings(CACHE_SINGLE_PROCESS=True)
+class LeaderboardTest(APITestCase):
+    """Рейтинги тестов и курсов"""
+
+    def setUp(self):
+        self.teacher = User.objects.create(email="teacher@example.com", password="password123")
+        self.teacher.groups.add(Group.objects.create(name="Преподаватели"))
+        student_group = Group.objects.create(name="Студенты")
+        self.course = Course.objects.create(name="Курс", description="Описание курса", owner=self.teacher)
+        lesson = Lesson.objects.create(
+            title="Урок 1", content="Описание урока", course=self.course, owner=self.teacher
+        )
+        self.test = Test.objects.create(title="Тест", description="Описание", owner=self.teacher, lesson=lesson)
+        self.questions = []
+        for number in range(3):
+            question = Question.objects.create(test=self.test, text=f"Вопрос {number}")
+            Answer.objects.create(question=question, text="Правильный", is_correct=True)
+            Answer.objects.create(question=question, text="Неправильный")
+            self.questions.append(question)
+
+        self.students = []
+        for number, correct_count in enumerate((1, 3, 1, 0)):
+            student = User.objects.create(email=f"student{number}@example.com", password="password123")
+            student.groups.add(student_group)
+            self.students.append(student)
+            self.submit(student, correct_count)
+
+    def submit(self, student, correct_count):
+        answers = {
+            str(question.id): [question.answers.get(is_correct=number < correct_count).id]
+            for number, question in enumerate(self.questions)
+        }
+        self.client.force_authenticate(user=User.objects.get(pk=student.pk))
+        response = self.client.post(
+            f"/courses/tests/{self.test.id}/submit/", {"test": self.test.id, "answers": answers}, format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def test_test_leaderboard(self):
+        """Первые места с общими местами при равных баллах и место текущего студента"""
+        self.client.force_authenticate(user=self.students[2])
+        response = self.client.get(f"/courses/tests/{self.test.id}/leaderboard/", {"limit": 3})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [(row["rank"], row["student"], row["score"]) for row in response.data["top"]],
+            [(1, self.students[1].id, 3), (2, self.students[0].id, 1), (2, self.students[2].id, 1)],
+        )
+        self.assertEqual(response.data["me"], {"rank": 2, "score": 1})
+        self.assertNotIn("email", response.data["top"][0])
+
+    def test_leaderboard_shows_names(self):
+        """Вместо email в рейтинге имя студента, если оно указано"""
+        User.objects.filter(pk=self.students[1].pk).update(first_name="Анна", last_name="Иванова")
+        self.client.force_authenticate(user=self.students[2])
+        top = self.client.get(f"/courses/tests/{self.test.id}/leaderboard/").data["top"]
+        self.assertEqual([row["name"] for row in top[:2]], ["Анна Иванова", None])
+
+    def test_versions_bumped_after_best_scores(self):
+        """Версия результатов меняется после записи лучших результатов, а не до нее"""
+        bumps = []
+
+        def record(namespace, pk=None):
+            bumps.append((namespace, TestBestScore.objects.get(test=self.test, student=self.students[3]).score))
+
+        with (
+            patch("courses.progress.bump_version", side_effect=record),
+            patch("courses.signals.bump_version", side_effect=record),
+        ):
+            self.submit(self.students[3], 3)
+        self.assertIn(("test_results", 3), bumps)
+        self.assertNotIn(("test_results", 0), bumps)
+
+    def test_leaderboard_cache_invalidated_by_new_result(self):
+        """Новый лучший результат меняет закэшированный рейтинг курса"""
+        url = f"/courses/{self.course.id}/leaderboard/"
+        self.client.force_authenticate(user=self.teacher)
+        self.assertEqual(self.client.get(url).data["top"][0]["student"], self.students[1].id)
+        self.assertIsNone(self.client.get(url).data["me"])
+
+        self.client.force_authenticate(user=User.objects.get(pk=self.teacher.pk))
+        with self.assertNumQueries(3):  # Роли, проверка курса и место пользователя, первые места из кэша
+            self.client.get(url)
+
+        self.submit(self.students[3], 3)
+        self.client.force_authenticate(user=self.students[3])
+        response = self.client.get(url)
+        self.assertEqual([row["rank"] for row in response.data["top"][:2]], [1, 1])
+        self.assertEqual(response.data["me"], {"rank": 1, "score": 3})
+
+    def test_benchmark_command(self):
+        """Команда замера работает на небольшом наборе данных и откатывает его"""
+        out = io.StringIO()
+        call_command("benchmark_leaderboard", results=200, students=20, repeat=2, stdout=out)
+        self.assertIn("Место студента в тесте по индексу", out.getvalue())
+        self.assertEqual(TestResult.objects.filter(test__title="Benchmark").count(), 0)
+
+
+class AsyncReadViewsTest(APITestCase):
+    """Асинхронные списки и карточки курсов, уроков, тестов и вопросов"""
+
+    def setUp(self):
+        self.student = User.objects.create(email="student@example.com", password="password123")
+        self.student.groups.add(Group.objects.create(name="Студенты"))
+        self.courses = [
+            Course.objects.create(name=f"Курс {number}", description="Описание", owner=self.student)
+            for number in range(3)
+        ]
+        lesson = Lesson.objects.create(title="Урок", content="Описание", course=self.courses[0], owner=self.student)
+        test = Test.objects.create(title="Тест", description="Описание", owner=self.student, lesson=lesson)
+        self.question = Question.objects.create(test=test, text="Вопрос")
+        Answer.objects.create(question=self.question, text="Ответ", is_correct=True)
+
+    def headers(self, user):
+        return {"Authorization": f"Bearer {RoleRefreshToken.for_user(user).access_token}"}
+
+    async def test_list_pages_follow_cursor(self):
+        """Страницы списка читаются по курсору в обе стороны"""
+        headers = await sync_to_async(self.headers)(self.student)
+        first = await self.async_client.get("/courses/", {"page_size": 2}, headers=headers)
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        self.assertEqual([row["id"] for row in first.json()["results"]], [course.id for course in self.courses[:2]])
+        self.assertEqual(first.json()["results"][0]["owner"], "student@example.com")
+
+        second = await self.async_client.get(first.json()["next"], headers=headers)
+        self.assertEqual([row["id"] for row in second.json()["results"]], [self.courses[2].id])
+        self.assertIsNone(second.json()["next"])
+        previous = await self.async_client.get(second.json()["previous"], headers=headers)
+        self.assertEqual(previous.json()["results"], first.json()["results"])
+
+    async def test_retrieve(self):
+        headers = await sync_to_async(self.headers)(self.student)
+        response = await self.async_client.get(f"/courses/questions/{self.question.id}/", headers=headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([answer["text"] for answer in response.json()["answers"]], ["Ответ"])
+
+        missing = await self.async_client.get("/courses/lessons/0/", headers=headers)
+        self.assertEqual(missing.status_code, status.HTTP_404_NOT_FOUND)
+
+    @override_settings(CACHE_SINGLE_PROCESS=True, ROLES_CACHE_TIMEOUT=60)
+    async def test_cache_is_not_blocking(self):
+        """Версии, ответы и роли читаются асинхронными методами кэша, синхронные в цикле событий не вызываются"""
+
+        def outside_loop(name, method):
+            def call(*args, **kwargs):
+                try:
+                    asyncio.get_running_loop()
+                except RuntimeError:
+                    return method(*args, **kwargs)
+                raise AssertionError(f"cache.{name} вызван в цикле событий")
+
+            return call
+
+        headers = await sync_to_async(self.headers)(self.student)
+        with ExitStack() as stack:
+            for name in ("get", "set", "add", "get_many"):
+                stack.enter_context(patch.object(cache, name, outside_loop(name, getattr(cache, name))))
+            first = await self.async_client.get("/courses/", headers=headers)
+            self.assertEqual(first.status_code, status.HTTP_200_OK)
+            second = await self.async_client.get("/courses/", headers={**headers, "If-None-Match": first["ETag"]})
+            self.assertEqual(second.status_code, status.HTTP_304_NOT_MODIFIED)
+            self.assertEqual(await aload_roles(self.student.pk), {STUDENT})
+            self.assertEqual(await aload_roles(self.student.pk), {STUDENT})
+
+    @override_settings(CACHE_SINGLE_PROCESS=True)
+    def test_role_checks(self):
+        """Без токена - 401, без роли - 403. Роли из токена не загружаются из базы"""
+        self.assertEqual(self.client.get("/courses/tests/").status_code, status.HTTP_401_UNAUTHORIZED)
+
+        outsider = User.objects.create(email="outsider@example.com", password="password123")
+        response = self.client.get("/courses/tests/", headers=self.headers(outsider))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        headers = self.headers(self.student)
+        self.client.get("/courses/tests/", headers=headers)
+        with self.assertNumQueries(1):  # Пользователь по токену, страница из кэша ответов
+            response = self.client.get("/courses/tests/", headers=headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_benchmark_command(self):
+        """Команда сравнения выполняет запросы под WSGI и ASGI"""
+        out = io.StringIO()
+        call_command("benchmark_concurrency", requests=4, concurrency=2, threads=1, client_delay=0, stdout=out)
+        self.assertIn("WSGI:", out.getvalue())
+        self.assertIn("ASGI:", out.getvalue())
+
+
+class ExportTest(APITestCase):
+    """Потоковая выгрузка результатов, уроков и ответов"""
+
+    def setUp(self):
+        self.admin = User.objects.create(email="admin@example.com", password="password123")
+        self.admin.groups.add(Group.objects.create(name="Администраторы"))
+        self.student = User.objects.create(email="student@example.com", password="password123")
+        self.student.groups.add(Group.objects.create(name="Студенты"))
+        course = Course.objects.create(name="Курс", description="Описание", owner=self.admin)
+        self.lessons = [
+            Lesson.objects.create(title=f"Урок {number}", content="Описание", course=course, owner=self.admin)
+            for number in range(5)
+        ]
+        Lesson.objects.create(
+            title="Другой курс",
+            content="Описание",
+            course=Course.objects.create(name="Курс 2", description="Описание", owner=self.admin),
+            owner=self.admin,
+        )
+        self.test = Test.objects.create(title="Тест", description="Описание", owner=self.admin, lesson=self.lessons[0])
+        question = Question.objects.create(test=self.test, text="Вопрос")
+        self.answer = Answer.objects.create(question=question, text="Ответ", is_correct=True)
+        self.results = [
+            TestResult.objects.create(
+                student=student, test=self.test, score=1, answers_packed=pack_ids([self.answer.id])
+            )
+            for student in (self.student, self.admin, self.student)
+        ]
+
+    def export(self, url, user):
+        self.client.force_authenticate(user=user)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        return response, b"".join(response.streaming_content).decode()
+
+    @patch("courses.exports.EXPORT_CHUNK_SIZE", 2)
+    def test_json_export_in_chunks(self):
+        """Выгрузка читается кусками, но остается одним JSON-массивом"""
+        self.client.force_authenticate(user=self.admin)
+        response = self.client.get(f"/courses/lessons/?export=json&course={self.lessons[0].course_id}")
+        self.assertEqual(response["Content-Type"], "application/json")
+        self.assertEqual(response["Content-Disposition"], 'attachment; filename="lesson.json"')
+        with self.assertNumQueries(1):
+            chunks = list(response.streaming_content)
+        self.assertEqual(len(chunks), 5)  # Скобки и три куска по две строки
+        rows = json.loads(b"".join(chunks))
+        self.assertEqual([row["id"] for row in rows], [lesson.id for lesson in self.lessons])
+        self.assertEqual(rows[0]["owner"], "admin@example.com")
+
+    def test_ndjson_export(self):
+        response, content = self.export("/courses/tests/results/?export=ndjson", self.admin)
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        rows = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual([row["id"] for row in rows], [result.id for result in self.results])
+        self.assertEqual(rows[0]["answers"], [self.answer.id])
+
+        _, content = self.export("/courses/answers/?export=json", self.admin)
+        self.assertEqual(json.loads(content), [AnswerSerializer(self.answer).data])
+
+    def test_empty_export(self):
+        _, content = self.export("/courses/tests/results/?export=json&test=0", self.admin)
+        self.assertEqual(json.loads(content), [])
+
+    def test_export_checks(self):
+        """Выгрузка только для администраторов и в известных форматах"""
+        self.client.force_authenticate(user=self.student)
+        self.assertEqual(self.client.get("/courses/answers/?export=json").status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(self.client.get("/courses/lessons/?export=ndjson").status_code, status.HTTP_403_FORBIDDEN)
+        self.client.force_authenticate(user=self.admin)
+        self.assertEqual(self.client.get("/courses/answers/?export=csv").status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_result_list(self):
+        """Студент видит в списке только свои результаты"""
+        self.client.force_authenticate(user=self.student)
+        response = self.client.get("/courses/tests/results/", {"test": self.test.id})
+        self.assertEqual([row["id"] for row in response.data["results"]], [self.results[0].id, self.results[2].id])
+
+    async def test_async_export(self):
+        """Под ASGI асинхронное представление отдает асинхронный поток"""
+        token = await sync_to_async(lambda: str(RoleRefreshToken.for_user(self.admin).access_token))()
+        response = await self.async_client.get(
+            "/courses/lessons/", {"export": "ndjson"}, headers={"Authorization": f"Bearer {token}"}
+        )
+        self.assertTrue(response.is_async)
+        content = b"".join([chunk async for chunk in response.streaming_content]).decode()
+        self.assertEqual(len(content.splitlines()), 6)
+
+
+@override_settings(METRICS_ENABLED=True, METRICS_TOKEN="metrics-token")
+class MetricsTest(APITestCase):
+    """Метрики запросов по представлениям"""
+
+    def setUp(self):
+        metrics.store.reset()
+        self.user = User.objects.create(email="teacher@example.com", password="password123")
+        self.user.groups.add(Group.objects.create(name="Преподаватели"))
+
+    def test_requests_are_recorded(self):
+        """Запросы к представлению учитываются с числом SQL-запросов, сами метрики не учитываются"""
+        self.client.force_authenticate(user=self.user)
+        for _ in range(2):
+            self.assertEqual(self.client.get("/courses/tests/").status_code, status.HTTP_200_OK)
+
+        response = self.client.get("/internal/metrics/", HTTP_AUTHORIZATION="Bearer metrics-token")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        text = response.content.decode()
+        labels = 'view="courses:test-list",method="GET",status="200"'
+        self.assertIn(f"django_http_requests_total{{{labels}}} 2", text)
+        self.assertIn(f'django_http_request_duration_seconds_bucket{{{labels},le="+Inf"}} 2', text)
+        queries = next(line for line in text.splitlines() if line.startswith(f"django_db_queries_total{{{labels}}}"))
+        self.assertGreater(int(queries.split()[-1]), 0)
+        self.assertNotIn('view="metrics"', text)
+
+    def test_endpoint_requires_token(self):
+        """Локальный адрес клиента не открывает метрики: за обратным прокси он у всех запросов"""
+        url = "/internal/metrics/"
+        self.assertEqual(self.client.get(url, REMOTE_ADDR="127.0.0.1").status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.get(url, HTTP_AUTHORIZATION="Bearer wrong-token")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        with override_settings(METRICS_TOKEN=""):
+            self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION="Bearer ").status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_concurrent_flushes(self):
+        """Потоки, одновременно дошедшие до срока записи, не мешают друг другу, ошибка записи не доходит до запроса"""
+        directory = tempfile.mkdtemp()
+        store = metrics.MetricsStore(directory, flush_interval=0)
+        errors = []
+
+        def record():
+            try:
+                for _ in range(50):
+                    store.record(("courses:test-list", "GET", 200), 0.01, 1, 0.001)
+            except Exception as error:
+                errors.append(error)
+
+        threads = [threading.Thread(target=record) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(store.collect()[("courses:test-list", "GET", 200)][0], 400)
+        self.assertEqual([path.suffix for path in store.directory.iterdir()], [".json"])
+
+        store.directory = store.directory / f"metrics-{os.getpid()}.json"  # Файл вместо каталога
+        with self.assertLogs("config.metrics", "WARNING"):
+            store.record(("courses:test-list", "GET", 200), 0.01, 1, 0.001)
+
+    def test_process_files_are_merged(self):
+        """Агрегаты других процессов читаются из их файлов и складываются"""
+        directory = tempfile.mkdtemp()
+        store = metrics.MetricsStore(directory)
+        store.record(("courses:test-list", "GET", 200), 0.02, 3, 0.001)
+        other = [["courses:test-list", "GET", 200, 2, 0.5, [0] * 12, 4, 0.01]]
+        with open(f"{directory}/metrics-0.json", "w") as file:
+            json.dump(other, file)
+
+        count, total, buckets, queries, _ = store.collect()[("courses:test-list", "GET", 200)]
+        self.assertEqual((count, queries), (3, 7))
+        self.assertAlmostEqual(total, 0.52)
+        self.assertEqual(sum(buckets), 1)
+
+
+class QueryDiagnosticsTest(APITestCase):
+    """Поиск N+1 и медленных запросов"""
+
+    def setUp(self):
+        self.user = User.objects.create(email="teacher@example.com", password="password123")
+        self.user.groups.add(Group.objects.create(name="Преподаватели"))
+        self.courses = [
+            Course.objects.create(name=f"Курс {number}", description="Описание", owner=self.user)
+            for number in range(3)
+        ]
+
+    def test_repeated_queries_are_grouped(self):
+        """Запросы с разными параметрами и длиной списка IN считаются одной структурой, стек указывает на вызов"""
+        inspector = diagnostics.QueryInspector(slow_ms=10_000)
+        with connection.execute_wrapper(inspector):
+            for course in self.courses:
+                User.objects.filter(pk=course.owner_id).first()
+            list(Course.objects.filter(pk__in=[1, 2]))
+            list(Course.objects.filter(pk__in=[1, 2, 3]))
+
+        repeated = {count: stack for _, count, stack in inspector.repeated(2)}
+        self.assertEqual(sorted(repeated), [2, 3])
+        self.assertIn("courses/tests.py", repeated[3][0])
+        self.assertIn("test_repeated_queries_are_grouped", repeated[3][0])
+        self.assertEqual(inspector.slow, [])
+
+    def test_connection_opened_inside_execute_wrapper(self):
+        """Подключение, открытое внутри чужого execute_wrapper, после выхода из блока остается только с оберткой
+        инструментирования, и запросы по-прежнему передаются обработчикам"""
+        other = connections.create_connection(DEFAULT_DB_ALIAS)
+        self.addCleanup(other.close)
+        counter = metrics.QueryRecorder()
+
+        def wrapper(execute, sql, params, many, context):
+            return execute(sql, params, many, context)
+
+        with other.execute_wrapper(wrapper):
+            other.ensure_connection()
+        self.assertEqual(other.execute_wrappers, [instrumentation._execute])
+        with recording(counter), other.cursor() as cursor:
+            cursor.execute("SELECT 1")
+        self.assertEqual(counter.count, 1)
+
+    @override_settings(
+        QUERY_DIAGNOSTICS_SAMPLE_RATE=1, QUERY_DIAGNOSTICS_REPEAT_THRESHOLD=1, QUERY_DIAGNOSTICS_SLOW_MS=0
+    )
+    def test_middleware_logs_findings(self):
+        self.client.force_authenticate(user=self.user)
+        with self.assertLogs("config.diagnostics", "WARNING") as logs:
+            self.client.get("/courses/")
+        self.assertTrue(any("N+1 в GET courses:course-list" in line for line in logs.output))
+        self.assertTrue(any("Медленный запрос в GET courses:course-list" in line for line in logs.output))
+
+
+@skipUnless(connection.vendor == "postgresql", "Планы запросов проверяются только на PostgreSQL")
+class IndexUsageTest(TestCase):
+    """Горячие запросы используют индексы: EXPLAIN запросов, которые выполняет код, на заполненной базе"""
+
+    @classmethod
+    def setUpTestData(cls):
+        # Таблицы пользователей и тестов такого размера, при котором поиск по подстроке дешевле через индекс
+        teacher = User.objects.create(email="teacher@example.com", password="password123")
+        course = Course.objects.create(name="Курс", description="Описание курса", owner=teacher)
+        lesson = Lesson.objects.create(title="Урок 1", content="Описание урока", course=course, owner=teacher)
+        students = User.objects.bulk_create(
+            [User(email=f"student{number}@example.com", password="password123") for number in range(50000)],
+            batch_size=5000,
+        )
+        cls.tests = Test.objects.bulk_create(
+            [
+                Test(title=f"Тест {number}", description="Описание", owner=teacher, lesson=lesson)
+                for number in range(50000)
+            ],
+            batch_size=5000,
+        )
+        questions = Question.objects.bulk_create(
+            [Question(test=test, text=f"Вопрос {number}") for test in cls.tests[:200] for number in range(10)]
+        )
+        Answer.objects.bulk_create(
+            [
+                Answer(question=question, text=f"Ответ {n}", is_correct=n == 0)
+                for question in questions
+                for n in range(4)
+            ]
+        )
+        TestResult.objects.bulk_create(
+            [
+                TestResult(
+                    test=test,
+                    student=student,
+                    score=number % 6,
+                    status=TestResult.STATUS_PENDING if number % 10 == 0 else TestResult.STATUS_GRADED,
+                    answers_packed=b"",
+                )
+                for number, student in enumerate(students[:2000])  # Результаты разных тестов вперемешку
+                for test in cls.tests[:20]
+            ],
+            batch_size=5000,
+        )
+        cls.student = students[0]
+
+    def setUp(self):
+        with connection.cursor() as cursor:
+            # Новые строки GIN-индекса ждут в pending list до autovacuum, в тесте переносим их сразу
+            cursor.execute(
+                "SELECT gin_clean_pending_list(indexrelid::regclass) FROM pg_index "
+                "JOIN pg_class ON pg_class.oid = indexrelid JOIN pg_am ON pg_am.oid = relam WHERE amname = 'gin'"
+            )
+            cursor.execute("ANALYZE")
+
+    def indexes_used(self, queryset):
+        """Имена индексов из плана запроса"""
+        plan = queryset.explain()
+        return set(re.findall(r"(?:Index(?: Only)? Scan(?: Backward)? using|Bitmap Index Scan on) (\w+)", plan)), plan
+
+    def assertUsesIndex(self, queryset, index_name):
+        used, plan = self.indexes_used(queryset)
+        self.assertIn(index_name, used, plan)
+        self.assertNotIn("Seq Scan", plan)
+
+    def test_answer_key_query(self):
+        """Варианты ответа вопросов теста читаются по индексу (question_id, id)"""
+        self.assertUsesIndex(AnswerKey.queryset(self.tests[0].id), "answer_question_id_idx")
+
+    def test_best_score_query(self):
+        """Пересчет лучших результатов пачки проверенных результатов одного теста"""
+        students = User.objects.filter(email__startswith="student").order_by("id")[:100]
+        self.assertUsesIndex(
+            best_score_totals([(self.tests[0].id, student.id) for student in students]), "testresult_test_student_idx"
+        )
+
+    def test_regrade_chunk_query(self):
+        """Пачка пересчета много меньше числа результатов теста: результаты читаются по порядку индекса"""
+        self.assertUsesIndex(regrade_chunk(self.tests[0].id, 0, chunk_size=100), "testresult_graded_test_idx")
+
+    def test_admin_search_query(self):
+        """Поиск результатов в админке по email студента и названию теста"""
+        if not trigram_installed(connection):
+            self.skipTest("Расширение pg_trgm не установлено, триграммные индексы не созданы")
+        model_admin = site._registry[TestResult]
+        request = RequestFactory().get("/admin/courses/testresult/")
+        queryset, _ = model_admin.get_search_results(request, model_admin.get_queryset(request), "student1234")
+        used, plan = self.indexes_used(queryset)
+        self.assertIn("users_user_email_trgm_idx", used, plan)
+        self.assertIn("courses_test_title_trgm_idx", used, plan)
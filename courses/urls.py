@@ -9,7 +9,9 @@ from .views import (
     AnswerUpdateApiView,
     CourseCreateApiView,
     CourseDestroyApiView,
+    CourseLeaderboardApiView,
     CourseListApiView,
+    CourseProgressApiView,
     CourseRetrieveApiView,
     CourseUpdateApiView,
     LessonCreateApiView,
@@ -22,10 +24,18 @@ from .views import (
     QuestionListApiView,
     QuestionRetrieveApiView,
     QuestionUpdateApiView,
+    TestAnalysisApiView,
     TestCreateApiView,
     TestDestroyApiView,
+    TestExamApiView,
+    TestLeaderboardApiView,
     TestListApiView,
+    TestPaperApiView,
+    TestResultBulkCreateApiView,
+    TestResultListApiView,
+    TestResultRetrieveApiView,
     TestRetrieveApiView,
+    TestStatsApiView,
     TestSubmitApiView,
     TestUpdateApiView,
 )
@@ -41,6 +51,8 @@ urlpatterns = [
     path("<int:pk>/", CourseRetrieveApiView.as_view(), name="course-detail"),
     path("<int:pk>/update/", CourseUpdateApiView.as_view(), name="course-update"),
     path("<int:pk>/delete/", CourseDestroyApiView.as_view(), name="course-delete"),
+    path("<int:pk>/progress/", CourseProgressApiView.as_view(), name="course-progress"),
+    path("<int:pk>/leaderboard/", CourseLeaderboardApiView.as_view(), name="course-leaderboard"),
     # Маршруты для уроков
     path("lessons/", LessonListApiView.as_view(), name="lesson-list"),
     path("lessons/create/", LessonCreateApiView.as_view(), name="lesson-create"),
@@ -54,6 +66,14 @@ urlpatterns = [
     path("tests/<int:pk>/update/", TestUpdateApiView.as_view(), name="test-update"),
     path("tests/<int:pk>/delete/", TestDestroyApiView.as_view(), name="test-delete"),
     path("tests/<int:pk>/submit/", TestSubmitApiView.as_view(), name="test-submit"),
+    path("tests/<int:pk>/paper/", TestPaperApiView.as_view(), name="test-paper"),
+    path("tests/<int:pk>/exam/", TestExamApiView.as_view(), name="test-exam"),
+    path("tests/<int:pk>/stats/", TestStatsApiView.as_view(), name="test-stats"),
+    path("tests/<int:pk>/leaderboard/", TestLeaderboardApiView.as_view(), name="test-leaderboard"),
+    path("tests/<int:pk>/analysis/", TestAnalysisApiView.as_view(), name="test-analysis"),
+    path("tests/results/", TestResultListApiView.as_view(), name="test-result-list"),
+    path("tests/results/bulk/", TestResultBulkCreateApiView.as_view(), name="test-result-bulk"),
+    path("tests/results/<int:pk>/", TestResultRetrieveApiView.as_view(), name="test-result-detail"),
     # Маршруты для Question
     path("questions/", QuestionListApiView.as_view(), name="question-list"),
     path("questions/create/", QuestionCreateApiView.as_view(), name="question-create"),
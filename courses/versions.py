@@ -0,0 +1,74 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+# Бэкенды, данные которых видит только процесс, записавший их
+PROCESS_LOCAL_CACHES = ("django.core.cache.backends.locmem.LocMemCache",)
+
+
+def _version_key(namespace, pk=None):
+    if pk is None:
+        return f"version:{namespace}"
+    return f"version:{namespace}:{pk}"
+
+
+def cache_is_process_local():
+    return settings.CACHES["default"]["BACKEND"] in PROCESS_LOCAL_CACHES
+
+
+def versions_shared():
+    """Смена версии видна всем процессам: кэш общий или приложение работает в одном процессе"""
+    return settings.CACHE_SINGLE_PROCESS or not cache_is_process_local()
+
+
+def get_versions(*scopes):
+    """Текущие версии данных (метки времени последнего изменения в наносекундах) одним обращением к кэшу.
+    scopes - пары (namespace, pk), pk=None означает всю коллекцию. Если версии не общие для процессов,
+    данные считаются изменившимися при каждом чтении: закэшированное по версии никогда не используется повторно"""
+    if not versions_shared():
+        return [time.time_ns()] * len(scopes)
+    keys = [_version_key(namespace, pk) for namespace, pk in scopes]
+    found = cache.get_many(keys)
+    versions = []
+    for key in keys:
+        version = found.get(key)
+        if version is None:
+            # Версия вытеснена из кэша: новая метка времени не совпадет ни с одной из старых
+            version = time.time_ns()
+            if not cache.add(key, version, timeout=None):
+                version = cache.get(key, version)
+        versions.append(version)
+    return versions
+
+
+async def aget_versions(*scopes):
+    """Асинхронная версия get_versions"""
+    if not versions_shared():
+        return [time.time_ns()] * len(scopes)
+    keys = [_version_key(namespace, pk) for namespace, pk in scopes]
+    found = await cache.aget_many(keys)
+    versions = []
+    for key in keys:
+        version = found.get(key)
+        if version is None:
+            version = time.time_ns()
+            if not await cache.aadd(key, version, timeout=None):
+                version = await cache.aget(key, version)
+        versions.append(version)
+    return versions
+
+
+def get_version(namespace, pk=None):
+    """Текущая версия данных одного объекта или коллекции"""
+    return get_versions((namespace, pk))[0]
+
+
+def bump_version(namespace, pk=None):
+    """Смена версии данных. Повторяем после коммита, чтобы не закэшировать данные из незавершенной транзакции"""
+    if not versions_shared():
+        return  # Версии не читаются, запись только занимала бы место в кэше
+    key = _version_key(namespace, pk)
+    cache.set(key, time.time_ns(), timeout=None)
+    transaction.on_commit(lambda: cache.set(key, time.time_ns(), timeout=None))
@@ -1,22 +1,59 @@
+from django.conf import settings
+from django.db.models import Prefetch
 from django.utils.decorators import method_decorator
 from drf_yasg.utils import swagger_auto_schema
 from rest_framework import serializers, status
+from rest_framework.exceptions import NotFound, ParseError, PermissionDenied
 from rest_framework.generics import CreateAPIView, DestroyAPIView, ListAPIView, RetrieveAPIView, UpdateAPIView
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
+from rest_framework.views import APIView
 
 from users.permissions import IsAdmin, IsStudent, IsTeacher
-
-from .models import Answer, Course, Lesson, Question, Test, TestResult
+from users.roles import ADMIN, TEACHER, has_role
+
+from .analytics import get_test_analysis
+from .async_views import AsyncListAPIView, AsyncRetrieveAPIView
+from .caching import AsyncConditionalCacheMixin, ConditionalCacheMixin
+from .encoding import pack_ids
+from .exports import AsyncExportMixin, ExportMixin
+from .grading import answer_ids, get_answer_key, notify_graded
+from .ingest import NDJSON_CONTENT_TYPES, ingest_submissions, iter_json_array, iter_ndjson
+from .leaderboards import LEADERBOARD_MAX_SIZE, LEADERBOARD_SIZE, course_leaderboard, test_leaderboard
+from .models import Answer, Course, CourseProgress, Lesson, Question, Test, TestResult, TestStats
+from .paginators import IdCursorPagination
+from .papers import get_exam_paper, shuffle_exam_paper
 from .serializers import (
     AnswerSerializer,
+    CourseProgressSerializer,
     CourseSerializer,
     LessonSerializer,
     QuestionSerializer,
+    TestPaperSerializer,
     TestResultSerializer,
     TestSerializer,
+    TestStatsSerializer,
 )
 
+# Ответы вопросов загружаются одним запросом на всю страницу вопросов
+ANSWERS_PREFETCH = Prefetch("answers", queryset=Answer.objects.order_by("id"))
+
+
+class ParentFilterMixin:
+    """Фильтрация списка по родительскому объекту из параметра запроса, например ?course=<id>"""
+
+    filter_field = None
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        value = self.request.query_params.get(self.filter_field)
+        if value is None:
+            return queryset
+        try:
+            return queryset.filter(**{f"{self.filter_field}_id": int(value)})
+        except ValueError:
+            raise serializers.ValidationError({self.filter_field: "Ожидается целое число"})
+
 
 @method_decorator(name="create", decorator=swagger_auto_schema(operation_description="Создание нового курса"))
 class CourseCreateApiView(CreateAPIView):
@@ -31,29 +68,35 @@ class CourseCreateApiView(CreateAPIView):
         serializer.save(owner=self.request.user)
 
 
-class CourseListApiView(ListAPIView):
+class CourseListApiView(AsyncConditionalCacheMixin, ParentFilterMixin, AsyncListAPIView):
     """Список всех курсов"""
 
-    queryset = Course.objects.all()
+    queryset = Course.objects.select_related("owner").only("id", "name", "description", "owner__email")
     serializer_class = CourseSerializer
+    pagination_class = IdCursorPagination
+    filter_field = "owner"
+    cache_scope = "course"
+    cache_dependencies = ("user_email",)
     permission_classes = (
         IsAuthenticated,
         IsAdmin | IsTeacher | IsStudent,
     )
 
 
-class CourseRetrieveApiView(RetrieveAPIView):
+class CourseRetrieveApiView(AsyncConditionalCacheMixin, AsyncRetrieveAPIView):
     """Получение информации о конкретном курсе"""
 
-    queryset = Course.objects.all()
+    queryset = Course.objects.select_related("owner").only("id", "name", "description", "owner__email")
     serializer_class = CourseSerializer
+    cache_scope = "course"
+    cache_dependencies = ("user_email",)
     permission_classes = (IsAdmin | IsTeacher | IsStudent,)
 
 
 class CourseUpdateApiView(UpdateAPIView):
     """Изменение информации о конкретном курсе"""
 
-    queryset = Course.objects.all()
+    queryset = Course.objects.select_related("owner")
     serializer_class = CourseSerializer
     permission_classes = (
         IsAuthenticated,
@@ -72,6 +115,67 @@ class CourseDestroyApiView(DestroyAPIView):
     )
 
 
+class CourseProgressApiView(APIView):
+    """Прогресс студента по курсу из предрассчитанной сводки.
+    Преподаватель и администратор могут запросить прогресс студента параметром ?student="""
+
+    permission_classes = (
+        IsAuthenticated,
+        IsAdmin | IsTeacher | IsStudent,
+    )
+
+    def get(self, request, pk):
+        student_id = request.user.pk
+        requested = request.query_params.get("student")
+        if requested is not None:
+            if not (has_role(request.user, ADMIN) or has_role(request.user, TEACHER)):
+                raise PermissionDenied("Прогресс других студентов доступен только преподавателям")
+            try:
+                student_id = int(requested)
+            except ValueError:
+                raise serializers.ValidationError({"student": "Ожидается целое число"})
+
+        progress = CourseProgress.objects.filter(course_id=pk, student_id=student_id).first()
+        if progress is None:
+            if not Course.objects.filter(pk=pk).exists():
+                raise NotFound("Курс не найден")
+            progress = CourseProgress(course_id=pk, student_id=student_id)  # Студент еще не проходил тесты курса
+        return Response(CourseProgressSerializer(progress).data)
+
+
+class LeaderboardApiView(APIView):
+    """Рейтинг студентов: первые места (?limit=, не больше 100) и место текущего пользователя"""
+
+    scope_model = None  # Тест или курс
+    leaderboard = None
+    permission_classes = (
+        IsAuthenticated,
+        IsAdmin | IsTeacher | IsStudent,
+    )
+
+    def get(self, request, pk):
+        try:
+            limit = min(int(request.query_params.get("limit", LEADERBOARD_SIZE)), LEADERBOARD_MAX_SIZE)
+        except ValueError:
+            raise serializers.ValidationError({"limit": "Ожидается целое число"})
+        if not self.scope_model.objects.filter(pk=pk).exists():
+            raise NotFound(f"{self.scope_model._meta.verbose_name} не найден")
+
+        return Response(
+            {
+                "top": self.leaderboard.top(pk, max(limit, 0)),
+                "me": self.leaderboard.rank(pk, request.user.pk),
+            }
+        )
+
+
+class CourseLeaderboardApiView(LeaderboardApiView):
+    """Рейтинг студентов курса по сумме лучших баллов за тесты"""
+
+    scope_model = Course
+    leaderboard = course_leaderboard
+
+
 class LessonCreateApiView(CreateAPIView):
     """Создание урока"""
 
@@ -87,22 +191,28 @@ class LessonCreateApiView(CreateAPIView):
         serializer.save(owner=self.request.user)
 
 
-class LessonListApiView(ListAPIView):
-    """Список всех уроков"""
+class LessonListApiView(AsyncExportMixin, AsyncConditionalCacheMixin, ParentFilterMixin, AsyncListAPIView):
+    """Список всех уроков и их выгрузка (?export=json|ndjson)"""
 
-    queryset = Lesson.objects.all()
+    queryset = Lesson.objects.select_related("owner").only("id", "title", "content", "image", "course", "owner__email")
     serializer_class = LessonSerializer
+    pagination_class = IdCursorPagination
+    filter_field = "course"
+    cache_scope = "lesson"
+    cache_dependencies = ("user_email",)
     permission_classes = (
         IsAuthenticated,
         IsAdmin | IsTeacher | IsStudent,
     )
 
 
-class LessonRetrieveApiView(RetrieveAPIView):
+class LessonRetrieveApiView(AsyncConditionalCacheMixin, AsyncRetrieveAPIView):
     """Получение информации о конкретном уроке"""
 
-    queryset = Lesson.objects.all()
+    queryset = Lesson.objects.select_related("owner").only("id", "title", "content", "image", "course", "owner__email")
     serializer_class = LessonSerializer
+    cache_scope = "lesson"
+    cache_dependencies = ("user_email",)
     permission_classes = (
         IsAuthenticated,
         IsAdmin | IsTeacher | IsStudent,
@@ -112,7 +222,7 @@ class LessonRetrieveApiView(RetrieveAPIView):
 class LessonUpdateApiView(UpdateAPIView):
     """Изменение информации о конкретном уроке"""
 
-    queryset = Lesson.objects.all()
+    queryset = Lesson.objects.select_related("owner")
     serializer_class = LessonSerializer
     permission_classes = (
         IsAuthenticated,
@@ -145,27 +255,69 @@ class TestCreateApiView(CreateAPIView):
         serializer.save(owner=self.request.user)
 
 
-class TestListApiView(ListAPIView):
+class TestListApiView(AsyncConditionalCacheMixin, ParentFilterMixin, AsyncListAPIView):
     """Список тестов"""
 
     queryset = Test.objects.all()
     serializer_class = TestSerializer
+    pagination_class = IdCursorPagination
+    filter_field = "lesson"
+    cache_scope = "test"
     permission_classes = (
         IsAuthenticated,
         IsAdmin | IsTeacher | IsStudent,
     )
 
 
-class TestRetrieveApiView(RetrieveAPIView):
+class TestRetrieveApiView(AsyncConditionalCacheMixin, AsyncRetrieveAPIView):
     """Получение информации о тесте"""
 
     queryset = Test.objects.all()
     serializer_class = TestSerializer
+    cache_scope = "test"
+    permission_classes = (
+        IsAuthenticated,
+        IsAdmin | IsTeacher | IsStudent,
+    )
+
+
+class TestPaperApiView(RetrieveAPIView):
+    """Тест целиком: вопросы с ответами загружаются тремя запросами.
+    Ответы отдаются с отметками о правильности, поэтому студентам доступен только бланк TestExamApiView"""
+
+    queryset = Test.objects.prefetch_related(
+        Prefetch("questions", queryset=Question.objects.order_by("id").prefetch_related(ANSWERS_PREFETCH))
+    )
+    serializer_class = TestPaperSerializer
+    permission_classes = (
+        IsAuthenticated,
+        IsAdmin | IsTeacher,
+    )
+
+
+class TestExamApiView(APIView):
+    """Бланк теста для прохождения: вопросы и варианты ответов без отметок о правильности"""
+
     permission_classes = (
         IsAuthenticated,
         IsAdmin | IsTeacher | IsStudent,
     )
 
+    def get(self, request, pk):
+        questions = get_exam_paper(pk)
+        if questions is None:
+            raise NotFound("Тест не найден")
+
+        # Необязательное перемешивание вариантов ответов с заданным seed
+        seed = request.query_params.get("seed")
+        if seed is not None:
+            try:
+                questions = shuffle_exam_paper(questions, int(seed))
+            except ValueError:
+                raise serializers.ValidationError({"seed": "Ожидается целое число"})
+
+        return Response({"test": pk, "questions": questions})
+
 
 class TestUpdateApiView(UpdateAPIView):
     """Обновление теста"""
@@ -199,54 +351,151 @@ class TestSubmitApiView(CreateAPIView):
         IsStudent,
     )
 
+    def create(self, request, *args, **kwargs):
+        response = super().create(request, *args, **kwargs)
+        if response.data.get("status") == TestResult.STATUS_PENDING:
+            response.status_code = status.HTTP_202_ACCEPTED  # Результат принят в очередь проверки
+        return response
+
     def perform_create(self, serializer):
         # Проверяем, передан ли тест
         test = serializer.validated_data.get("test")
         if test is None:
             raise serializers.ValidationError({"test": "Тест обязателен"})
 
-        # Получаем ответы пользователя
-        answers = self.request.data.get("answers", {})
-        if not isinstance(answers, dict):
-            raise serializers.ValidationError({"answers": "Ожидается JSON-объект с ответами "})
+        # Загружаем ключ ответов одним запросом и проверяем ответы пользователя целиком
+        answer_key = get_answer_key(test.id)
+        answers = answer_key.validate(self.request.data.get("answers", {}))
 
-        def calculate_score(test, answers):
-            """Расчет баллов для теста"""
-            score = 0
-            for question in test.questions.all():
-                # Получаем список ID правильных ответов для текущего вопроса
-                correct_answers = set(question.answers.filter(is_correct=True).values_list("id", flat=True))
+        answers_packed = pack_ids(answer_ids(answers))  # Ответы сохраняются вместе с результатом
 
-                # Получаем ответы пользователя для данного вопроса
-                user_answers = set(answers.get(str(question.id), []))
+        if settings.GRADING_ASYNC:
+            # Сохраняем результат как ожидающий проверки, баллы посчитает обработчик очереди
+            serializer.save(
+                student=self.request.user, score=None, status=TestResult.STATUS_PENDING, answers_packed=answers_packed
+            )
+            return
 
-                # Сравниваем ответы пользователя с правильными ответами
-                if user_answers == correct_answers:
-                    score += 1
-            return score
-
-        score = calculate_score(test, answers)  # Вычисляем баллы
+        score = answer_key.score(answers)  # Вычисляем баллы
 
         # Сохраняем результат теста
-        serializer.save(student=self.request.user, score=score)
+        serializer.save(student=self.request.user, score=score, answers_packed=answers_packed)
+        notify_graded([serializer.instance], answer_keys=[answer_key])
 
         # Выводим результат теста
         return Response({"score": score}, status=status.HTTP_201_CREATED)
 
 
+class TestResultAccessMixin:
+    """Студент видит только свои результаты, администратор и преподаватель - все"""
+
+    queryset = TestResult.objects.all()
+    serializer_class = TestResultSerializer
+    permission_classes = (
+        IsAuthenticated,
+        IsAdmin | IsTeacher | IsStudent,
+    )
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if has_role(self.request.user, ADMIN) or has_role(self.request.user, TEACHER):
+            return queryset
+        return queryset.filter(student=self.request.user.pk)
+
+
+class TestResultListApiView(ExportMixin, ParentFilterMixin, TestResultAccessMixin, ListAPIView):
+    """Список результатов тестов (?test=<id>) и их выгрузка (?export=json|ndjson)"""
+
+    pagination_class = IdCursorPagination
+    filter_field = "test"
+
+
+class TestResultRetrieveApiView(TestResultAccessMixin, RetrieveAPIView):
+    """Статус и баллы результата теста. Студент видит только свои результаты"""
+
+
+class TestResultBulkCreateApiView(APIView):
+    """Массовая загрузка результатов тестов: JSON-массив или JSON Lines с объектами {student, test, answers}"""
+
+    permission_classes = (
+        IsAuthenticated,
+        IsAdmin | IsTeacher,
+    )
+
+    def post(self, request):
+        stream = request.stream
+        if stream is None:
+            raise ParseError("Пустое тело запроса")
+
+        # Тело читается потоком, без загрузки всего файла в память
+        if request.content_type.split(";")[0].strip() in NDJSON_CONTENT_TYPES:
+            items = iter_ndjson(stream)
+        else:
+            items = iter_json_array(stream)
+        statuses = ingest_submissions(items)
+
+        created = sum(1 for item_status in statuses if item_status["status"] == "created")
+        return Response({"created": created, "failed": len(statuses) - created, "results": statuses})
+
+
+class TestStatsApiView(RetrieveAPIView):
+    """Статистика баллов теста: чтение предрассчитанных агрегатов и гистограммы, без перебора результатов"""
+
+    queryset = TestStats.objects.all()
+    serializer_class = TestStatsSerializer
+    permission_classes = (
+        IsAuthenticated,
+        IsAdmin | IsTeacher,
+    )
+
+    def get_object(self):
+        stats = self.get_queryset().filter(pk=self.kwargs["pk"]).first()
+        if stats is not None:
+            return stats
+        # Результатов по тесту еще нет
+        if not Test.objects.filter(pk=self.kwargs["pk"]).exists():
+            raise NotFound("Тест не найден")
+        return TestStats(test_id=self.kwargs["pk"])
+
+
+class TestAnalysisApiView(APIView):
+    """Анализ вопросов теста: трудность, дискриминативность и частота выбора вариантов ответа"""
+
+    permission_classes = (
+        IsAuthenticated,
+        IsAdmin | IsTeacher,
+    )
+
+    def get(self, request, pk):
+        if not Test.objects.filter(pk=pk).exists():
+            raise NotFound("Тест не найден")
+        return Response(get_test_analysis(pk))
+
+
+class TestLeaderboardApiView(LeaderboardApiView):
+    """Рейтинг студентов теста по лучшему баллу"""
+
+    scope_model = Test
+    leaderboard = test_leaderboard
+
+
 # Представления для Question
-class QuestionListApiView(ListAPIView):
-    queryset = Question.objects.all()
+class QuestionListApiView(AsyncConditionalCacheMixin, ParentFilterMixin, AsyncListAPIView):
+    queryset = Question.objects.prefetch_related(ANSWERS_PREFETCH)
     serializer_class = QuestionSerializer
+    pagination_class = IdCursorPagination
+    filter_field = "test"
+    cache_scope = "question"
     permission_classes = (
         IsAuthenticated,
         IsAdmin | IsTeacher | IsStudent,
     )
 
 
-class QuestionRetrieveApiView(RetrieveAPIView):
-    queryset = Question.objects.all()
+class QuestionRetrieveApiView(AsyncConditionalCacheMixin, AsyncRetrieveAPIView):
+    queryset = Question.objects.prefetch_related(ANSWERS_PREFETCH)
     serializer_class = QuestionSerializer
+    cache_scope = "question"
     permission_classes = (
         IsAuthenticated,
         IsAdmin | IsTeacher | IsStudent,
@@ -263,7 +512,7 @@ class QuestionCreateApiView(CreateAPIView):
 
 
 class QuestionUpdateApiView(UpdateAPIView):
-    queryset = Question.objects.all()
+    queryset = Question.objects.prefetch_related(ANSWERS_PREFETCH)
     serializer_class = QuestionSerializer
     permission_classes = (
         IsAuthenticated,
@@ -281,18 +530,22 @@ class QuestionDestroyApiView(DestroyAPIView):
 
 
 # Представления для Answer
-class AnswerListApiView(ListAPIView):
+class AnswerListApiView(ExportMixin, ConditionalCacheMixin, ParentFilterMixin, ListAPIView):
     queryset = Answer.objects.all()
     serializer_class = AnswerSerializer
+    pagination_class = IdCursorPagination
+    filter_field = "question"
+    cache_scope = "answer"
     permission_classes = (
         IsAuthenticated,
         IsAdmin | IsTeacher | IsStudent,
     )
 
 
-class AnswerRetrieveApiView(RetrieveAPIView):
+class AnswerRetrieveApiView(ConditionalCacheMixin, RetrieveAPIView):
     queryset = Answer.objects.all()
     serializer_class = AnswerSerializer
+    cache_scope = "answer"
     permission_classes = (
         IsAuthenticated,
         IsAdmin | IsTeacher | IsStudent,
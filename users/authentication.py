@@ -0,0 +1,87 @@
+from django.conf import settings
+from django.utils.functional import SimpleLazyObject
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from .models import User
+from .tokens import ROLES_CLAIM
+
+
+class TokenClaimsUser(SimpleLazyObject):
+    """Пользователь, построенный по claims access-токена.
+    Строка users_user загружается только при обращении к полям, которых нет в токене (например, owner=request.user)"""
+
+    def __init__(self, validated_token):
+        user_id = validated_token[api_settings.USER_ID_CLAIM]
+        super().__init__(lambda: self._load_user(user_id))
+        # Атрибуты, доступные без запроса к базе
+        self.__dict__.update(
+            pk=user_id,
+            is_authenticated=True,
+            is_anonymous=False,
+            _role_names=frozenset(validated_token[ROLES_CLAIM]),
+        )
+        self.__dict__[api_settings.USER_ID_FIELD] = user_id
+
+    def __bool__(self):
+        return True
+
+    @staticmethod
+    def _load_user(user_id):
+        try:
+            user = User.objects.get(**{api_settings.USER_ID_FIELD: user_id})
+        except User.DoesNotExist:
+            raise AuthenticationFailed("Пользователь не найден", code="user_not_found")
+        if not api_settings.USER_AUTHENTICATION_RULE(user):
+            raise AuthenticationFailed("Пользователь неактивен", code="user_inactive")
+        return user
+
+
+class RoleJWTAuthentication(JWTAuthentication):
+    """JWT-аутентификация, которая берет роли пользователя из access-токена без запроса к группам"""
+
+    def get_user(self, validated_token):
+        roles = validated_token.get(ROLES_CLAIM)
+        if roles is not None and settings.JWT_STATELESS_USER:
+            return TokenClaimsUser(validated_token)
+
+        user = super().get_user(validated_token)
+        if roles is not None:  # Токены, выпущенные до появления ролей, проверяются по базе
+            user._role_names = frozenset(roles)
+        return user
+
+    async def aauthenticate(self, request):
+        """Асинхронная аутентификация: токен проверяется без обращения к базе, пользователь загружается через aget"""
+        header = self.get_header(request)
+        if header is None:
+            return None
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+        validated_token = self.get_validated_token(raw_token)
+        return await self.aget_user(validated_token), validated_token
+
+    async def aget_user(self, validated_token):
+        roles = validated_token.get(ROLES_CLAIM)
+        if roles is not None and settings.JWT_STATELESS_USER:
+            return TokenClaimsUser(validated_token)
+
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken("Токен не содержит идентификатор пользователя")
+        try:
+            user = await self.user_model.objects.aget(**{api_settings.USER_ID_FIELD: user_id})
+        except self.user_model.DoesNotExist:
+            raise AuthenticationFailed("Пользователь не найден", code="user_not_found")
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed("Пользователь неактивен", code="user_inactive")
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed("Пароль пользователя изменен", code="password_changed")
+
+        if roles is not None:
+            user._role_names = frozenset(roles)
+        return user
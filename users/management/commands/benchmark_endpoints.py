@@ -0,0 +1,319 @@
+import json
+import statistics
+import time
+import tracemalloc
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from courses import urls as courses_urls
+from courses.grading import get_answer_key
+from courses.models import Answer, Question, TestResult
+from courses.versions import versions_shared
+from users import urls as users_urls
+from users.models import User
+from users.roles import ADMIN, STUDENT, TEACHER
+from users.tokens import RoleRefreshToken
+
+BASELINE_PATH = Path(settings.BASE_DIR) / "benchmarks" / "endpoints_baseline.json"
+SCALE_SIZE = 100  # Размер ответа при проверке, что число запросов не растет вместе с ним
+LATENCY_NOISE_MS = 5.0  # Разница задержки, которая считается шумом независимо от порога
+# Настройки, от которых зависят число запросов и статусы: замеры сравниваются только при их совпадении с базой
+BASELINE_SETTINGS = (
+    "RESPONSE_CACHE_TIMEOUT",
+    "ROLES_CACHE_TIMEOUT",
+    "JWT_STATELESS_USER",
+    "GRADING_ASYNC",
+    "REGRADE_ON_CHANGE",
+)
+
+
+class Endpoint:
+    """Сценарий вызова одного маршрута. params и data получают контекст и размер ответа"""
+
+    def __init__(self, method, pk=None, params=None, data=None, scalable=False):
+        self.method = method
+        self.pk = pk  # Ключ контекста с id объекта для <int:pk>
+        self.params = params
+        self.data = data
+        self.scalable = scalable  # Размер ответа задается параметром запроса или телом
+
+
+def page(ctx, size):
+    return {"page_size": size}
+
+
+def limit(ctx, size):
+    return {"limit": size}
+
+
+def submission(ctx, size):
+    return {"test": ctx["test"], "answers": ctx["answers"]}
+
+
+def bulk_submissions(ctx, size):
+    return [{"student": ctx["student"].pk, "test": ctx["test"], "answers": ctx["answers"]} for _ in range(size)]
+
+
+ENDPOINTS = {
+    "courses:course-list": Endpoint("get", params=page, scalable=True),
+    "courses:course-create": Endpoint("post", data=lambda ctx, size: {"name": "Курс", "description": "Описание"}),
+    "courses:course-detail": Endpoint("get", pk="course"),
+    "courses:course-update": Endpoint("patch", pk="course", data=lambda ctx, size: {"name": "Курс"}),
+    "courses:course-delete": Endpoint("delete", pk="course"),
+    "courses:course-progress": Endpoint("get", pk="course"),
+    "courses:course-leaderboard": Endpoint("get", pk="course", params=limit, scalable=True),
+    "courses:lesson-list": Endpoint("get", params=page, scalable=True),
+    "courses:lesson-create": Endpoint(
+        "post", data=lambda ctx, size: {"title": "Урок", "content": "Содержание", "course": ctx["course"]}
+    ),
+    "courses:lesson-detail": Endpoint("get", pk="lesson"),
+    "courses:lesson-update": Endpoint("patch", pk="lesson", data=lambda ctx, size: {"title": "Урок"}),
+    "courses:lesson-delete": Endpoint("delete", pk="lesson"),
+    "courses:test-list": Endpoint("get", params=page, scalable=True),
+    "courses:test-create": Endpoint(
+        "post", data=lambda ctx, size: {"title": "Тест", "description": "Описание", "lesson": ctx["lesson"]}
+    ),
+    "courses:test-detail": Endpoint("get", pk="test"),
+    "courses:test-update": Endpoint("patch", pk="test", data=lambda ctx, size: {"title": "Тест"}),
+    "courses:test-delete": Endpoint("delete", pk="test"),
+    "courses:test-submit": Endpoint("post", pk="test", data=submission),
+    "courses:test-paper": Endpoint("get", pk="test"),
+    "courses:test-exam": Endpoint("get", pk="test"),
+    "courses:test-stats": Endpoint("get", pk="test"),
+    "courses:test-leaderboard": Endpoint("get", pk="test", params=limit, scalable=True),
+    "courses:test-analysis": Endpoint("get", pk="test"),
+    "courses:test-result-bulk": Endpoint("post", data=bulk_submissions, scalable=True),
+    "courses:test-result-list": Endpoint("get", params=page, scalable=True),
+    "courses:test-result-detail": Endpoint("get", pk="result"),
+    "courses:question-list": Endpoint("get", params=page, scalable=True),
+    "courses:question-create": Endpoint("post", data=lambda ctx, size: {"test": ctx["test"], "text": "Вопрос"}),
+    "courses:question-detail": Endpoint("get", pk="question"),
+    "courses:question-update": Endpoint("patch", pk="question", data=lambda ctx, size: {"text": "Вопрос"}),
+    "courses:question-delete": Endpoint("delete", pk="question"),
+    "courses:answer-list": Endpoint("get", params=page, scalable=True),
+    "courses:answer-create": Endpoint(
+        "post", data=lambda ctx, size: {"question": ctx["question"], "text": "Ответ", "is_correct": False}
+    ),
+    "courses:answer-detail": Endpoint("get", pk="answer"),
+    "courses:answer-update": Endpoint("patch", pk="answer", data=lambda ctx, size: {"text": "Ответ"}),
+    "courses:answer-delete": Endpoint("delete", pk="answer"),
+    "users:register": Endpoint(
+        "post", data=lambda ctx, size: {"email": "benchmark-new@example.com", "password": ctx["password"]}
+    ),
+    "users:login": Endpoint(
+        "post", data=lambda ctx, size: {"email": ctx["student"].email, "password": ctx["password"]}
+    ),
+    "users:token_refresh": Endpoint("post", data=lambda ctx, size: {"refresh": ctx["refresh"]}),
+    "users:user-list": Endpoint("get"),
+    "users:user-detail": Endpoint("get", pk="user"),
+}
+
+
+class QueryCounter:
+    """Счетчик SQL-запросов через execute_wrapper, не зависит от DEBUG и журнала запросов"""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def url_names():
+    """Имена всех маршрутов приложений courses и users"""
+    names = set()
+    for namespace, module in (("courses", courses_urls), ("users", users_urls)):
+        names.update(f"{namespace}:{pattern.name}" for pattern in module.urlpatterns if pattern.name)
+    return names
+
+
+def configuration():
+    """База данных и настройки кэша и проверки, с которыми сняты замеры"""
+    return {
+        "database": connection.vendor,
+        "versions_shared": versions_shared(),  # Без общих версий ETag и кэши ответов, ключей и ролей отключены
+        **{name: getattr(settings, name) for name in BASELINE_SETTINGS},
+    }
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+class Command(BaseCommand):
+    "Замер числа SQL-запросов, задержки и памяти для каждого маршрута courses и users от имени каждой роли"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--baseline", default=str(BASELINE_PATH), help="Файл с базовыми замерами")
+        parser.add_argument("--update-baseline", action="store_true", help="Сохранить замеры как базовые")
+        parser.add_argument("--repeat", type=int, default=20, help="Повторов каждого запроса")
+        parser.add_argument("--threshold", type=float, default=0.5, help="Допустимый рост p95 относительно базы")
+        parser.add_argument("--role", action="append", dest="roles", help="Роль (по умолчанию все)")
+        parser.add_argument(
+            "--endpoint", action="append", dest="endpoints", help="Имя маршрута, например courses:test-list"
+        )
+        parser.add_argument("--password", default="seed", help="Пароль пользователей seed_platform для входа")
+
+    def handle(self, *args, **options):
+        missing = sorted(url_names() - set(ENDPOINTS))
+        if missing:
+            raise CommandError(f"Нет сценариев для маршрутов: {', '.join(missing)}")
+
+        baseline_path = Path(options["baseline"])
+        baseline = {} if options["update_baseline"] else self.load_baseline(baseline_path)
+        ctx = self.build_context(options["password"])
+        roles = options["roles"] or [ADMIN, TEACHER, STUDENT]
+        names = sorted(options["endpoints"] or ENDPOINTS)
+
+        results = {}
+        for role in roles:
+            client = APIClient()
+            client.credentials(HTTP_AUTHORIZATION=f"Bearer {RoleRefreshToken.for_user(ctx[role]).access_token}")
+            for name in names:
+                key = f"{role} {name}"
+                results[key] = self.measure(client, ENDPOINTS[name], name, ctx, options["repeat"])
+                result = results[key]
+                self.stdout.write(
+                    f"{key}: {result['status']}, запросов {result['queries']}, p50 {result['p50_ms']} мс, "
+                    f"p95 {result['p95_ms']} мс, память {result['peak_kb']} КБ"
+                )
+
+        if options["update_baseline"]:
+            baseline_path.parent.mkdir(parents=True, exist_ok=True)
+            dataset = {model._meta.label: model.objects.count() for model in (User, Question, TestResult)}
+            baseline = {
+                "configuration": configuration(),
+                "dataset": dataset,
+                "repeat": options["repeat"],
+                "endpoints": results,
+            }
+            baseline_path.write_text(json.dumps(baseline, ensure_ascii=False, indent=2, sort_keys=True) + "\n")
+            self.stdout.write(self.style.SUCCESS(f"Базовые замеры сохранены в {baseline_path}"))
+            return
+
+        failures = self.compare(results, baseline, options["threshold"])
+        if failures:
+            raise CommandError("Регрессии производительности:\n" + "\n".join(failures))
+        self.stdout.write(self.style.SUCCESS(f"Проверено замеров: {len(results)}, регрессий нет"))
+
+    def load_baseline(self, path):
+        """Базовые замеры маршрутов. Замеры с другой базой данных или настройками кэша не сравниваются:
+        с отключенным кэшем почти каждый маршрут выполнял бы больше запросов"""
+        if not path.exists():
+            return {}
+        baseline = json.loads(path.read_text())
+        recorded = baseline.get("configuration", {})
+        differences = [
+            f"{name}: {recorded.get(name)} в базе, {value} сейчас"
+            for name, value in configuration().items()
+            if recorded.get(name) != value
+        ]
+        if differences:
+            raise CommandError(
+                "Базовые замеры сняты с другими настройками, запустите замер с ними или обновите базу "
+                "через --update-baseline:\n" + "\n".join(differences)
+            )
+        return baseline["endpoints"]
+
+    def build_context(self, password):
+        """Объекты заполненной базы, на которых вызываются маршруты"""
+        result = (
+            TestResult.objects.filter(answers_packed__isnull=False).select_related("test__lesson", "student").first()
+        )
+        if result is None:
+            raise CommandError("В базе нет результатов тестов, заполните ее командой seed_platform")
+        question = Question.objects.filter(test_id=result.test_id).order_by("id").first()
+        ctx = {
+            "password": password,
+            "course": result.test.lesson.course_id,
+            "lesson": result.test.lesson_id,
+            "test": result.test_id,
+            "question": question.pk,
+            "answer": Answer.objects.filter(question=question).order_by("id").values_list("id", flat=True).first(),
+            "result": result.pk,
+            "user": result.student_id,
+        }
+        for role in (ADMIN, TEACHER):
+            ctx[role] = User.objects.filter(groups__name=role).order_by("id").first()
+            if ctx[role] is None:
+                raise CommandError(f"Нет пользователей с ролью {role}")
+        # Студент - автор результата, чтобы маршруты его результатов отвечали 200
+        ctx[STUDENT] = ctx["student"] = result.student
+        ctx["refresh"] = str(RoleRefreshToken.for_user(ctx[STUDENT]))
+        answer_key = get_answer_key(result.test_id)
+        ctx["answers"] = {str(question_id): [min(ids)] for question_id, ids in answer_key.options.items() if ids}
+        return ctx
+
+    def call(self, client, endpoint, name, ctx, size):
+        """Один запрос в транзакции, которая откатывается: изменяющие маршруты не меняют базу"""
+        path = reverse(name, kwargs={"pk": ctx[endpoint.pk]} if endpoint.pk else None)
+        if endpoint.params:
+            path = f"{path}?" + "&".join(f"{key}={value}" for key, value in endpoint.params(ctx, size).items())
+        data = endpoint.data(ctx, size) if endpoint.data else None
+        queries = QueryCounter()
+        with transaction.atomic(), connection.execute_wrapper(queries):
+            started = time.perf_counter()
+            response = getattr(client, endpoint.method)(path, data, format="json")
+            elapsed = (time.perf_counter() - started) * 1000
+            transaction.set_rollback(True)
+        return response.status_code, queries.count, elapsed
+
+    def measure(self, client, endpoint, name, ctx, repeat):
+        self.call(client, endpoint, name, ctx, SCALE_SIZE)  # Прогрев кэшей
+        timings = []
+        for _ in range(repeat):
+            status, queries, elapsed = self.call(client, endpoint, name, ctx, SCALE_SIZE)
+            timings.append(elapsed)
+
+        tracemalloc.start()
+        self.call(client, endpoint, name, ctx, SCALE_SIZE)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        scales = False
+        if endpoint.scalable:
+            # Кэш ответов отключается, иначе готовая страница скрывает запросы сериализатора
+            with override_settings(RESPONSE_CACHE_TIMEOUT=0):
+                counts = [self.call(client, endpoint, name, ctx, size)[1] for size in (1, SCALE_SIZE)]
+            scales = counts[0] != counts[1]
+        return {
+            "status": status,
+            "queries": queries,
+            "scales": scales,
+            "p50_ms": round(statistics.median(timings), 2),
+            "p95_ms": round(percentile(timings, 0.95), 2),
+            "peak_kb": round(peak / 1024, 1),
+        }
+
+    def compare(self, results, baseline, threshold):
+        """Ошибки: рост числа запросов с размером ответа, больше запросов или медленнее, чем в базовых замерах"""
+        failures = []
+        for key, result in sorted(results.items()):
+            if result["scales"]:
+                failures.append(f"{key}: число запросов зависит от размера ответа")
+            previous = baseline.get(key)
+            if previous is None:
+                continue
+            if result["status"] != previous["status"]:
+                failures.append(f"{key}: статус {result['status']} вместо {previous['status']}")
+            if result["queries"] > previous["queries"]:
+                failures.append(f"{key}: запросов {result['queries']} вместо {previous['queries']}")
+            # Единичные выбросы двигают только p95, настоящая регрессия замедляет и медиану
+            if all(
+                result[field] > previous[field] * (1 + threshold)
+                and result[field] - previous[field] > LATENCY_NOISE_MS
+                for field in ("p50_ms", "p95_ms")
+            ):
+                failures.append(
+                    f"{key}: p50/p95 {result['p50_ms']}/{result['p95_ms']} мс "
+                    f"вместо {previous['p50_ms']}/{previous['p95_ms']} мс"
+                )
+        return failures
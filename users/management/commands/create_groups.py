@@ -3,6 +3,7 @@ from django.contrib.contenttypes.models import ContentType
 from django.core.management.base import BaseCommand
 
 from courses.models import Answer, Course, Lesson, Question, Test, TestResult
+from users.roles import ADMIN, STUDENT, TEACHER
 
 
 class Command(BaseCommand):
@@ -10,9 +11,9 @@ class Command(BaseCommand):
 
     def handle(self, *args, **kwargs):
         # Создаём или получаем группы
-        admin_group, _ = Group.objects.get_or_create(name="Администраторы")
-        teacher_group, _ = Group.objects.get_or_create(name="Преподаватели")
-        student_group, _ = Group.objects.get_or_create(name="Студенты")
+        admin_group, _ = Group.objects.get_or_create(name=ADMIN)
+        teacher_group, _ = Group.objects.get_or_create(name=TEACHER)
+        student_group, _ = Group.objects.get_or_create(name=STUDENT)
 
         # Получаем разрешения для моделей
         course_ct = ContentType.objects.get_for_model(Course)
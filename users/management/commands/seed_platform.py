@@ -0,0 +1,261 @@
+import datetime
+import io
+import time
+
+import numpy as np
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import Group
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count, F, Max, Min, Sum
+
+from courses.encoding import pack_ids
+from courses.grading import invalidate_answer_key
+from courses.models import Answer, Course, Lesson, Question, Test, TestResult, TestScoreBucket, TestStats
+from courses.progress import rebuild_progress
+from courses.versions import bump_version
+from users.models import User
+from users.roles import ADMIN, STUDENT, TEACHER
+
+SEED_CHUNK_SIZE = 10000  # Строк в одном bulk_create или COPY
+SEED_START = datetime.datetime(2025, 1, 1, tzinfo=datetime.timezone.utc)  # Начало периода результатов
+
+
+class Command(BaseCommand):
+    "Генерация синтетических данных платформы для нагрузочного тестирования. Одинаковый seed дает одинаковые данные"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--seed", type=int, default=0, help="Seed генератора")
+        parser.add_argument("--prefix", default="seed", help="Префикс email создаваемых пользователей")
+        parser.add_argument("--admins", type=int, default=2, help="Количество администраторов")
+        parser.add_argument("--teachers", type=int, default=20, help="Количество преподавателей")
+        parser.add_argument("--students", type=int, default=10000, help="Количество студентов")
+        parser.add_argument("--courses", type=int, default=50, help="Количество курсов")
+        parser.add_argument("--lessons", type=int, default=10, help="Уроков в курсе")
+        parser.add_argument("--tests", type=int, default=2, help="Тестов в уроке")
+        parser.add_argument("--questions", type=int, default=10, help="Вопросов в тесте")
+        parser.add_argument("--answers", type=int, default=4, help="Вариантов ответа в вопросе")
+        parser.add_argument("--results", type=int, default=1_000_000, help="Количество результатов тестов")
+        parser.add_argument("--days", type=int, default=365, help="Период, за который распределены результаты")
+        parser.add_argument("--chunk-size", type=int, default=SEED_CHUNK_SIZE, help="Строк в одной вставке")
+        parser.add_argument("--without-answers", action="store_true", help="Не сохранять выбранные ответы")
+        parser.add_argument("--no-copy", action="store_true", help="Не использовать COPY на PostgreSQL")
+        parser.add_argument(
+            "--no-rollups",
+            action="store_true",
+            help="Не пересобирать статистику тестов и прогресс студентов: результаты вставляются без сигналов, "
+            "поэтому до запуска rebuild_test_stats и rebuild_progress они останутся пустыми",
+        )
+
+    def handle(self, *args, **options):
+        if options["teachers"] < 1 or options["students"] < 1:
+            raise CommandError("Нужен хотя бы один преподаватель и один студент")
+        if User.objects.filter(email__startswith=f"{options['prefix']}-").exists():
+            raise CommandError(f"Пользователи с префиксом {options['prefix']} уже есть, укажите другой --prefix")
+
+        self.rng = np.random.default_rng(options["seed"])
+        self.chunk_size = options["chunk_size"]
+        self.started = time.perf_counter()
+
+        with transaction.atomic():
+            users = self.create_users(options)
+            tests, answer_ids, correct = self.create_content(users[TEACHER], options)
+            # bulk_create не отправляет сигналы: версии для ETag и ключи ответов сбрасываются вручную
+            for model in (Course, Lesson, Test, Question, Answer):
+                bump_version(model._meta.model_name)
+            for test_id in tests:
+                invalidate_answer_key(test_id)
+        self.create_results(users[STUDENT], tests, answer_ids, correct, options)
+
+        if options["no_rollups"]:
+            # Кэши рейтингов и анализа сбрасываются, но сами сводные таблицы не заполнены
+            for test_id in tests:
+                bump_version("test_results", test_id)
+            for course_id in Lesson.objects.filter(tests__in=tests).values_list("course_id", flat=True).distinct():
+                bump_version("course_results", course_id)
+            self.stdout.write(
+                self.style.WARNING(
+                    "Статистика тестов и прогресс студентов не пересобраны, "
+                    "выполните rebuild_test_stats и rebuild_progress"
+                )
+            )
+        else:
+            self.create_test_stats(tests)
+            self.log(f"Статистика тестов: {len(tests)}")
+            # Сбрасывает версии результатов
+            self.log(f"Прогресс: {rebuild_progress(self.chunk_size)} пар тест-студент")
+        self.stdout.write(self.style.SUCCESS(f"Готово за {time.perf_counter() - self.started:.1f} с"))
+
+    def log(self, message):
+        self.stdout.write(f"[{time.perf_counter() - self.started:7.1f} с] {message}")
+
+    def bulk_create(self, model, objects):
+        """Вставка пачками, возвращает объекты с id"""
+        for start in range(0, len(objects), self.chunk_size):
+            model.objects.bulk_create(objects[start : start + self.chunk_size])
+        return objects
+
+    def create_users(self, options):
+        """Пользователи по ролям с общим заранее вычисленным паролем (хэширование на каждого слишком медленное)"""
+        password = make_password(options["prefix"])
+        membership = User.groups.through
+        users = {}
+        for role, count in (
+            (ADMIN, options["admins"]),
+            (TEACHER, options["teachers"]),
+            (STUDENT, options["students"]),
+        ):
+            group, _ = Group.objects.get_or_create(name=role)
+            name = {ADMIN: "admin", TEACHER: "teacher", STUDENT: "student"}[role]
+            created = self.bulk_create(
+                User,
+                [
+                    User(email=f"{options['prefix']}-{name}{number}@example.com", password=password)
+                    for number in range(count)
+                ],
+            )
+            self.bulk_create(membership, [membership(user_id=user.pk, group_id=group.pk) for user in created])
+            users[role] = np.array([user.pk for user in created], dtype=np.int64)
+        self.log(f"Пользователи: {sum(len(ids) for ids in users.values())}")
+        return users
+
+    def create_content(self, teacher_ids, options):
+        """Курсы, уроки, тесты, вопросы и ответы. Возвращает id тестов, массив id ответов
+        (тест × вопрос × вариант) и номер правильного варианта (тест × вопрос)"""
+        owners = teacher_ids[self.rng.integers(0, len(teacher_ids), options["courses"])]
+        courses = self.bulk_create(
+            Course,
+            [
+                Course(name=f"Курс {number}", description=f"Описание курса {number}", owner_id=int(owner))
+                for number, owner in enumerate(owners)
+            ],
+        )
+        lessons = self.bulk_create(
+            Lesson,
+            [
+                Lesson(
+                    title=f"Урок {number}",
+                    content=f"Содержание урока {number}",
+                    course=course,
+                    owner_id=course.owner_id,
+                )
+                for course in courses
+                for number in range(options["lessons"])
+            ],
+        )
+        tests = self.bulk_create(
+            Test,
+            [
+                Test(
+                    title=f"Тест {number}",
+                    description=f"Тест урока {lesson.pk}",
+                    lesson=lesson,
+                    owner_id=lesson.owner_id,
+                )
+                for lesson in lessons
+                for number in range(options["tests"])
+            ],
+        )
+        questions = self.bulk_create(
+            Question,
+            [Question(test=test, text=f"Вопрос {number}") for test in tests for number in range(options["questions"])],
+        )
+
+        shape = (len(tests), options["questions"])
+        correct = self.rng.integers(0, options["answers"], shape)
+        answers = self.bulk_create(
+            Answer,
+            [
+                Answer(question=question, text=f"Вариант {number}", is_correct=bool(number == correct.flat[index]))
+                for index, question in enumerate(questions)
+                for number in range(options["answers"])
+            ],
+        )
+        answer_ids = np.array([answer.pk for answer in answers], dtype=np.int64).reshape(*shape, options["answers"])
+        self.log(
+            f"Курсы: {len(courses)}, уроки: {len(lessons)}, тесты: {len(tests)}, "
+            f"вопросы: {len(questions)}, ответы: {len(answers)}"
+        )
+        return [test.pk for test in tests], answer_ids, correct
+
+    def create_results(self, student_ids, test_ids, answer_ids, correct, options):
+        """Результаты генерируются векторно пачками: случайный тест, студент, выбор в каждом вопросе и время"""
+        test_ids = np.array(test_ids, dtype=np.int64)
+        question_count = answer_ids.shape[1]
+        use_copy = connection.vendor == "postgresql" and not options["no_copy"]
+        created = 0
+        while created < options["results"]:
+            size = min(self.chunk_size, options["results"] - created)
+            tests = self.rng.integers(0, len(test_ids), size)
+            students = student_ids[self.rng.integers(0, len(student_ids), size)]
+            choices = self.rng.integers(0, answer_ids.shape[2], (size, question_count))
+            scores = (choices == correct[tests]).sum(axis=1)
+            chosen = answer_ids[tests[:, None], np.arange(question_count)[None, :], choices]
+            seconds = self.rng.integers(0, options["days"] * 86400, size)
+
+            packed = [None] * size if options["without_answers"] else [pack_ids(row) for row in chosen.tolist()]
+            completed = [SEED_START + datetime.timedelta(seconds=int(offset)) for offset in seconds]
+            rows = zip(test_ids[tests].tolist(), students.tolist(), scores.tolist(), packed, completed)
+            if use_copy:
+                self.copy_results(rows)
+            else:
+                results = TestResult.objects.bulk_create(
+                    [
+                        TestResult(test_id=test_id, student_id=student_id, score=score, answers_packed=answers)
+                        for test_id, student_id, score, answers, _ in rows
+                    ]
+                )
+                # bulk_create заполняет completed_at временем вставки (auto_now_add), время записывается отдельно
+                for result, completed_at in zip(results, completed):
+                    result.completed_at = completed_at
+                TestResult.objects.bulk_update(results, ["completed_at"])
+            created += size
+            self.log(f"Результаты: {created}")
+
+    def create_test_stats(self, test_ids):
+        """Статистика новых тестов двумя запросами с группировкой по тесту, как после rebuild_test_stats"""
+        graded = TestResult.objects.filter(
+            test_id__in=test_ids, status=TestResult.STATUS_GRADED, score__isnull=False
+        ).order_by()
+        totals = {
+            row["test_id"]: row
+            for row in graded.values("test_id").annotate(
+                count=Count("id"),
+                total=Sum("score"),
+                total_squares=Sum(F("score") * F("score")),
+                min_score=Min("score"),
+                max_score=Max("score"),
+            )
+        }
+        empty = {"count": 0, "total": 0, "total_squares": 0, "min_score": None, "max_score": None}
+        self.bulk_create(
+            TestStats,
+            [
+                TestStats(
+                    test_id=test_id,
+                    **{field: totals.get(test_id, empty)[field] for field in empty},
+                )
+                for test_id in test_ids
+            ],
+        )
+        histogram = graded.values_list("test_id", "score").annotate(count=Count("id")).order_by("test_id", "score")
+        self.bulk_create(
+            TestScoreBucket,
+            [TestScoreBucket(stats_id=test_id, score=score, count=count) for test_id, score, count in histogram],
+        )
+
+    def copy_results(self, rows):
+        """Загрузка пачки результатов через COPY: в несколько раз быстрее INSERT на больших объемах"""
+        buffer = io.StringIO()
+        for test_id, student_id, score, packed, completed in rows:
+            answers = "\\N" if packed is None else "\\\\x" + packed.hex()
+            buffer.write(
+                f"{test_id}\t{student_id}\t{score}\t{TestResult.STATUS_GRADED}\t{answers}\t{completed.isoformat()}\n"
+            )
+        buffer.seek(0)
+        columns = ", ".join(
+            TestResult._meta.get_field(name).column
+            for name in ("test", "student", "score", "status", "answers_packed", "completed_at")
+        )
+        with connection.cursor() as cursor:
+            cursor.copy_expert(f"COPY {TestResult._meta.db_table} ({columns}) FROM STDIN", buffer)
@@ -0,0 +1,30 @@
+# Поиск по email в админке (icontains) выполняется как UPPER(email) LIKE '%...%'.
+# Триграммный GIN-индекс по UPPER(email) поддерживает такой поиск, если на сервере есть расширение pg_trgm
+
+import django.contrib.postgres.indexes
+import django.db.models.functions.text
+from django.db import migrations
+
+from config.trigram import AddTrigramIndexConcurrently, OptionalTrigramExtension
+
+
+class Migration(migrations.Migration):
+
+    atomic = False  # CREATE INDEX CONCURRENTLY не выполняется внутри транзакции
+
+    dependencies = [
+        ("users", "0001_initial"),
+    ]
+
+    operations = [
+        OptionalTrigramExtension(),
+        AddTrigramIndexConcurrently(
+            model_name="user",
+            index=django.contrib.postgres.indexes.GinIndex(
+                django.contrib.postgres.indexes.OpClass(
+                    django.db.models.functions.text.Upper("email"), name="gin_trgm_ops"
+                ),
+                name="users_user_email_trgm_idx",
+            ),
+        ),
+    ]
@@ -1,5 +1,7 @@
 from django.contrib.auth.models import AbstractUser
+from django.contrib.postgres.indexes import GinIndex, OpClass
 from django.db import models
+from django.db.models.functions import Upper
 
 NULLABLE = {"null": True, "blank": True}
 
@@ -21,6 +23,10 @@ class User(AbstractUser):
     class Meta:
         verbose_name = "Пользователь"
         verbose_name_plural = "Пользователи"
+        indexes = [
+            # Поиск в админке по подстроке email, создается только при наличии pg_trgm
+            GinIndex(OpClass(Upper("email"), name="gin_trgm_ops"), name="users_user_email_trgm_idx"),
+        ]
 
     def __str__(self):
         return self.email
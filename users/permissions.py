@@ -1,22 +1,54 @@
+from asgiref.sync import sync_to_async
 from rest_framework import permissions
 
+from .roles import ADMIN, STUDENT, TEACHER, ahas_role, has_role
 
-class IsAdmin(permissions.BasePermission):
-    """Доступ для администраторов"""
+
+class RolePermission(permissions.BasePermission):
+    """Доступ для пользователей с ролью role. Группы пользователя загружаются один раз за запрос"""
+
+    role = None
 
     def has_permission(self, request, view):
-        return request.user.is_authenticated and request.user.groups.filter(name="Администраторы").exists()
+        return has_role(request.user, self.role)
+
+    async def ahas_permission(self, request, view):
+        return await ahas_role(request.user, self.role)
+
+
+class IsAdmin(RolePermission):
+    """Доступ для администраторов"""
+
+    role = ADMIN
 
 
-class IsTeacher(permissions.BasePermission):
+class IsTeacher(RolePermission):
     """Доступ для преподавателей"""
 
-    def has_permission(self, request, view):
-        return request.user.is_authenticated and request.user.groups.filter(name="Преподаватели").exists()
+    role = TEACHER
 
 
-class IsStudent(permissions.BasePermission):
+class IsStudent(RolePermission):
     """Доступ для студентов"""
 
-    def has_permission(self, request, view):
-        return request.user.is_authenticated and request.user.groups.filter(name="Студенты").exists()
+    role = STUDENT
+
+
+async def ahas_permission(permission, request, view):
+    """Асинхронная проверка разрешения, в том числе составного (|, &, ~).
+    Роли загружаются без перехода в поток, разрешения без асинхронной версии выполняются в потоке"""
+    if isinstance(permission, permissions.OR):
+        return await ahas_permission(permission.op1, request, view) or await ahas_permission(
+            permission.op2, request, view
+        )
+    if isinstance(permission, permissions.AND):
+        return await ahas_permission(permission.op1, request, view) and await ahas_permission(
+            permission.op2, request, view
+        )
+    if isinstance(permission, permissions.NOT):
+        return not await ahas_permission(permission.op1, request, view)
+    if hasattr(permission, "ahas_permission"):
+        return await permission.ahas_permission(request, view)
+    if isinstance(permission, (permissions.AllowAny, permissions.IsAuthenticated)):
+        return permission.has_permission(request, view)  # Не обращаются к базе
+    return await sync_to_async(permission.has_permission)(request, view)
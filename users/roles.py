@@ -0,0 +1,75 @@
+from django.conf import settings
+from django.contrib.auth.models import Group
+from django.core.cache import cache
+from django.db import transaction
+
+# Названия групп, соответствующих ролям
+ADMIN = "Администраторы"
+TEACHER = "Преподаватели"
+STUDENT = "Студенты"
+
+
+def _cache_key(user_id):
+    return f"user_roles:{user_id}"
+
+
+def load_roles(user_id):
+    """Загрузка названий групп пользователя одним запросом (или из общего кэша, если он включен)"""
+    timeout = settings.ROLES_CACHE_TIMEOUT
+    if timeout:
+        roles = cache.get(_cache_key(user_id))
+        if roles is not None:
+            return roles
+    roles = frozenset(Group.objects.filter(user__id=user_id).values_list("name", flat=True))
+    if timeout:
+        cache.set(_cache_key(user_id), roles, timeout)
+    return roles
+
+
+async def aload_roles(user_id):
+    """Асинхронная версия load_roles"""
+    timeout = settings.ROLES_CACHE_TIMEOUT
+    if timeout:
+        roles = await cache.aget(_cache_key(user_id))
+        if roles is not None:
+            return roles
+    roles = frozenset([name async for name in Group.objects.filter(user__id=user_id).values_list("name", flat=True)])
+    if timeout:
+        await cache.aset(_cache_key(user_id), roles, timeout)
+    return roles
+
+
+def get_user_roles(user):
+    """Роли пользователя: загружаются один раз и запоминаются на объекте пользователя"""
+    if not user.is_authenticated:
+        return frozenset()
+    if not hasattr(user, "_role_names"):
+        user._role_names = load_roles(user.pk)
+    return user._role_names
+
+
+def has_role(user, role):
+    """Проверка наличия роли у пользователя"""
+    return role in get_user_roles(user)
+
+
+async def aget_user_roles(user):
+    """Асинхронная версия get_user_roles"""
+    if not user.is_authenticated:
+        return frozenset()
+    if not hasattr(user, "_role_names"):
+        user._role_names = await aload_roles(user.pk)
+    return user._role_names
+
+
+async def ahas_role(user, role):
+    """Асинхронная проверка наличия роли у пользователя"""
+    return role in await aget_user_roles(user)
+
+
+def invalidate_roles(user_ids):
+    """Сброс закэшированных ролей. Повторяем после коммита, чтобы не закэшировать незавершенные изменения"""
+    keys = [_cache_key(user_id) for user_id in user_ids]
+    if keys:
+        cache.delete_many(keys)
+        transaction.on_commit(lambda: cache.delete_many(keys))
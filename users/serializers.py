@@ -1,7 +1,10 @@
 from rest_framework.serializers import ModelSerializer
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
 
 from users.models import User
 
+from .tokens import RoleRefreshToken
+
 
 class UserSerializer(ModelSerializer):
     """Cериализатор для пользователя"""
@@ -9,3 +12,15 @@ class UserSerializer(ModelSerializer):
     class Meta:
         model = User
         fields = "__all__"
+
+
+class RoleTokenObtainPairSerializer(TokenObtainPairSerializer):
+    """Выдача пары токенов, access-токен содержит роли пользователя"""
+
+    token_class = RoleRefreshToken
+
+
+class RoleTokenRefreshSerializer(TokenRefreshSerializer):
+    """Обновление access-токена с актуальными ролями пользователя"""
+
+    token_class = RoleRefreshToken
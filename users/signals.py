@@ -0,0 +1,33 @@
+from django.contrib.auth.models import Group
+from django.db.models.signals import m2m_changed, post_save, pre_delete
+from django.dispatch import receiver
+
+from .models import User
+from .roles import invalidate_roles
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def user_groups_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """Сброс ролей при изменении групп пользователя (user.groups или group.user_set)"""
+    if reverse and action == "pre_clear":
+        # После очистки группы состав пользователей уже не получить
+        instance._cleared_user_ids = list(instance.user_set.values_list("pk", flat=True))
+        return
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+
+    if not reverse:
+        instance.__dict__.pop("_role_names", None)
+        invalidate_roles([instance.pk])
+    elif action == "post_clear":
+        invalidate_roles(instance.__dict__.pop("_cleared_user_ids", []))
+    else:
+        invalidate_roles(pk_set)
+
+
+@receiver(post_save, sender=Group)
+@receiver(pre_delete, sender=Group)
+def group_changed(sender, instance, **kwargs):
+    """Сброс ролей участников группы при ее переименовании или удалении"""
+    if not kwargs.get("created"):
+        invalidate_roles(instance.user_set.values_list("pk", flat=True))
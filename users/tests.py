@@ -1,9 +1,28 @@
+import datetime
+import io
+import json
+import tempfile
+from pathlib import Path
+from unittest.mock import patch
+
 from django.contrib.auth.models import Group
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.models import Sum
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from rest_framework import status
-from rest_framework.test import APITestCase
-from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework.test import APIRequestFactory, APITestCase
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
 
+from courses.grading import get_answer_key
+from courses.models import Course, CourseProgress, Lesson, Test, TestBestScore, TestResult, TestStats
+from users.management.commands.benchmark_endpoints import BASELINE_PATH, BASELINE_SETTINGS, ENDPOINTS, url_names
+from users.management.commands.seed_platform import SEED_START
 from users.models import User
+from users.permissions import IsAdmin, IsStudent, IsTeacher
+from users.roles import ADMIN, STUDENT, TEACHER, get_user_roles, load_roles
+from users.tokens import ROLES_CLAIM, RoleRefreshToken
 
 
 class UserTests(APITestCase):
@@ -96,3 +115,239 @@ class UserTests(APITestCase):
         response = self.client.post("/users/token/refresh/", {"refresh": str(refresh)}, format="json")
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertIn("access", response.data)
+
+    def test_login_token_contains_roles(self):
+        """Access-токен, выданный при логине, содержит роли пользователя"""
+        response = self.client.post(
+            "/users/login/", {"email": "teacher@example.com", "password": "teacherpassword"}, format="json"
+        )
+        self.assertEqual(AccessToken(response.data["access"])[ROLES_CLAIM], [TEACHER])
+
+    def test_refresh_token_updates_roles(self):
+        """Изменение ролей вступает в силу при обновлении токена"""
+        refresh = RoleRefreshToken.for_user(self.student_user)
+        self.student_user.groups.add(self.teacher_group)
+
+        response = self.client.post("/users/token/refresh/", {"refresh": str(refresh)}, format="json")
+        self.assertEqual(sorted(AccessToken(response.data["access"])[ROLES_CLAIM]), sorted([STUDENT, TEACHER]))
+
+    def test_roles_from_token_skip_group_query(self):
+        """При запросе с access-токеном роли не загружаются из базы"""
+        access = RoleRefreshToken.for_user(self.student_user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {access}")
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/courses/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse([query for query in queries if "auth_group" in query["sql"]])
+
+
+class StatelessUserTests(APITestCase):
+    def setUp(self):
+        """Создаем преподавателя с уроками и JWT-токен для него"""
+        self.teacher = User.objects.create(email="teacher@example.com", password="password123")
+        self.teacher.groups.add(Group.objects.create(name=TEACHER))
+        self.course = Course.objects.create(name="Курс", description="Описание курса", owner=self.teacher)
+        for number in range(3):
+            Lesson.objects.create(title=f"Урок {number}", content="Описание", course=self.course, owner=self.teacher)
+
+        access = RoleRefreshToken.for_user(self.teacher).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {access}")
+
+    def _count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return len(queries)
+
+    @override_settings(RESPONSE_CACHE_TIMEOUT=0)
+    def test_lesson_list_skips_user_lookup(self):
+        """Список уроков без загрузки пользователя выполняет на один запрос меньше"""
+        with override_settings(JWT_STATELESS_USER=False):
+            stateful = self._count_queries("/courses/lessons/")
+        with override_settings(JWT_STATELESS_USER=True):
+            stateless = self._count_queries("/courses/lessons/")
+        self.assertEqual(stateless, stateful - 1)
+
+    @override_settings(JWT_STATELESS_USER=True)
+    def test_stateless_user_loaded_on_create(self):
+        """При создании урока пользователь загружается и назначается владельцем"""
+        response = self.client.post(
+            "/courses/lessons/create/", {"title": "Новый урок", "content": "Описание", "course": self.course.id}
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Lesson.objects.get(pk=response.data["id"]).owner, self.teacher)
+
+
+class RolePermissionTests(TestCase):
+    def setUp(self):
+        """Создаем пользователей с разными ролями"""
+        self.factory = APIRequestFactory()
+        self.users = {}
+        for email, group_name in (
+            ("admin@example.com", ADMIN),
+            ("teacher@example.com", TEACHER),
+            ("student@example.com", STUDENT),
+        ):
+            user = User.objects.create(email=email, password="password123")
+            user.groups.add(Group.objects.create(name=group_name))
+            self.users[group_name] = user
+
+    def _request(self, user):
+        """Запрос с пользователем, загруженным из базы заново (без запомненных ролей)"""
+        request = self.factory.get("/")
+        request.user = User.objects.get(pk=user.pk)
+        return request
+
+    def test_permission_combinations_cost_one_query(self):
+        """Любая комбинация ролевых разрешений выполняет не больше одного запроса к группам"""
+        combinations = (
+            IsAdmin,
+            IsAdmin | IsTeacher,
+            IsAdmin | IsTeacher | IsStudent,
+            IsStudent & ~IsAdmin,
+        )
+        for permission_class in combinations:
+            for user in self.users.values():
+                request = self._request(user)
+                with self.assertNumQueries(1):
+                    permission_class().has_permission(request, None)
+                    IsAdmin().has_permission(request, None)
+
+    def test_roles_reset_on_group_change(self):
+        """Изменение групп пользователя сбрасывает запомненные роли"""
+        student = self.users[STUDENT]
+        self.assertEqual(get_user_roles(student), {STUDENT})
+
+        student.groups.add(Group.objects.get(name=TEACHER))
+        self.assertEqual(get_user_roles(student), {STUDENT, TEACHER})
+
+    @override_settings(ROLES_CACHE_TIMEOUT=60)
+    def test_roles_cache_invalidated_on_reverse_change(self):
+        """Общий кэш ролей сбрасывается при изменении состава группы"""
+        student = self.users[STUDENT]
+        self.assertEqual(load_roles(student.pk), {STUDENT})
+        with self.assertNumQueries(0):
+            load_roles(student.pk)
+
+        Group.objects.get(name=ADMIN).user_set.add(student)
+        self.assertEqual(load_roles(student.pk), {STUDENT, ADMIN})
+
+        Group.objects.get(name=ADMIN).user_set.clear()
+        self.assertEqual(load_roles(student.pk), {STUDENT})
+
+
+class SeedPlatformTests(TestCase):
+    """Генерация синтетических данных"""
+
+    options = {"admins": 1, "teachers": 2, "students": 5, "courses": 2, "lessons": 2, "tests": 2, "results": 120}
+
+    def seed(self, prefix, **options):
+        call_command("seed_platform", prefix=prefix, seed=7, chunk_size=50, **self.options, **options)
+        results = TestResult.objects.filter(student__email__startswith=f"{prefix}-").order_by("id")
+        return list(results.values_list("score", flat=True)), list(results)
+
+    def test_seed_is_deterministic(self):
+        first_scores, results = self.seed("first", stdout=io.StringIO())
+        second_scores, _ = self.seed("second", stdout=io.StringIO())
+
+        self.assertEqual(len(first_scores), 120)
+        self.assertEqual(first_scores, second_scores)
+        self.assertEqual(User.objects.filter(email__startswith="first-", groups__name=STUDENT).count(), 5)
+        self.assertEqual(Test.objects.filter(lesson__course__owner__email__startswith="first-").count(), 8)
+
+        # Сохраненные ответы оцениваются так же, как при генерации
+        for result in results[:10]:
+            answer_key = get_answer_key(result.test_id)
+            self.assertEqual(answer_key.score(answer_key.group(result.answer_ids)), result.score)
+        self.assertEqual(
+            TestStats.objects.filter(test__owner__email__startswith="first-").aggregate(Sum("count"))["count__sum"],
+            120,
+        )
+        students = User.objects.filter(email__startswith="first-", groups__name=STUDENT)
+        self.assertTrue(TestBestScore.objects.filter(student__in=students).exists())
+        self.assertTrue(CourseProgress.objects.filter(student__in=students).exists())
+
+        # Время прохождения берется из генерации, а не из времени вставки
+        completed = [result.completed_at for result in results]
+        self.assertGreaterEqual(min(completed), SEED_START)
+        self.assertLess(max(completed), SEED_START + datetime.timedelta(days=365))
+        self.assertGreater(len(set(completed)), 100)
+
+    def test_without_rollups(self):
+        """Без пересборки сводных таблиц сбрасываются версии результатов и выводится предупреждение"""
+        out = io.StringIO()
+        with patch("users.management.commands.seed_platform.bump_version") as bump_version:
+            self.seed("first", no_rollups=True, stdout=out)
+
+        tests = Test.objects.filter(owner__email__startswith="first-")
+        self.assertFalse(TestStats.objects.filter(test__in=tests).exists())
+        self.assertIn("rebuild_progress", out.getvalue())
+        bumped = {call.args for call in bump_version.call_args_list}
+        self.assertTrue({("test_results", test.pk) for test in tests} <= bumped)
+        courses = Course.objects.filter(owner__email__startswith="first-")
+        self.assertTrue({("course_results", course.pk) for course in courses} <= bumped)
+
+    def test_existing_prefix_is_rejected(self):
+        self.seed("first", stdout=io.StringIO())
+        with self.assertRaises(CommandError):
+            call_command("seed_platform", prefix="first", stdout=io.StringIO())
+
+
+class BenchmarkEndpointsTests(TestCase):
+    """Замер запросов и задержки маршрутов"""
+
+    options = {"admins": 1, "teachers": 1, "students": 3, "courses": 1, "lessons": 1, "tests": 1, "results": 20}
+
+    def setUp(self):
+        call_command("seed_platform", prefix="bench", stdout=io.StringIO(), **self.options)
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.baseline = Path(tmp.name) / "baseline.json"
+
+    def benchmark(self, **options):
+        options = {"baseline": str(self.baseline), "password": "bench", "repeat": 1, **options}
+        call_command("benchmark_endpoints", stdout=io.StringIO(), **options)
+
+    def test_every_url_has_scenario(self):
+        self.assertEqual(url_names() - set(ENDPOINTS), set())
+
+    def test_baseline_is_recorded_and_compared(self):
+        self.benchmark(update_baseline=True, roles=[STUDENT])
+        baseline = json.loads(self.baseline.read_text())
+        endpoints = baseline["endpoints"]
+        self.assertEqual(len(endpoints), len(ENDPOINTS))
+        self.assertEqual(endpoints[f"{STUDENT} courses:test-list"]["status"], status.HTTP_200_OK)
+        self.assertFalse(any(result["scales"] for result in endpoints.values()))
+
+        # Сравнение с только что записанной базой проходит, лишний запрос считается регрессией
+        self.benchmark(roles=[STUDENT], endpoints=["courses:test-list"])
+        endpoints[f"{STUDENT} courses:test-list"]["queries"] -= 1
+        self.baseline.write_text(json.dumps(baseline))
+        with self.assertRaisesMessage(CommandError, "courses:test-list: запросов"):
+            self.benchmark(roles=[STUDENT], endpoints=["courses:test-list"])
+
+    def test_other_configuration_is_not_compared(self):
+        """Замеры с другими настройками кэша не сравниваются с базой"""
+        self.benchmark(update_baseline=True, roles=[STUDENT], endpoints=["courses:test-list"])
+        with override_settings(RESPONSE_CACHE_TIMEOUT=0):
+            with self.assertRaisesMessage(CommandError, "RESPONSE_CACHE_TIMEOUT: 300 в базе, 0 сейчас"):
+                self.benchmark(roles=[STUDENT], endpoints=["courses:test-list"])
+
+    def test_committed_baseline(self):
+        """Сохраненная в репозитории база снята на PostgreSQL для всех маршрутов и ролей, и текущий код
+        выполняет не больше запросов с теми же статусами. Задержка на маленькой базе теста не сравнивается"""
+        baseline = json.loads(BASELINE_PATH.read_text())
+        recorded = baseline["configuration"]
+        self.assertEqual(recorded["database"], "postgresql")
+        self.assertEqual(
+            set(baseline["endpoints"]), {f"{role} {name}" for role in (ADMIN, TEACHER, STUDENT) for name in ENDPOINTS}
+        )
+        self.assertFalse(any(result["scales"] for result in baseline["endpoints"].values()))
+
+        if connection.vendor != recorded["database"]:
+            self.skipTest("Сравнение с базой выполняется только на PostgreSQL")
+        with override_settings(
+            CACHE_SINGLE_PROCESS=recorded["versions_shared"], **{name: recorded[name] for name in BASELINE_SETTINGS}
+        ):
+            self.benchmark(baseline=str(BASELINE_PATH), threshold=1e9)
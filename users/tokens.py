@@ -0,0 +1,19 @@
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .roles import load_roles
+
+ROLES_CLAIM = "roles"
+
+
+class RoleRefreshToken(RefreshToken):
+    """Refresh-токен, который выпускает access-токены с ролями пользователя.
+    Роли читаются из базы при каждом выпуске, поэтому изменения групп вступают в силу при обновлении токена"""
+
+    no_copy_claims = RefreshToken.no_copy_claims + (ROLES_CLAIM,)
+
+    @property
+    def access_token(self):
+        access = super().access_token
+        access[ROLES_CLAIM] = sorted(load_roles(self[api_settings.USER_ID_CLAIM]))
+        return access
@@ -9,7 +9,7 @@ from .serializers import UserSerializer
 class UserViewSet(ModelViewSet):
     """Получение списка всех пользователей"""
 
-    queryset = User.objects.all()
+    queryset = User.objects.prefetch_related("groups", "user_permissions")
     serializer_class = UserSerializer
 
 